@@ -0,0 +1,319 @@
+"""
+    End-to-end benchmark of App.setup/ connect/ loop for fleets of simulated PanelTrack meters.
+
+    Each fleet size runs in its own process, so memory figures are not inflated by earlier runs.
+    Reports cycle time, reads/s, publishes/s, CPU per cycle and memory as JSON.
+
+    python3 -m benchmarks.bench_app                                   # 1, 10, 100 and 1000 meters
+    python3 -m benchmarks.bench_app --meters 10 100 --mode parallel --output new.json --compare old.json
+"""
+import argparse
+from datetime import datetime, timezone
+import json
+import logging
+import os
+import platform
+import random
+import statistics
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+
+from paho.mqtt.client import MQTTMessageInfo
+from paho.mqtt.enums import MQTTErrorCode
+
+from src.app import App, instantiate_clients, instantiate_servers
+from src.client import SpoofClient
+from src.implemented_servers import PanelTrack
+from src.loader import read_yaml
+from src.modbus_mqtt import MqttClient
+from src.options import AppOptions
+from src.simulator import FaultProfile, PanelTrackMeter, SimulatedSlave, Simulator, simulate_clients
+
+DEFAULT_METERS = [1, 10, 100, 1000]
+SNAPSHOTS = 4   # distinct readings per fake meter, so consecutive cycles publish changing values
+
+
+class CountingMqttClient(MqttClient):
+    """ MqttClient counting published messages and payload bytes """
+
+    def __init__(self, options: AppOptions):
+        super().__init__(options)
+        self.publishes = 0
+        self.payload_bytes = 0
+
+    def publish(self, topic, payload=None, qos=0, retain=False, properties=None):
+        self.publishes += 1
+        self.payload_bytes += len(str(payload)) if payload is not None else 0
+        return super().publish(topic, payload, qos, retain, properties)
+
+
+class FakeMqttClient(CountingMqttClient):
+    """ In-process broker stand-in: always connected, messages are counted and dropped """
+
+    def connect(self, *args, **kwargs) -> MQTTErrorCode:
+        return MQTTErrorCode.MQTT_ERR_SUCCESS
+
+    def loop_start(self) -> MQTTErrorCode:
+        return MQTTErrorCode.MQTT_ERR_SUCCESS
+
+    def loop_stop(self) -> MQTTErrorCode:
+        return MQTTErrorCode.MQTT_ERR_SUCCESS
+
+    def is_connected(self) -> bool:
+        return True
+
+    def publish(self, topic, payload=None, qos=0, retain=False, properties=None):
+        self.publishes += 1
+        self.payload_bytes += len(str(payload)) if payload is not None else 0
+        info = MQTTMessageInfo(self.publishes)
+        info.rc = MQTTErrorCode.MQTT_ERR_SUCCESS
+        return info
+
+
+class FakeBus(SpoofClient):
+    """
+        In-process Modbus client stand-in answering instantly from pre-encoded meter readings,
+        so the benchmark measures the app rather than the transport.
+    """
+
+    def __init__(self, name: str, rng: random.Random):
+        super().__init__(name)
+        self.rng = rng
+        self._snapshots: dict[int, list[list[int]]] = {}
+        self._reads: dict[int, int] = {}
+
+    def _registers(self, slave_id: int) -> list[int]:
+        snapshots = self._snapshots.get(slave_id)
+        if snapshots is None:
+            size = max(p["addr"] + p["count"] for p in PanelTrack.register_map.values())
+            slave = SimulatedSlave(PanelTrack.register_map, PanelTrackMeter(self.rng), FaultProfile(), self.rng)
+            snapshots = self._snapshots[slave_id] = [slave.getValues(3, 0, size) for _ in range(SNAPSHOTS)]
+        reads = self._reads[slave_id] = self._reads.get(slave_id, -1) + 1
+        return snapshots[reads % SNAPSHOTS]
+
+    def read(self, address, count, slave_id, register_type):
+        registers = self._registers(slave_id)
+        return SpoofClient.SpoofResponse(registers[address - 1:address - 1 + count])
+
+    def connect(self, num_retries=2, sleep_interval=3):
+        pass
+
+    def close(self):
+        pass
+
+    def _handle_error_response(self, result):
+        pass
+
+
+def count_reads(clients: list) -> list:
+    """ Wrap the read method of every client with a counter, see total_reads() """
+    for client in clients:
+        read = client.read
+        client.reads = 0
+
+        def counted(*args, _client=client, _read=read, **kwargs):
+            _client.reads += 1
+            return _read(*args, **kwargs)
+
+        client.read = counted
+    return clients
+
+
+def total_reads(clients: list) -> int:
+    return sum(client.reads for client in clients)
+
+
+def fleet_options(base: dict, meters: int, meters_per_client: int, mode: str) -> dict:
+    """ Options of the config with its servers and clients replaced by a fleet of PanelTrack meters """
+    options = dict(base)
+    options["clients"] = []
+    options["servers"] = []
+    for i in range(meters):
+        bus, modbus_id = divmod(i, meters_per_client)
+        if modbus_id == 0:
+            options["clients"].append(
+                {"name": f"Bus{bus}", "type": "TCP", "host": "127.0.0.1", "port": 502})
+        options["servers"].append({"name": f"Meter{i}", "serialnum": f"SN{i}", "server_type": "PANELTRACK",
+                                   "connected_client": f"Bus{bus}", "modbus_id": modbus_id + 1})
+    options.update(pause_interval_seconds=0, midnight_sleep_enabled=False, polling_mode=mode)
+    return options
+
+
+def rss_mb() -> float:
+    """ Current resident set size of this process """
+    with open("/proc/self/statm") as f:
+        return int(f.read().split()[1]) * os.sysconf("SC_PAGE_SIZE") / 2**20
+
+
+def peak_rss_mb() -> float:
+    import resource
+    return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024
+
+
+def run_fleet(args, meters: int) -> dict:
+    """ Benchmark a single fleet size in this process """
+    base = read_yaml(args.config)
+    with tempfile.NamedTemporaryFile("w", suffix=".json", delete=False) as f:
+        json.dump(fleet_options(base, meters, args.meters_per_client, args.mode), f)
+    try:
+        app = App(lambda opts: [], instantiate_servers, f.name)
+    finally:
+        os.unlink(f.name)
+
+    simulator = None
+    if args.modbus == "simulator":
+        simulator = Simulator(simulate_clients(app.OPTIONS), seed=args.seed)
+        simulator.start_in_thread()
+        app.client_instantiator_callback = lambda opts: count_reads(instantiate_clients(opts))
+    else:
+        rng = random.Random(args.seed)
+        app.client_instantiator_callback = lambda opts: count_reads([FakeBus(c.name, rng) for c in opts.clients])
+
+    if args.broker:
+        host, _, port = args.broker.partition(":")
+        app.OPTIONS.mqtt_host, app.OPTIONS.mqtt_port = host, int(port or 1883)
+        app.mqtt_client_class = CountingMqttClient
+    else:
+        app.mqtt_client_class = FakeMqttClient
+
+    start = time.perf_counter()
+    app.setup()
+    app.connect()
+    startup = time.perf_counter() - start
+
+    app.loop(args.warmup)
+
+    cycles, cpu = [], []
+    reads, publishes = total_reads(app.clients), app.mqtt_client.publishes
+    for _ in range(args.cycles):
+        wall_start, cpu_start = time.perf_counter(), time.process_time()
+        app.loop(1)
+        cycles.append(time.perf_counter() - wall_start)
+        cpu.append(time.process_time() - cpu_start)
+    reads = total_reads(app.clients) - reads
+    publishes = app.mqtt_client.publishes - publishes
+    elapsed = sum(cycles)
+
+    result = {
+        "meters": meters,
+        "clients": len(app.clients),
+        "connected": len(app.servers),
+        "startup_s": startup,
+        "cycle_s": {
+            "mean": statistics.mean(cycles),
+            "median": statistics.median(cycles),
+            "min": min(cycles),
+            "max": max(cycles),
+        },
+        "cpu_s_per_cycle": statistics.mean(cpu),
+        "reads_per_cycle": reads / args.cycles,
+        "reads_per_s": reads / elapsed,
+        "publishes_per_cycle": publishes / args.cycles,
+        "publishes_per_s": publishes / elapsed,
+        "rss_mb": rss_mb(),
+        "peak_rss_mb": peak_rss_mb(),
+        "threads": threading.active_count(),
+    }
+    if simulator is not None:
+        simulator.stop_thread()
+    return result
+
+
+def metadata(args) -> dict:
+    try:
+        commit = subprocess.run(["git", "rev-parse", "--short", "HEAD"],
+                                capture_output=True, text=True, check=True).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        commit = None
+    return {
+        "timestamp": datetime.now(timezone.utc).isoformat(timespec="seconds"),
+        "commit": commit,
+        "python": platform.python_version(),
+        "platform": platform.platform(),
+        "cpus": os.cpu_count(),
+        "mode": args.mode,
+        "modbus": args.modbus,
+        "mqtt": args.broker or "fake",
+        "cycles": args.cycles,
+        "meters_per_client": args.meters_per_client,
+    }
+
+
+def compare(old: dict, new: dict, threshold: float) -> list[str]:
+    """ Fleet sizes whose cycle time or CPU per cycle grew, or publish rate dropped, by more than threshold """
+    previous = {r["meters"]: r for r in old["results"]}
+    regressions = []
+    for result in new["results"]:
+        before = previous.get(result["meters"])
+        if before is None:
+            continue
+        changes = {
+            "cycle_s": result["cycle_s"]["median"] / before["cycle_s"]["median"] - 1,
+            "cpu_s_per_cycle": result["cpu_s_per_cycle"] / before["cpu_s_per_cycle"] - 1,
+            "publishes_per_s": before["publishes_per_s"] / result["publishes_per_s"] - 1,
+        }
+        for metric, change in changes.items():
+            line = f"{result['meters']:>5} meters  {metric:<16} {change:+.1%}"
+            print(line, file=sys.stderr)
+            if change > threshold:
+                regressions.append(line)
+    return regressions
+
+
+def main(argv=None) -> int:
+    parser = argparse.ArgumentParser(prog="python3 -m benchmarks.bench_app", description=__doc__,
+                                     formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--meters", type=int, nargs="+", default=DEFAULT_METERS, help="fleet sizes to benchmark")
+    parser.add_argument("--meters-per-client", type=int, default=32, help="meters sharing one client (bus)")
+    parser.add_argument("--mode", choices=["sequential", "parallel"], default="sequential", help="polling_mode")
+    parser.add_argument("--modbus", choices=["fake", "simulator"], default="fake",
+                        help="in-process fake client, or the Modbus TCP simulator")
+    parser.add_argument("--broker", metavar="HOST[:PORT]", help="publish to this broker instead of an in-process fake")
+    parser.add_argument("--cycles", type=int, default=5, help="measured polling cycles per fleet size")
+    parser.add_argument("--warmup", type=int, default=1, help="unmeasured polling cycles before measuring")
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--config", default="config.yaml", help="config providing every option but the fleet")
+    parser.add_argument("--output", help="write the JSON results to this file as well as stdout")
+    parser.add_argument("--compare", metavar="JSON", help="earlier results to compare against")
+    parser.add_argument("--threshold", type=float, default=0.2,
+                        help="relative slowdown reported as a regression by --compare, exit code 1")
+    parser.add_argument("--single", action="store_true", help=argparse.SUPPRESS)  # run one fleet size in this process
+    args = parser.parse_args(argv)
+
+    logging.getLogger().setLevel(logging.WARNING)
+
+    if args.single:
+        print(json.dumps(run_fleet(args, args.meters[0])))
+        return 0
+
+    results = []
+    forwarded = list(argv if argv is not None else sys.argv[1:])
+    for meters in args.meters:
+        print(f"Benchmarking {meters} meters", file=sys.stderr)
+        out = subprocess.run([sys.executable, "-m", "benchmarks.bench_app", *forwarded, "--single",
+                              "--meters", str(meters)], capture_output=True, text=True)
+        if out.returncode != 0:
+            print(out.stderr, file=sys.stderr)
+            raise RuntimeError(f"Benchmark of {meters} meters failed")
+        results.append(json.loads(out.stdout.strip().splitlines()[-1]))
+
+    report = {"meta": metadata(args), "results": results}
+    print(json.dumps(report, indent=2))
+    if args.output:
+        with open(args.output, "w") as f:
+            json.dump(report, f, indent=2)
+
+    if args.compare:
+        with open(args.compare) as f:
+            regressions = compare(json.load(f), report, args.threshold)
+        if regressions:
+            print("Regressions:\n" + "\n".join(regressions), file=sys.stderr)
+            return 1
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,72 @@
+from collections import deque
+from dataclasses import dataclass
+import math
+
+from .options import AppOptions
+
+
+@dataclass
+class TimeoutPolicy:
+    """ How request timeouts and retries are derived from observed round-trip times """
+    multiplier: float = 3       # timeout = p99 RTT * multiplier, clamped to [floor, ceiling]
+    floor: float = 0.2
+    ceiling: float = 3
+    retries: int = 3            # retries while the device responds; reduced by each consecutive timeout
+    window: int = 200           # RTT samples kept per device
+    min_samples: int = 20       # use the ceiling until this many samples were seen
+
+    @classmethod
+    def from_options(cls, opts: AppOptions) -> "TimeoutPolicy | None":
+        if not opts.adaptive_timeouts:
+            return None
+        return cls(multiplier=opts.timeout_rtt_multiplier,
+                   floor=opts.timeout_min_seconds, ceiling=opts.timeout_max_seconds)
+
+
+class RttTracker:
+    """
+        Rolling round-trip time distribution of one (client, modbus_id), and the timeout and
+        retry count learned from it.
+    """
+
+    def __init__(self, policy: TimeoutPolicy):
+        self.policy = policy
+        self.samples: deque[float] = deque(maxlen=policy.window)
+        self.timeouts = 0
+        self.consecutive_timeouts = 0
+        self._sorted: list[float] | None = None
+
+    def record(self, rtt: float) -> None:
+        self.samples.append(rtt)
+        self.consecutive_timeouts = 0
+        self._sorted = None
+
+    def record_timeout(self) -> None:
+        self.timeouts += 1
+        self.consecutive_timeouts += 1
+
+    def percentile(self, q: float) -> float | None:
+        if not self.samples:
+            return None
+        if self._sorted is None:
+            self._sorted = sorted(self.samples)
+        return self._sorted[min(len(self._sorted) - 1, math.ceil(q * len(self._sorted)) - 1)]
+
+    def timeout(self) -> float:
+        if len(self.samples) < self.policy.min_samples:
+            return self.policy.ceiling
+        return min(self.policy.ceiling, max(self.policy.floor, self.percentile(0.99) * self.policy.multiplier))
+
+    def retries(self) -> int:
+        """ Fewer retries for a device that keeps timing out, so it holds up the bus for less time """
+        return max(0, self.policy.retries - self.consecutive_timeouts)
+
+    def stats(self) -> dict:
+        return {
+            "samples": len(self.samples),
+            "p50": self.percentile(0.5),
+            "p99": self.percentile(0.99),
+            "timeout": self.timeout(),
+            "retries": self.retries(),
+            "timeouts": self.timeouts,
+        }
@@ -1,5 +1,7 @@
-from time import sleep
+from time import monotonic, perf_counter, sleep, time
 from datetime import datetime, timedelta
+from concurrent.futures import ThreadPoolExecutor, wait
+from functools import partial
 import atexit
 import logging
 from queue import Queue
@@ -12,7 +14,16 @@ from .options import AppOptions
 from .client import Client
 from .implemented_servers import ServerTypes
 from .server import ReadException, Server
+from .read_planner import ReadBlock, plan_blocks
+from .scheduler import Scheduler, group_parameters
+from .sampling import SampleWindows
+from .snapshot import LastValueSnapshot
+from .history import HistoryStore, HistoryWriter
+from .circuit_breaker import CircuitBreaker, Reconnector
+from .adaptive_timeout import TimeoutPolicy
+from .metrics import METRICS, diagnostics
 from .modbus_mqtt import MqttClient, RECV_Q
+from .prometheus import MetricsServer
 from paho.mqtt.enums import MQTTErrorCode
 from paho.mqtt.client import MQTTMessage
 
@@ -45,6 +56,8 @@ def exit_handler(
 
 
 class App:
+    mqtt_client_class: type[MqttClient] = MqttClient     # replaced by an in-process fake in benchmarks
+
     def __init__(self, client_instantiator_callback, server_instantiator_callback, options_rel_path=None) -> None:
         self.OPTIONS: AppOptions
         # Read configuration
@@ -55,9 +68,31 @@ class App:
 
         self.midnight_sleep_enabled, self.minutes_wakeup_after = self.OPTIONS.midnight_sleep_enabled, self.OPTIONS.midnight_sleep_wakeup_after
         self.pause_interval = self.OPTIONS.pause_interval_seconds
+        self.polling_mode = self.OPTIONS.polling_mode
+        self.poll_executor: ThreadPoolExecutor | None = None
+        self.parameter_intervals: dict[str, float] = {
+            p.parameter: p.interval_seconds for p in self.OPTIONS.parameter_intervals}
+        self._group_blocks: dict[tuple[str, float], tuple[int, list[ReadBlock]]] = {}  # -> (quarantine generation, blocks)
+        self.sampled_parameters: list[str] = self.OPTIONS.sampled_parameters
+        self.samples = SampleWindows(self.OPTIONS.sample_buffer_size)
+        if self.sampled_parameters and self.polling_mode != "scheduled":
+            logger.warning(f"sampled_parameters require polling_mode scheduled, they are polled as usual")
         # midnight_sleep_enabled=True, minutes_wakeup_after=5
 
         self.disconnect_stack = []
+        self.breakers: dict[str, CircuitBreaker] = {}
+        self.reconnected: Queue[Server] = Queue()     # servers reconnected by the reconnector thread
+        self.reconnector: Reconnector | None = None
+        self.diagnostics_interval = self.OPTIONS.diagnostics_interval_seconds
+        self.metrics_server: MetricsServer | None = None
+        self._diagnostics_published = monotonic()
+        self.snapshot: LastValueSnapshot | None = None
+        if self.OPTIONS.warm_start:
+            self.snapshot = LastValueSnapshot(self.OPTIONS.snapshot_path)
+        self._snapshot_saved = monotonic()
+        self._stale: set[str] = set()      # servers showing values of an earlier run
+        self.history: HistoryStore | None = None      # opened on connect, see open_history
+        self.history_writer: HistoryWriter | None = None
 
         # Setup callbacks
         self.client_instantiator_callback = client_instantiator_callback
@@ -65,7 +100,9 @@ class App:
 
     def setup(self) -> None:
         self.sleep_if_midnight()
+        self.instantiate()
 
+    def instantiate(self) -> None:
         logger.info("Instantiate clients")
         self.clients = self.client_instantiator_callback(self.OPTIONS)
         logger.info(f"{len(self.clients)} clients set up")
@@ -74,37 +111,125 @@ class App:
         self.servers = self.server_instantiator_callback(
             self.OPTIONS, self.clients)
         logger.info(f"{len(self.servers)} servers set up")
+        for server in self.servers:
+            server.max_read_gap = self.OPTIONS.read_gap_tolerance
+            server.quarantine.retry_interval = self.OPTIONS.quarantine_retry_seconds
         # if len(servers) == 0: raise RuntimeError(f"No supported servers configured")
 
     def connect(self) -> None:
-        for client in self.clients:
-            client.connect()
+        """
+        Connect to the broker, then to every client (bus) and its servers, one worker per client.
+        The discovery and first values of a server are published as soon as it is ready, so an unreachable
+        gateway or device only delays the servers on its own bus.
+        """
+        self.disconnected_servers: list[Server] = []
+        self.connect_mqtt()
+        self.publish_snapshot()
+        self.open_history()
+
+        by_client = self.servers_by_client()
+        with ThreadPoolExecutor(max_workers=max(len(by_client), 1), thread_name_prefix="connect") as executor:
+            results = list(executor.map(self.connect_bus, by_client.keys(), by_client.values()))
 
         # Unavailable servers are noted for reconnect attempts later. Does not cause a crash
-        connected_servers = []
-        disconnected_servers= []
+        connected = {server for connected_servers in results for server in connected_servers}
+        self.disconnected_servers = [s for s in self.servers if s not in connected]
+        self.servers: list[Server] = [s for s in self.servers if s in connected]
+        self.note_disconnected_at_startup()
+        # servers that connected but failed their first poll
+        self.flush_disconnect_stack()
+
+        self.start_metrics_server()
+
+    def open_history(self) -> None:
+        """ Open the history database and start its writer, when enabled """
+        if not self.OPTIONS.history or self.history is not None:
+            return
+        self.history = HistoryStore(self.OPTIONS.history_path, self.OPTIONS.history_raw_retention_days,
+                                    self.OPTIONS.history_minute_retention_days,
+                                    self.OPTIONS.history_hour_retention_days)
+        self.history_writer = HistoryWriter(self.history)
+        self.history_writer.start()
+        atexit.register(self.history_writer.stop)
+
+    def publish_snapshot(self) -> None:
+        """ Publish the last values saved by an earlier run, marked stale until the server is read again """
+        if self.snapshot is None:
+            return
+        atexit.register(self.snapshot.save)
         for server in self.servers:
-            success: bool = server.connect()
-            if success:
-                connected_servers.append(server) 
-            else:
-                logger.error(f"Error Connecting to server {server.name}. Disable reading untill next loop")
-                disconnected_servers.append(server)
-        self.servers: list[Server]= connected_servers
-        self.disconnected_servers: list[Server] = disconnected_servers
-
-
+            saved = self.snapshot.values.get(server.name, {})
+            values = {name: value for name, (value, _) in saved.items() if name in server.parameters}
+            if not values:
+                continue
+            try:
+                self.mqtt_client.publish_discovery_topics(server)
+            except ValueError:
+                continue    # model only known once connected
+            self.mqtt_client.publish_state(server, values)
+            self.mqtt_client.publish_status(server, stale=True, last_read=max(ts for _, ts in saved.values()))
+            self._stale.add(server.name)
+        logger.info(f"Published last values of {len(self._stale)} servers")
+
+    def connect_bus(self, client: Client, servers: list[Server]) -> list[Server]:
+        """ Connect a client, then its servers in turn, publishing the discovery and values of each once ready. Returns the connected servers. """
+        try:
+            client.connect()
+        except ConnectionError:
+            logger.error(f"Could not connect to client {client}")
+            return []
+
+        connected = []
+        for server in servers:
+            if server.connect(connect_client=False):
+                self.mqtt_client.publish_discovery_topics(server)
+                self.poll_server(server)
+                connected.append(server)
+        return connected
+
+    def note_disconnected_at_startup(self) -> None:
+        """ Mark the servers that failed to connect unavailable, and schedule their reconnect """
+        for server in self.disconnected_servers:
+            logger.error(f"Error Connecting to server {server.name}. Disable reading untill next loop")
+            self.mqtt_client.publish_availability(False, server)
+            self.breaker_for(server).record_failure()
+
+    def start_metrics_server(self) -> None:
+        """ Serve Prometheus metrics on metrics_port, if set """
+        if not self.OPTIONS.metrics_port or self.metrics_server is not None:
+            return
+        try:
+            self.metrics_server = MetricsServer(self.OPTIONS.metrics_port, self.collect_metrics)
+        except OSError as e:
+            logger.error(f"Could not serve metrics on port {self.OPTIONS.metrics_port}: {e}")
+            return
+        self.metrics_server.start()
+
+    def collect_metrics(self) -> dict[str, dict]:
+        """ Gauges computed when metrics are scraped: availability per server, and the MQTT outbound queue """
+        up = {(("server", server.name),): 1 for server in list(self.servers)}
+        up.update({(("server", server.name),): 0 for server in list(self.disconnected_servers)})
+        return {
+            "server_up": up,
+            "mqtt_outbound_queue_depth": {(): self.mqtt_client.outbound_queue_depth()},
+            "mqtt_buffered_messages": {(): self.mqtt_client.buffered_messages()},
+            "mqtt_queue_depth": {(): self.mqtt_client.queued_messages()},
+        }
+
+    def connect_mqtt(self) -> None:
         # Setup MQTT Client
-        self.mqtt_client = MqttClient(self.OPTIONS)
-        succeed: MQTTErrorCode = self.mqtt_client.connect(
-            host=self.OPTIONS.mqtt_host, port=self.OPTIONS.mqtt_port
-        )
+        self.mqtt_client = self.mqtt_client_class(self.OPTIONS)
+        if self.mqtt_client.outbox is not None:
+            # the network thread connects, and keeps reconnecting, so a broker outage at startup is buffered too
+            self.mqtt_client.connect_async(host=self.OPTIONS.mqtt_host, port=self.OPTIONS.mqtt_port)
+            succeed = MQTTErrorCode.MQTT_ERR_SUCCESS
+        else:
+            succeed: MQTTErrorCode = self.mqtt_client.connect(
+                host=self.OPTIONS.mqtt_host, port=self.OPTIONS.mqtt_port
+            )
         if succeed.value != 0:
             logger.info(
                 f"MQTT Connection error: {succeed.name}, code {succeed.value}")
-            
-        for server in disconnected_servers:
-            self.mqtt_client.publish_availability(False, server)
 
         atexit.register(exit_handler, self.servers + self.disconnected_servers,
                         self.clients, self.mqtt_client)
@@ -118,10 +243,8 @@ class App:
         # Mark the addon (bridge) online now that the broker link is up. The
         # matching "offline" is registered as the MQTT Last Will.
         self.mqtt_client.publish_bridge_availability(True)
-
-        # Publish Discovery Topics
-        for server in self.servers:
-            self.mqtt_client.publish_discovery_topics(server)
+        if self.diagnostics_interval:
+            self.mqtt_client.publish_diagnostics_discovery([str(client) for client in self.clients])
 
     def loop(self, loop_count: int | None = None) -> None:
         # if not self.servers or not self.clients:
@@ -129,53 +252,28 @@ class App:
         #     raise ValueError(
         #         f"In loop but no app servers or clients setup up or available")
 
+        if self.polling_mode == "scheduled":
+            self.run_scheduled(loop_count)
+            return
+
         # every read_interval seconds, read the registers and publish to mqtt
         i = 0
         while True:
             self.mqtt_client.ensure_connected(self.OPTIONS.mqtt_reconnect_attempts)
 
-            for server in self.servers:
-                sleep(READ_INTERVAL)
-                try: 
-                    for register_name, details in server.parameters.items():
-                        value = server.read_registers(register_name)
-                        self.mqtt_client.publish_to_ha(
-                            register_name, value, server)
-                    logger.info(
-                        f"Published all parameter values for {server.name=}")
-                except ReadException as rerr:
-                    logger.warning(f"Device returned error code response for {server.name=}")
-                    self.disconnect_stack.append(server)
-                    continue
-                except ModbusException as e:
-                    logger.error(f"Modbus error while reading from {server.name=}: {e}")
-                    self.disconnect_stack.append(server)
-                    continue
-                except Exception as e:
-                    logger.error(f"Unexpected error reading from {server.name=}: {e}")
-                    self.disconnect_stack.append(server)
-                    continue
-
-            for disconn_server in self.disconnect_stack:
-                self.servers.remove(disconn_server)
-                self.disconnected_servers.append(disconn_server)
-                self.mqtt_client.publish_availability(False, disconn_server)
-            self.disconnect_stack = []
+            cycle_start, busy = perf_counter(), self.bus_busy_seconds()
+            if self.polling_mode == "parallel":
+                self.poll_parallel()
+            else:
+                self.poll_servers(self.servers)
+
+            self.flush_disconnect_stack()
+            self.record_cycle(perf_counter() - cycle_start, busy)
 
             # TODO: publish availability
             sleep(self.pause_interval)
 
-            # try reconnecting to disconnected servers
-            for server in reversed(self.disconnected_servers):
-                logger.info("Retrying connection to %s" % server.name)
-                success: bool = server.connect()
-                if success:
-                    logger.info("Succesfully reconnected to %s" % server.name)
-                    self.servers.append(server)
-                    self.disconnected_servers.remove(server)
-                    self.mqtt_client.publish_availability(True, server)
-                else:
-                    logger.error(f"Error Connecting to server %s. Disable reading untill next loop" % server.name)
+            self.reconnect_servers()
 
             self.sleep_if_midnight()
 
@@ -183,38 +281,277 @@ class App:
             if loop_count is not None and i >= loop_count:
                 break
 
-    def sleep_if_midnight(self) -> None:
+    def bus_busy_seconds(self) -> dict[str, float]:
+        """ Seconds each client has spent on requests so far """
+        return {str(client): METRICS.counter("modbus_busy_seconds_total", client=str(client)) for client in self.clients}
+
+    def record_cycle(self, duration: float, busy_at_start: dict[str, float]) -> None:
+        """ Record the duration of a polling cycle and the share of it each client was busy, write its readings to the history, then publish diagnostics if due """
+        METRICS.observe("cycle_seconds", duration)
+        if self.history_writer is not None:
+            self.history_writer.cycle_done()
+        if duration > 0:
+            for client, busy in self.bus_busy_seconds().items():
+                METRICS.set("bus_utilization", (busy - busy_at_start.get(client, 0)) / duration, client=client)
+        self.publish_diagnostics_if_due()
+
+    def publish_diagnostics_if_due(self) -> None:
+        METRICS.set("servers_connected", len(self.servers))
+        METRICS.set("servers_disconnected", len(self.disconnected_servers))
+        if not self.diagnostics_interval or monotonic() - self._diagnostics_published < self.diagnostics_interval:
+            return
+        self._diagnostics_published = monotonic()
+        self.mqtt_client.publish_diagnostics(diagnostics())
+
+    def breaker_for(self, server: Server) -> CircuitBreaker:
+        breaker = self.breakers.get(server.name)
+        if breaker is None:
+            breaker = self.breakers[server.name] = CircuitBreaker(
+                self.OPTIONS.reconnect_backoff_initial_seconds, self.OPTIONS.reconnect_backoff_max_seconds)
+        return breaker
+
+    def reconnect_servers(self) -> None:
         """
-        Sleeps if the current time is within 3 minutes before or 5 minutes after midnight.
-        Uses efficient sleep intervals instead of busy waiting.
+        Re-enable servers reconnected in the background since the last call.
+        Starts the reconnector thread, which probes disconnected servers as their backoff expires.
         """
-        while self.midnight_sleep_enabled:
-            current_time = datetime.now()
-            is_before_midnight = current_time.hour == 23 and current_time.minute >= 57
-            is_after_midnight = current_time.hour == 0 and current_time.minute < self.minutes_wakeup_after
+        if self.reconnector is None:
+            self.reconnector = Reconnector(lambda: self.disconnected_servers, self.breaker_for,
+                                           self.reconnected.put)
+            self.reconnector.start()
+            # registered after exit_handler, so it runs first: no probes once clients are closed
+            atexit.register(self.reconnector.stop)
 
-            if not (is_before_midnight or is_after_midnight):
-                break
+        while not self.reconnected.empty():
+            self.mark_reconnected(self.reconnected.get())
 
-            # Calculate appropriate sleep duration
-            if is_before_midnight:
-                # Calculate time until midnight
-                next_check = (current_time + timedelta(days=1)).replace(
-                    hour=0, minute=0, second=0, microsecond=0
-                )
-            else:
-                # Calculate time until 5 minutes after midnight
-                next_check = current_time.replace(
-                    hour=0, minute=self.minutes_wakeup_after, second=0, microsecond=0)
+    def run_scheduled(self, loop_count: int | None = None) -> None:
+        """
+        Poll each server at fixed rates aligned to wall-clock boundaries. Parameters listed in
+        parameter_intervals are polled at their own interval, all others every pause_interval seconds.
+        Reconnects and the midnight sleep run as a separate job every pause_interval seconds.
+        Parameters listed in sampled_parameters are read every sample_interval_seconds, and their window
+        published every pause_interval seconds, see sample_group and publish_samples.
+        """
+        self.scheduler = scheduler = Scheduler()
+        known_parameters = {name for server in self.servers + self.disconnected_servers for name in server.parameters}
+        for name in (self.parameter_intervals.keys() | set(self.sampled_parameters)) - known_parameters:
+            logger.warning(f"Parameter {name} in parameter_intervals or sampled_parameters is not defined for any server")
+
+        for server in self.servers + self.disconnected_servers:
+            sampled = [name for name in server.parameters if name in self.sampled_parameters]
+            polled = {name: p for name, p in server.parameters.items() if name not in sampled}
+            groups = group_parameters(polled, self.parameter_intervals, self.pause_interval)
+            for interval, parameter_names in groups.items():
+                scheduler.add(f"{server.name}@{interval:g}s", interval,
+                              partial(self.poll_group, server, interval, parameter_names))
+            if sampled:
+                scheduler.add(f"{server.name}@sample", self.OPTIONS.sample_interval_seconds,
+                              partial(self.sample_group, server, sampled))
+                scheduler.add(f"{server.name}@window", self.pause_interval,
+                              partial(self.publish_samples, server, sampled))
+
+        cycles = 0
+
+        def maintain():
+            nonlocal cycles
+            self.mqtt_client.ensure_connected(self.OPTIONS.mqtt_reconnect_attempts)
+            self.reconnect_servers()
+            self.publish_diagnostics_if_due()
+            if self.history_writer is not None:
+                self.history_writer.cycle_done()
+            if self.sleep_if_midnight():
+                scheduler.realign()
+            cycles += 1
+
+        scheduler.add("reconnect", self.pause_interval, maintain)
+        scheduler.run(until=lambda: loop_count is not None and cycles >= loop_count)
+
+    def poll_group(self, server: Server, interval: float, parameter_names: list[str]) -> None:
+        """ Read and publish a subset of a server's parameters. Skipped while the server is disconnected. """
+        if server not in self.servers:
+            return
+        try:
+            self.publish_values(server, self.read_group(server, interval, parameter_names))
+        except Exception as e:
+            self.handle_read_error(server, e)
+        self.flush_disconnect_stack()
+
+    def sample_group(self, server: Server, parameter_names: list[str]) -> None:
+        """ Read a server's sampled parameters into their ring buffers, without publishing """
+        if server not in self.servers:
+            return
+        try:
+            # 0 is never a poll interval, so the sampled blocks do not clash with a polled group
+            values = self.read_group(server, 0, parameter_names)
+            self.samples.record(server.name, values)
+            if self.history is not None:
+                self.history.record(server.name, values)
+        except Exception as e:
+            self.handle_read_error(server, e)
+        self.flush_disconnect_stack()
+
+    def publish_samples(self, server: Server, parameter_names: list[str]) -> None:
+        """ Publish the last sample of each sampled parameter, with min/ max/ mean/ last of the window as attributes """
+        windows = self.samples.collect(server.name, parameter_names)
+        if server not in self.servers or not windows:
+            return
+        # every sample is already in the history, see sample_group
+        self.publish_values(server, {name: stats["last"] for name, stats in windows.items()}, record_history=False)
+        self.mqtt_client.publish_attributes(server, windows)
+
+    def read_group(self, server: Server, interval: float, parameter_names: list[str]) -> dict[str, float]:
+        """ Read a subset of a server's parameters in blocks, planned once per group and quarantine generation """
+        key = (server.name, interval)
+        generation = server.quarantine.generation
+        if key not in self._group_blocks or self._group_blocks[key][0] != generation:
+            self._group_blocks[key] = (generation, plan_blocks(
+                {name: server.parameters[name] for name in parameter_names
+                 if name in server.parameters and name not in server.quarantine},
+                server.max_read_gap))
+
+        values = {}
+        for block in self._group_blocks[key][1]:
+            values.update(server.read_block(block))
+        values.update(server.retry_quarantined(parameter_names))
+        return values
+
+    def poll_server(self, server: Server) -> None:
+        """ Read all parameters of a server and publish them. Servers that fail are added to the disconnect stack. """
+        try: 
+            values = server.read_all()
+            self.publish_values(server, values)
+        except Exception as e:
+            self.handle_read_error(server, e)
+
+    def publish_values(self, server: Server, values: dict[str, float], record_history: bool = True) -> None:
+        METRICS.inc("server_polls_total", server=server.name, result="ok")
+        self.mqtt_client.publish_state(server, values)
+        if self.history is not None and record_history:
+            self.history.record(server.name, values)
+        if self.snapshot is not None:
+            self.update_snapshot(server, values)
+        logger.info(
+            f"Published all parameter values for {server.name=}")
+
+    def update_snapshot(self, server: Server, values: dict[str, float]) -> None:
+        """ Record values in the snapshot, saved every snapshot_interval_seconds, and clear the stale flag of the server """
+        now = time()
+        self.snapshot.update(server.name, values, now)
+        if server.name in self._stale:
+            self._stale.discard(server.name)
+            self.mqtt_client.publish_status(server, stale=False, last_read=now)
+        if monotonic() - self._snapshot_saved >= self.OPTIONS.snapshot_interval_seconds:
+            self._snapshot_saved = monotonic()
+            self.snapshot.save()
+
+    def handle_read_error(self, server: Server, e: Exception) -> None:
+        """ Log a failed server read and add the server to the disconnect stack """
+        if isinstance(e, ReadException):
+            logger.warning(f"Device returned error code response for {server.name=}")
+        elif isinstance(e, ModbusException):
+            logger.error(f"Modbus error while reading from {server.name=}: {e}")
+        else:
+            logger.error(f"Unexpected error reading from {server.name=}: {e}")
+        METRICS.inc("server_polls_total", server=server.name, result="error")
+        self.disconnect_stack.append(server)
+
+    def flush_disconnect_stack(self) -> None:
+        """ Move servers that failed during the last sweep to the disconnected servers, and mark them unavailable """
+        for disconn_server in dict.fromkeys(self.disconnect_stack):
+            if disconn_server not in self.servers:
+                continue
+            self.servers.remove(disconn_server)
+            self.disconnected_servers.append(disconn_server)
+            self.breaker_for(disconn_server).record_failure()
+            METRICS.inc("server_disconnects_total", server=disconn_server.name)
+            self.mqtt_client.publish_availability(False, disconn_server)
+        self.disconnect_stack = []
+
+    def mark_reconnected(self, server: Server) -> None:
+        logger.info("Succesfully reconnected to %s" % server.name)
+        # registers may differ per model, so re-plan the scheduled groups
+        for key in [k for k in self._group_blocks if k[0] == server.name]:
+            del self._group_blocks[key]
+        self.servers.append(server)
+        self.disconnected_servers.remove(server)
+        METRICS.inc("server_reconnects_total", server=server.name)
+        self.mqtt_client.build_topics(server)
+        self.mqtt_client.publish_availability(True, server)
+
+    def poll_servers(self, servers: list[Server]) -> None:
+        for server in servers:
+            sleep(READ_INTERVAL)
+            self.poll_server(server)
+
+    def servers_by_client(self) -> dict[Client, list[Server]]:
+        """ Group the connected servers by the client (bus) they are connected to """
+        grouped: dict[Client, list[Server]] = {}
+        for server in self.servers:
+            grouped.setdefault(server.connected_client, []).append(server)
+        return grouped
+
+    def poll_parallel(self) -> None:
+        """
+        Poll each client's servers in its own worker thread. Servers on the same
+        client are polled one after another, so the sweep takes as long as the slowest bus.
+        """
+        if self.poll_executor is None:
+            self.poll_executor = ThreadPoolExecutor(
+                max_workers=max(len(self.clients), 1), thread_name_prefix="poll")
+
+        futures = [self.poll_executor.submit(self.poll_servers, servers)
+                   for servers in self.servers_by_client().values()]
+        wait(futures)
+        for future in futures:
+            if future.exception() is not None:
+                logger.error(f"Polling worker failed: {future.exception()}")
+
+    def sleep_if_midnight(self) -> bool:
+        """
+        Sleeps if the current time is within 3 minutes before or 5 minutes after midnight.
+        Uses efficient sleep intervals instead of busy waiting.
 
-            # Sleep until next check, but no longer than 30 seconds at a time
-            sleep_duration = min(
-                30, (next_check - current_time).total_seconds())
+        Returns True if it slept.
+        """
+        slept = False
+        while (sleep_duration := self.midnight_sleep_duration()) > 0:
             sleep(sleep_duration)
+            slept = True
+        return slept
+
+    def midnight_sleep_duration(self) -> float:
+        """
+        Seconds to sleep before checking the midnight window again. 0 outside the window.
+        """
+        if not self.midnight_sleep_enabled:
+            return 0
+
+        current_time = datetime.now()
+        is_before_midnight = current_time.hour == 23 and current_time.minute >= 57
+        is_after_midnight = current_time.hour == 0 and current_time.minute < self.minutes_wakeup_after
+
+        if not (is_before_midnight or is_after_midnight):
+            return 0
+
+        # Calculate appropriate sleep duration
+        if is_before_midnight:
+            # Calculate time until midnight
+            next_check = (current_time + timedelta(days=1)).replace(
+                hour=0, minute=0, second=0, microsecond=0
+            )
+        else:
+            # Calculate time until 5 minutes after midnight
+            next_check = current_time.replace(
+                hour=0, minute=self.minutes_wakeup_after, second=0, microsecond=0)
+
+        # Sleep until next check, but no longer than 30 seconds at a time
+        return min(30, (next_check - current_time).total_seconds())
 
 
 def instantiate_clients(OPTIONS: AppOptions) -> list[Client]:
-    return [Client(cl_options) for cl_options in OPTIONS.clients]
+    timeout_policy = TimeoutPolicy.from_options(OPTIONS)
+    return [Client(cl_options, timeout_policy) for cl_options in OPTIONS.clients]
 
 
 def instantiate_servers(OPTIONS: AppOptions, clients: list[Client]) -> list[Server]:
@@ -227,9 +564,17 @@ def instantiate_servers(OPTIONS: AppOptions, clients: list[Client]) -> list[Serv
 if __name__ == "__main__":
     if len(sys.argv) <= 1:  # deployed on homeassistant
         app = App(instantiate_clients, instantiate_servers)
-        app.setup()
-        app.connect()
-        app.loop()
+        if app.OPTIONS.shards > 1:
+            from .sharding import Supervisor
+            Supervisor("/data/options.json", app.OPTIONS).run()
+        elif app.polling_mode == "asyncio":
+            from .async_app import AsyncApp, instantiate_async_clients
+            import asyncio
+            asyncio.run(AsyncApp(instantiate_async_clients, instantiate_servers).run())
+        else:
+            app.setup()
+            app.connect()
+            app.loop()
     else:                   # running locally
         from .client import SpoofClient
         app = App(instantiate_clients, instantiate_servers, sys.argv[1])
@@ -247,7 +592,7 @@ if __name__ == "__main__":
 
         app.setup()
         for s in app.servers:
-            s.connect = lambda: True
+            s.connect = lambda connect_client=True: True
         app.connect()
         app.loop(2)
 
@@ -0,0 +1,230 @@
+import asyncio
+import logging
+import os
+import signal
+from time import perf_counter
+
+from pymodbus import ModbusException
+
+from .app import App
+from .adaptive_timeout import TimeoutPolicy
+from .async_client import AsyncClient
+from .metrics import METRICS
+from .options import AppOptions
+from .quarantine import ILLEGAL_DATA_ADDRESS
+from .read_planner import ReadBlock
+from .server import Server
+
+logger = logging.getLogger(__name__)
+
+
+class AsyncApp(App):
+    """
+        Acquisition engine running server reads, reconnects, midnight sleep and MQTT publishing
+        as coroutines on a single event loop. Selected with polling_mode: asyncio.
+
+        Clients are polled concurrently; servers on the same client are polled one after another.
+        Server.read_model and Server.setup_valid_registers_for_model are called synchronously,
+        so they must not read from the bus.
+    """
+
+    async def run(self, loop_count: int | None = None) -> None:
+        await self.async_sleep_if_midnight()
+        self.instantiate()
+        self._probes: set[asyncio.Task] = set()    # running reconnect probes, see start_reconnect_probes
+        try:
+            await self.async_connect()
+            await self.async_loop(loop_count)
+        finally:
+            for task in self._probes:
+                task.cancel()
+            for client in self.clients:
+                client.close()
+
+    async def async_connect(self) -> None:
+        """ Connect to the broker, then to all clients concurrently, publishing discovery as each server is ready """
+        self.disconnected_servers: list[Server] = []
+        await asyncio.to_thread(self.connect_mqtt)
+        self.publish_snapshot()
+        self.open_history()
+
+        # Unavailable servers are noted for reconnect attempts later. Does not cause a crash
+        by_client = self.servers_by_client()
+        results = await asyncio.gather(*(self.connect_servers(servers) for servers in by_client.values()))
+        connected = {server for connected_servers in results for server in connected_servers}
+        self.disconnected_servers = [s for s in self.servers if s not in connected]
+        self.servers: list[Server] = [s for s in self.servers if s in connected]
+        self.note_disconnected_at_startup()
+        # servers that connected but failed their first poll
+        self.flush_disconnect_stack()
+
+        self.start_metrics_server()
+
+    async def connect_servers(self, servers: list[Server]) -> list[Server]:
+        """ Connect the servers of one client in turn, publishing the discovery and values of each once ready """
+        connected = []
+        for server in servers:
+            if await self.connect_server(server):
+                self.mqtt_client.publish_discovery_topics(server)
+                await self.poll_server_async(server)
+                connected.append(server)
+        return connected
+
+    async def connect_server(self, server: Server) -> bool:
+        logger.debug(f"Connecting to server {server}")
+        client: AsyncClient = server.connected_client   # type: ignore
+        if not client.connected:
+            try:
+                await client.connect()
+            except ConnectionError:
+                logger.error(f"Could not connect to the modbus client while attempting server connection")
+                return False
+
+        if not await self.is_available(server):
+            logger.error(f"Server {server.name} not available")
+            return False
+
+        server.initialise()
+        return True
+
+    async def is_available(self, server: Server) -> bool:
+        """ Contacts the server's availability register and returns true if the server responds """
+        logger.info(f"Verifying availability of server {server.name}")
+        param = server.parameters[server.availability_register]
+        try:
+            response = await server.connected_client.read(
+                param["addr"], param["count"], server.modbus_id, param["register_type"])
+        except (ModbusException, OSError) as e:
+            logger.error(f"{e}")
+            return False
+
+        if response.isError():
+            server.connected_client._handle_error_response(response)
+            return False
+        return True
+
+    async def async_loop(self, loop_count: int | None = None) -> None:
+        i = 0
+        while True:
+            await self.async_ensure_mqtt_connected()
+
+            cycle_start, busy = perf_counter(), self.bus_busy_seconds()
+            await asyncio.gather(*(self.poll_servers_async(servers)
+                                   for servers in self.servers_by_client().values()))
+            self.flush_disconnect_stack()
+            self.record_cycle(perf_counter() - cycle_start, busy)
+
+            await asyncio.sleep(self.pause_interval)
+
+            self.start_reconnect_probes()
+
+            await self.async_sleep_if_midnight()
+
+            i += 1
+            if loop_count is not None and i >= loop_count:
+                break
+
+    def start_reconnect_probes(self) -> None:
+        """ Probe each disconnected server whose backoff expired, in the background of the polling loop """
+        for server in self.disconnected_servers:
+            breaker = self.breaker_for(server)
+            if breaker.probe_due():
+                breaker.start_probe()
+                task = asyncio.create_task(self.probe_server(server))
+                self._probes.add(task)
+                task.add_done_callback(self._probes.discard)
+
+    async def probe_server(self, server: Server) -> None:
+        breaker = self.breaker_for(server)
+        logger.info(f"Retrying connection to {server.name}, attempt {breaker.failures}")
+        if await self.connect_server(server):
+            breaker.record_success()
+            self.mark_reconnected(server)
+        else:
+            breaker.record_failure()
+            logger.error(f"Error Connecting to server {server.name}. Next attempt in {breaker.backoff:.0f}s")
+
+    async def poll_servers_async(self, servers: list[Server]) -> None:
+        for server in servers:
+            await self.poll_server_async(server)
+
+    async def poll_server_async(self, server: Server) -> None:
+        """ Read all parameter blocks of a server and publish them. Servers that fail are added to the disconnect stack. """
+        try:
+            if not server.read_blocks or server._planned_generation != server.quarantine.generation:
+                server.plan_reads()
+
+            values = {}
+            for block in server.read_blocks:
+                values.update(await self.read_block_async(server, block))
+            values.update(await self.retry_quarantined_async(server))
+
+            await self.async_publish_values(server, values)
+        except asyncio.CancelledError:
+            raise
+        except Exception as e:
+            self.handle_read_error(server, e)
+
+    async def read_block_async(self, server: Server, block: ReadBlock) -> dict[str, float]:
+        """ Awaitable Server.read_block: bisects blocks rejected with Illegal Data Address """
+        start = perf_counter()
+        result = await server.connected_client.read(
+            block.address, block.count, server.modbus_id, block.register_type)
+        METRICS.observe("server_read_seconds", perf_counter() - start, server=server.name)
+        if result.isError():
+            error = server._read_error(
+                result, f"Error reading block at address {block.address} ({block.count} registers)")
+            if error.exception_code != ILLEGAL_DATA_ADDRESS:
+                raise error
+            values = {}
+            for half in server.bisect_block(block):
+                values.update(await self.read_block_async(server, half))
+            return values
+        return server.decode_block(block, result.registers)
+
+    async def retry_quarantined_async(self, server: Server) -> dict[str, float]:
+        """ Awaitable Server.retry_quarantined """
+        values = {}
+        for name in server.quarantine.due():
+            param = server.parameters[name]
+            result = await server.connected_client.read(
+                param["addr"], param["count"], server.modbus_id, param["register_type"])
+            if result.isError():
+                error = server._read_error(result, f"Error reading register {name}")
+                if error.exception_code != ILLEGAL_DATA_ADDRESS:
+                    raise error
+                server.quarantine.add(name)
+                continue
+            logger.info(f"Server {server.name} answered quarantined parameter {name}")
+            server.quarantine.release(name)
+            values[name] = server._decode_parameter(name, result.registers)
+        return values
+
+    async def async_publish_values(self, server: Server, values: dict[str, float]) -> None:
+        # paho only queues the messages here; its network loop thread does the sending
+        self.publish_values(server, values)
+        await asyncio.sleep(0)
+
+    async def async_ensure_mqtt_connected(self, retry_interval: float = 1) -> None:
+        """ Wait for the broker connection without blocking the event loop. Stops the process after the configured attempts. """
+        if self.mqtt_client.outbox is not None:
+            return
+        attempt_num = 1
+        while not self.mqtt_client.is_connected():
+            if attempt_num > self.OPTIONS.mqtt_reconnect_attempts:
+                logger.info(f"Not connected to mqtt broker after {attempt_num - 1} attempts. Kill process")
+                os.kill(os.getpid(), signal.SIGINT)
+
+            logger.info(f"Not connected to mqtt broker, sleep {retry_interval}s and retry. {attempt_num=}")
+            await asyncio.sleep(retry_interval)
+            attempt_num += 1
+
+    async def async_sleep_if_midnight(self) -> None:
+        while (sleep_duration := self.midnight_sleep_duration()) > 0:
+            await asyncio.sleep(sleep_duration)
+
+
+def instantiate_async_clients(OPTIONS: AppOptions) -> list[AsyncClient]:
+    timeout_policy = TimeoutPolicy.from_options(OPTIONS)
+    return [AsyncClient(cl_options, timeout_policy) for cl_options in OPTIONS.clients]
+
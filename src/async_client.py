@@ -0,0 +1,129 @@
+import asyncio
+import logging
+from time import perf_counter
+
+from pymodbus import ModbusException
+from pymodbus.client import AsyncModbusSerialClient, AsyncModbusTcpClient
+from pymodbus.exceptions import ModbusIOException
+from pymodbus.pdu import ModbusPDU
+
+from .adaptive_timeout import RttTracker, TimeoutPolicy
+from .client import Client
+from .enums import RegisterTypes
+from .options import ModbusRTUOptions, ModbusTCPOptions
+
+logger = logging.getLogger(__name__)
+
+REQUEST_TIMEOUT = 3     # seconds per request attempt, matches the pymodbus default
+REQUEST_RETRIES = 3     # additional attempts after a timed out request
+TIMEOUT_MARGIN = 1      # seconds pymodbus waits beyond the attempt timeout, so asyncio.wait_for in read() expires first
+
+
+class AsyncClient(Client):
+    """
+        asyncio counterpart of Client, wrapping pymodbus.client.AsyncModbusSerialClient | AsyncModbusTcpClient.
+
+        Timeouts and retries are applied per request by this class rather than by pymodbus, so a
+        request can be cancelled without blocking the event loop or other clients.
+    """
+
+    def __init__(self, cl_options: ModbusTCPOptions | ModbusRTUOptions, timeout_policy: TimeoutPolicy | None = None,
+                 timeout: float = REQUEST_TIMEOUT, retries: int = REQUEST_RETRIES):
+        self.name = cl_options.name
+        self.timeout = timeout
+        self.retries = retries
+        self.timeout_policy = timeout_policy
+        self.rtt: dict[int, RttTracker] = {}
+        self.client: AsyncModbusSerialClient | AsyncModbusTcpClient
+        # serialises requests from servers sharing this bus
+        self.lock = asyncio.Lock()
+
+        if isinstance(cl_options, ModbusTCPOptions):
+            self.client = AsyncModbusTcpClient(
+                host=cl_options.host, port=cl_options.port, timeout=timeout, retries=0)
+        elif isinstance(cl_options, ModbusRTUOptions):
+            self.client = AsyncModbusSerialClient(port=cl_options.port, baudrate=cl_options.baudrate,
+                                                  bytesize=cl_options.bytesize, parity='Y' if cl_options.parity else 'N',
+                                                  stopbits=cl_options.stopbits, timeout=timeout, retries=0)
+
+    async def read(self, address, count, slave_id, register_type) -> ModbusPDU:
+        """
+        Read modbus registers, retrying timed out requests up to self.retries times.
+
+        Raises:
+            ModbusIOException: no response after all attempts
+            ModbusException: Re-raised for connection/communication failures
+        """
+        if register_type == RegisterTypes.HOLDING_REGISTER:
+            request = self.client.read_holding_registers
+        elif register_type == RegisterTypes.INPUT_REGISTER:
+            request = self.client.read_input_registers
+        else:
+            logger.info(f"unsupported register type {register_type}")
+            raise ValueError(f"unsupported register type {register_type}")
+
+        tracker = self._tracker(slave_id)
+        timeout, retries = self.timeout, self.retries
+        if tracker is not None:
+            timeout, retries = tracker.timeout(), tracker.retries()
+
+        async with self.lock:
+            self._set_request_timeout(timeout, retries)
+            first_attempt = perf_counter()
+            for attempt in range(retries + 1):
+                start = perf_counter()
+                try:
+                    result = await asyncio.wait_for(
+                        request(address=address-1, count=count, slave=slave_id), timeout)
+                except asyncio.TimeoutError:
+                    logger.warning(
+                        f"Timeout reading slave {slave_id} at address {address} on {self}, {attempt=}")
+                    continue
+                except ModbusException:
+                    self._record_failure(start, "comm")
+                    raise
+                elapsed = perf_counter() - start
+                if tracker is not None:
+                    tracker.record(elapsed)
+                self._record_read(elapsed, result)
+                return result
+
+        if tracker is not None:
+            tracker.record_timeout()
+        self._record_failure(first_attempt, "timeout")
+        raise ModbusIOException(
+            f"No response from slave {slave_id} at address {address} after {retries} retries")
+
+    def _set_request_timeout(self, timeout: float, retries: int) -> None:
+        """ Timeout of pymodbus for the next request. Retries stay with read(). Call with self.lock held. """
+        # the transaction manager holds its own copy of the client's comm_params
+        self.client.ctx.comm_params.timeout_connect = timeout + TIMEOUT_MARGIN
+
+    async def connect(self, num_retries=2, sleep_interval=3) -> None:
+        logger.info(f"Connecting to client {self}")
+
+        connected = False
+        async with self.lock:
+            for i in range(num_retries):
+                connected = await self.client.connect()
+                if connected:
+                    break
+
+                logger.info(f"Couldn't connect to {self}. Retrying")
+                await asyncio.sleep(sleep_interval)
+
+        if not connected:
+            logger.error(
+                f"Client Connection Issue after {num_retries} attempts.")
+            raise ConnectionError(f"Client {self} Connection Issue")
+
+        logger.info(f"Sucessfully connected to {self}")
+
+    def close(self):
+        # also called by the exit handler, after the event loop that owns the transport has closed
+        if self.client.connected:
+            super().close()
+
+    @property
+    def connected(self) -> bool:
+        return self.client.connected
@@ -0,0 +1,115 @@
+import logging
+import random
+import threading
+import time
+from enum import Enum
+from typing import Callable
+
+logger = logging.getLogger(__name__)
+
+
+class BreakerState(Enum):
+    CLOSED = "closed"           # healthy, polled normally
+    OPEN = "open"               # failed, waiting for the backoff to expire
+    HALF_OPEN = "half_open"     # reconnect probe in progress
+
+
+class CircuitBreaker:
+    """
+        Per-server circuit breaker with exponential backoff and jitter.
+
+        A failure opens the breaker. A reconnect probe is allowed once the backoff expires;
+        each failed probe doubles the backoff up to max_backoff. A successful probe closes the
+        breaker and resets the backoff.
+    """
+
+    def __init__(self, initial_backoff: float, max_backoff: float, jitter: float = 0.2,
+                 clock: Callable[[], float] = time.monotonic, rng: Callable[[], float] = random.random):
+        self.initial_backoff = initial_backoff
+        self.max_backoff = max_backoff
+        self.jitter = jitter
+        self.clock = clock
+        self.rng = rng
+
+        self.state = BreakerState.CLOSED
+        self.failures = 0
+        self.next_probe = 0.0
+
+    @property
+    def backoff(self) -> float:
+        """ Backoff before the next probe, without jitter """
+        if self.failures == 0:
+            return 0
+        return min(self.max_backoff, self.initial_backoff * 2 ** (self.failures - 1))
+
+    def record_failure(self) -> None:
+        self.failures += 1
+        self.state = BreakerState.OPEN
+        # spread probes of servers that failed together, e.g. behind the same gateway
+        delay = self.backoff * (1 + self.jitter * (2 * self.rng() - 1))
+        self.next_probe = self.clock() + delay
+
+    def record_success(self) -> None:
+        self.failures = 0
+        self.state = BreakerState.CLOSED
+
+    def probe_due(self) -> bool:
+        return self.state == BreakerState.OPEN and self.clock() >= self.next_probe
+
+    def start_probe(self) -> None:
+        self.state = BreakerState.HALF_OPEN
+
+
+class Reconnector(threading.Thread):
+    """
+        Background thread probing disconnected servers whose circuit breaker allows it,
+        so reconnect attempts never delay polling of healthy servers.
+    """
+
+    def __init__(self, disconnected: Callable[[], list], breaker_for: Callable[[object], CircuitBreaker],
+                 on_reconnected: Callable[[object], None], tick: float = 0.5):
+        """
+            Parameters:
+            -----------
+                - disconnected: returns the currently disconnected servers
+                - breaker_for: returns the circuit breaker of a server
+                - on_reconnected: called from this thread with each server that reconnected
+                - tick: seconds between checks for due probes
+        """
+        super().__init__(name="reconnector", daemon=True)
+        self.disconnected = disconnected
+        self.breaker_for = breaker_for
+        self.on_reconnected = on_reconnected
+        self.tick = tick
+        self._stop_event = threading.Event()
+
+    def run(self) -> None:
+        while not self._stop_event.wait(self.tick):
+            for server in list(self.disconnected()):
+                if self._stop_event.is_set():
+                    return
+                breaker = self.breaker_for(server)
+                if not breaker.probe_due():
+                    continue
+
+                breaker.start_probe()
+                logger.info(f"Retrying connection to {server.name}, attempt {breaker.failures}")
+                try:
+                    success = server.connect()
+                except Exception as e:
+                    logger.error(f"Unexpected error reconnecting to {server.name}: {e}")
+                    success = False
+
+                if success:
+                    breaker.record_success()
+                    self.on_reconnected(server)
+                else:
+                    breaker.record_failure()
+                    logger.error(
+                        f"Error Connecting to server {server.name}. Next attempt in {breaker.backoff:.0f}s")
+
+    def stop(self, timeout: float = 5) -> None:
+        """ Stop probing, waiting up to timeout for a probe in progress """
+        self._stop_event.set()
+        if self.is_alive() and threading.current_thread() is not self:
+            self.join(timeout)
@@ -3,8 +3,12 @@ from .options import ModbusTCPOptions, ModbusRTUOptions
 from pymodbus.client import ModbusSerialClient, ModbusTcpClient
 from pymodbus.pdu import ExceptionResponse, ModbusPDU
 from pymodbus import ModbusException
+from pymodbus.exceptions import ModbusIOException
+from .adaptive_timeout import RttTracker, TimeoutPolicy
+from .metrics import METRICS
 import logging
-from time import sleep
+import threading
+from time import sleep, perf_counter
 logger = logging.getLogger(__name__)
 
 
@@ -16,18 +20,21 @@ class Client:
         fan out dictionary information, and decode/ encode register values when reading/ writing/
     """
 
-    def __init__(self, cl_options: ModbusTCPOptions | ModbusRTUOptions):
+    def __init__(self, cl_options: ModbusTCPOptions | ModbusRTUOptions, timeout_policy: TimeoutPolicy | None = None):
         """
             Initialised from modbus_mqtt.loader.ClientOptions object
 
             Parameters:
             -----------
                 - cl_options: modbus_mqtt.loader.ClientOptions - options as read from config json
+                - timeout_policy: learn request timeouts and retries per modbus_id from round-trip times. pymodbus defaults if None
 
             TODO move to classmethod, to separate home-assistant dependency out
         """
         self.name = cl_options.name
         self.client: ModbusSerialClient | ModbusTcpClient
+        # serialises requests from servers sharing this bus when polled from several threads
+        self.lock = threading.RLock()
 
         if isinstance(cl_options, ModbusTCPOptions):
             self.client = ModbusTcpClient(
@@ -37,6 +44,30 @@ class Client:
                                              bytesize=cl_options.bytesize, parity='Y' if cl_options.parity else 'N',
                                              stopbits=cl_options.stopbits)
 
+        self.timeout_policy = timeout_policy
+        self.rtt: dict[int, RttTracker] = {}    # modbus_id -> round-trip times
+        self._default_timeout = self.client.comm_params.timeout_connect
+        self._default_retries = self.client.retries
+
+    def _tracker(self, slave_id: int) -> RttTracker | None:
+        if self.timeout_policy is None:
+            return None
+        tracker = self.rtt.get(slave_id)
+        if tracker is None:
+            tracker = self.rtt[slave_id] = RttTracker(self.timeout_policy)
+        return tracker
+
+    def _set_request_timeout(self, timeout: float, retries: int) -> None:
+        """ Timeout and retries for the next request. Call with self.lock held. """
+        self.client.comm_params.timeout_connect = timeout
+        self.client.retries = self.client.transaction.retries = retries
+        if isinstance(self.client, ModbusSerialClient) and self.client.socket is not None:
+            self.client.socket.timeout = timeout
+
+    def rtt_stats(self) -> dict[int, dict]:
+        """ Learned round-trip times, timeouts and retries per modbus_id """
+        return {slave_id: tracker.stats() for slave_id, tracker in self.rtt.items()}
+
     def read(self, address, count, slave_id, register_type) -> ModbusPDU:
         """
         Read modbus registers with proper error handling.
@@ -50,29 +81,63 @@ class Client:
         Raises:
             ModbusException: Re-raised for connection/communication failures
         """
+        tracker = self._tracker(slave_id)
+        start = None
         try:
-            if register_type == RegisterTypes.HOLDING_REGISTER:
-                result = self.client.read_holding_registers(address=address-1,
-                                                            count=count,
-                                                            slave=slave_id)
-            elif register_type == RegisterTypes.INPUT_REGISTER:
-                result = self.client.read_input_registers(address=address-1,
-                                                          count=count,
-                                                          slave=slave_id)
-            else:
-                logger.info(f"unsupported register type {register_type}")
-                raise ValueError(f"unsupported register type {register_type}")
+            with self.lock:
+                if tracker is not None:
+                    self._set_request_timeout(tracker.timeout(), tracker.retries())
+                start = perf_counter()
+                if register_type == RegisterTypes.HOLDING_REGISTER:
+                    result = self.client.read_holding_registers(address=address-1,
+                                                                count=count,
+                                                                slave=slave_id)
+                elif register_type == RegisterTypes.INPUT_REGISTER:
+                    result = self.client.read_input_registers(address=address-1,
+                                                              count=count,
+                                                              slave=slave_id)
+                else:
+                    logger.info(f"unsupported register type {register_type}")
+                    raise ValueError(f"unsupported register type {register_type}")
+                elapsed = perf_counter() - start
+                if tracker is not None:
+                    tracker.record(elapsed)
+            self._record_read(elapsed, result)
             return result
+        except ModbusIOException as exc:
+            if tracker is not None:
+                tracker.record_timeout()
+            self._record_failure(start, "timeout")
+            logger.error(f"No response from slave {slave_id} at address {address}: {exc}")
+            raise
         except ModbusException as exc:
+            self._record_failure(start, "comm")
             logger.error(f"ModbusException reading slave {slave_id} at address {address}: {exc}")
             raise
 
+    def _record_read(self, elapsed: float, result) -> None:
+        """ Latency, bus time and error code metrics of an answered request """
+        METRICS.observe("modbus_read_seconds", elapsed, client=self.name)
+        METRICS.inc("modbus_busy_seconds_total", elapsed, client=self.name)
+        if result.isError():
+            METRICS.inc("modbus_errors_total", client=self.name, code=getattr(result, "exception_code", "unknown"))
+
+    def _record_failure(self, start: float | None, code: str) -> None:
+        """ Bus time and error metrics of a request that got no valid response """
+        if start is not None:
+            METRICS.inc("modbus_busy_seconds_total", perf_counter() - start, client=self.name)
+        METRICS.inc("modbus_errors_total", client=self.name, code=code)
+
     def connect(self, num_retries=2, sleep_interval=3) -> None:
         logger.info(f"Connecting to client {self}")
 
         connected = False
         for i in range(num_retries):
-            connected: bool = self.client.connect()
+            # lock per attempt only, so other servers on this bus are not held up by the retry sleep
+            with self.lock:
+                if self.timeout_policy is not None:
+                    self._set_request_timeout(self._default_timeout, self._default_retries)
+                connected: bool = self.client.connect()
             if connected:
                 break
 
@@ -138,6 +203,7 @@ class SpoofClient:
 
     def __init__(self, name: str):
         self.name = name
+        self.lock = threading.RLock()
 
     def read(self, address, count, slave_id, register_type):
         logger.info(f"SPOOFING READ {slave_id=} {address=}")
@@ -0,0 +1,89 @@
+from functools import lru_cache
+import struct
+
+from .enums import DataType, WordOrder
+
+# struct format character per fixed-size data type, decoded big-endian within each 16-bit register
+STRUCT_FORMATS = {
+    DataType.U16: "H",
+    DataType.I16: "h",
+    DataType.U32: "I",
+    DataType.I32: "i",
+    DataType.U64: "Q",
+    DataType.I64: "q",
+    DataType.F32: "f",
+    DataType.F64: "d",
+}
+
+
+def registers_to_bytes(registers: list[int]) -> bytes:
+    """ Raw big-endian bytes of a list of 16-bit registers, e.g. a whole block read """
+    return struct.pack(f">{len(registers)}H", *registers)
+
+
+class Codec:
+    """
+        Decoder/ encoder for a single DataType and word order, backed by a precompiled struct.Struct.
+
+        Use get_codec() rather than instantiating directly, so codecs are shared.
+    """
+
+    def __init__(self, dtype: DataType, word_order: WordOrder = WordOrder.BIG, count: int | None = None):
+        """
+            Parameters:
+            -----------
+                - dtype: data type of the value
+                - word_order: order of the 16-bit registers of multi-register values
+                - count: number of registers. Required for UTF8, derived from the data type otherwise
+        """
+        self.dtype = dtype
+        self.word_order = word_order
+
+        if dtype == DataType.UTF8:
+            if not count:
+                raise ValueError("Register count required for UTF8 codec")
+            self.count = count
+            fmt = f"{2 * count}s"
+        else:
+            self.count = dtype.size // 2
+            if count is not None and count != self.count:
+                raise ValueError(f"{dtype} spans {self.count} registers, not {count}")
+            fmt = STRUCT_FORMATS[dtype]
+
+        self.struct = struct.Struct(">" + fmt)
+        self._words = struct.Struct(f">{self.count}H")
+        self._swap_words = word_order == WordOrder.LITTLE and self.count > 1
+
+    def _value(self, unpacked: tuple):
+        value = unpacked[0]
+        if self.dtype == DataType.UTF8:
+            return value.decode("utf-8", errors="replace").rstrip("\x00 ")
+        return value
+
+    def decode(self, registers: list[int]):
+        """ Decode a value from its registers """
+        if self._swap_words:
+            registers = registers[self.count - 1::-1]
+        return self._value(self.struct.unpack(self._words.pack(*registers[:self.count])))
+
+    def decode_from(self, buffer: bytes, offset: int = 0):
+        """ Decode a value from raw register bytes, starting at byte offset. See registers_to_bytes() """
+        if self._swap_words:
+            words = self._words.unpack_from(buffer, offset)
+            return self._value(self.struct.unpack(self._words.pack(*words[::-1])))
+        return self._value(self.struct.unpack_from(buffer, offset))
+
+    def encode(self, value) -> list[int]:
+        """ Encode a value into registers """
+        if self.dtype == DataType.UTF8:
+            value = value.encode("utf-8")
+        registers = list(self._words.unpack(self.struct.pack(value)))
+        if self._swap_words:
+            registers.reverse()
+        return registers
+
+
+@lru_cache(maxsize=None)
+def get_codec(dtype: DataType, word_order: WordOrder = WordOrder.BIG, count: int | None = None) -> Codec:
+    """ Shared codec for a data type and word order. count is only used for UTF8. """
+    return Codec(dtype, word_order, count if dtype == DataType.UTF8 else None)
@@ -0,0 +1,72 @@
+import hashlib
+import json
+import logging
+import os
+import threading
+
+logger = logging.getLogger(__name__)
+
+
+class DiscoveryCache:
+    """
+        Hash of the discovery payloads last published per device, persisted as JSON.
+
+        Discovery messages are retained by the broker, so a device whose payloads did not change
+        since the last run need not be announced again after a restart.
+    """
+
+    def __init__(self, path: str):
+        """
+            Parameters:
+            -----------
+                - path: JSON file, created on the first store. Empty to keep the cache in memory only
+        """
+        self.path = path
+        self._hashes: dict[str, str] = {}
+        self._lock = threading.Lock()     # servers are announced from one thread per client
+        if path and os.path.exists(path):
+            try:
+                with open(path) as f:
+                    self._hashes = json.load(f)
+            except (OSError, ValueError) as e:
+                logger.warning(f"Ignoring unreadable discovery cache {path}: {e}")
+
+    @staticmethod
+    def digest(payloads: list[tuple[str, str]]) -> str:
+        h = hashlib.sha256()
+        for topic, payload in payloads:
+            h.update(topic.encode())
+            h.update(b"\0")
+            h.update(payload.encode())
+            h.update(b"\0")
+        return h.hexdigest()
+
+    def __contains__(self, device: str) -> bool:
+        return device in self._hashes
+
+    def changed(self, device: str, payloads: list[tuple[str, str]]) -> bool:
+        """ Whether the payloads differ from those last stored for the device """
+        return self._hashes.get(device) != self.digest(payloads)
+
+    def store(self, device: str, payloads: list[tuple[str, str]]) -> None:
+        with self._lock:
+            self._hashes[device] = self.digest(payloads)
+            self._save()
+
+    def forget(self, device: str) -> None:
+        with self._lock:
+            if self._hashes.pop(device, None) is not None:
+                self._save()
+
+    def _save(self) -> None:
+        if not self.path:
+            return
+        try:
+            if os.path.dirname(self.path):
+                os.makedirs(os.path.dirname(self.path), exist_ok=True)
+            tmp = f"{self.path}.tmp"
+            with open(tmp, "w") as f:
+                json.dump(self._hashes, f)
+            os.replace(tmp, self.path)
+        except OSError as e:
+            logger.warning(f"Could not write discovery cache {self.path}: {e}")
@@ -41,8 +41,8 @@ class DataType(Enum):
             DataType.U32: 4,
             DataType.I32: 4,
             DataType.F32: 4,
-            DataType.F32: 4,
             DataType.U64: 8,
+            DataType.F64: 8,
             DataType.I64: 8,
             DataType.UTF8: None,
         }
@@ -77,6 +77,14 @@ class DataType(Enum):
         return ranges[self]
 
 
+class WordOrder(Enum):
+    """
+    Order of the 16-bit registers of multi-register values. Bytes within a register are always big-endian.
+    """
+    BIG = "big"         # most significant register first
+    LITTLE = "little"   # least significant register first
+
+
 # https://www.home-assistant.io/integrations/sensor#device-class
 class DeviceClass(Enum):
     DATE = "date"
@@ -1,2 +1,5 @@
+_SLUG_TABLE = str.maketrans({' ': '_', '(': None, ')': None, '/': 'OR', '&': ' ', ':': None, '.': None})
+
+
 def slugify(text):
-    return text.replace(' ', '_').replace('(', '').replace(')', '').replace('/', 'OR').replace('&', ' ').replace(':', '').replace('.', '').lower()
+    return text.translate(_SLUG_TABLE).lower()
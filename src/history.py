@@ -0,0 +1,186 @@
+import logging
+import os
+import sqlite3
+import threading
+from time import monotonic, time
+from typing import NamedTuple
+
+from .metrics import METRICS
+
+logger = logging.getLogger(__name__)
+
+MINUTE = 60
+HOUR = 3600
+RESOLUTIONS = (MINUTE, HOUR)
+
+
+class Aggregate(NamedTuple):
+    time: int           # unix time of the start of the bucket
+    min: float
+    max: float
+    mean: float
+    count: int
+
+
+class HistoryStore:
+    """
+        Local history of every reading, in SQLite (WAL), with 1-minute and 1-hour aggregates.
+
+        Readings are staged in memory by record() and written in one transaction per polling cycle by flush().
+        Each flush also merges the batch into the aggregates of its minutes and hours, so the aggregates
+        are kept up to date without reading raw rows back. Raw rows are keyed by time first: appends
+        and retention are sequential. Aggregates are keyed by server then time: query() for a meter
+        and time range is an index range lookup.
+    """
+
+    def __init__(self, path: str, raw_retention_days: float, minute_retention_days: float, hour_retention_days: float):
+        """
+            Parameters:
+            -----------
+                - path: database file, created if missing. ':memory:' for tests
+                - raw_retention_days, minute_retention_days, hour_retention_days: age after which readings,
+                  1-minute and 1-hour aggregates are deleted by expire()
+        """
+        if path != ":memory:" and os.path.dirname(path):
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+        self.retention = {0: raw_retention_days * 86400, MINUTE: minute_retention_days * 86400,
+                          HOUR: hour_retention_days * 86400}
+        self._db = sqlite3.connect(path, check_same_thread=False, isolation_level=None)
+        self._db.execute("PRAGMA journal_mode=WAL")
+        self._db.execute("PRAGMA synchronous=NORMAL")
+        self._db.execute(
+            "CREATE TABLE IF NOT EXISTS readings ("
+            "ts REAL NOT NULL, server TEXT NOT NULL, parameter TEXT NOT NULL, value REAL, "
+            "PRIMARY KEY (ts, server, parameter)) WITHOUT ROWID")
+        self._db.execute(
+            "CREATE TABLE IF NOT EXISTS rollups ("
+            "resolution INTEGER NOT NULL, server TEXT NOT NULL, bucket INTEGER NOT NULL, parameter TEXT NOT NULL, "
+            "min REAL, max REAL, sum REAL, count INTEGER, "
+            "PRIMARY KEY (resolution, server, bucket, parameter)) WITHOUT ROWID")
+        self._lock = threading.Lock()       # guards the staged readings
+        self._db_lock = threading.Lock()
+        self._pending: list[tuple[float, str, str, float]] = []
+
+    def __len__(self) -> int:
+        """ Number of readings staged but not yet written """
+        return len(self._pending)
+
+    def record(self, server_name: str, values: dict[str, float], timestamp: float | None = None) -> None:
+        """ Stage the numeric values of a read, written by the next flush """
+        timestamp = time() if timestamp is None else timestamp
+        rows = [(timestamp, server_name, name, float(value)) for name, value in values.items()
+                if isinstance(value, (int, float))]
+        with self._lock:
+            self._pending.extend(rows)
+
+    def flush(self) -> int:
+        """ Write the staged readings and merge them into the aggregates, in one transaction. Returns the number written. """
+        with self._lock:
+            rows, self._pending = self._pending, []
+        if not rows:
+            return 0
+
+        aggregates: dict[tuple[int, str, int, str], list[float]] = {}
+        for ts, server_name, name, value in rows:
+            for resolution in RESOLUTIONS:
+                key = (resolution, server_name, int(ts // resolution * resolution), name)
+                aggregate = aggregates.get(key)
+                if aggregate is None:
+                    aggregates[key] = [value, value, value, 1]
+                else:
+                    aggregate[0] = min(aggregate[0], value)
+                    aggregate[1] = max(aggregate[1], value)
+                    aggregate[2] += value
+                    aggregate[3] += 1
+
+        with self._db_lock:
+            try:
+                self._db.execute("BEGIN")
+                self._db.executemany("INSERT OR REPLACE INTO readings VALUES (?, ?, ?, ?)", rows)
+                self._db.executemany(
+                    "INSERT INTO rollups VALUES (?, ?, ?, ?, ?, ?, ?, ?) "
+                    "ON CONFLICT (resolution, server, bucket, parameter) DO UPDATE SET "
+                    "min = min(min, excluded.min), max = max(max, excluded.max), "
+                    "sum = sum + excluded.sum, count = count + excluded.count",
+                    [(*key, *aggregate) for key, aggregate in aggregates.items()])
+                self._db.execute("COMMIT")
+            except sqlite3.Error as e:
+                self._db.execute("ROLLBACK")
+                logger.error(f"Could not write {len(rows)} readings to history: {e}")
+                return 0
+        METRICS.inc("history_readings_written_total", len(rows))
+        return len(rows)
+
+    def expire(self, now: float | None = None) -> None:
+        """ Delete readings and aggregates older than their retention """
+        now = time() if now is None else now
+        with self._db_lock:
+            self._db.execute("DELETE FROM readings WHERE ts < ?", (now - self.retention[0],))
+            for resolution in RESOLUTIONS:
+                self._db.execute("DELETE FROM rollups WHERE resolution = ? AND bucket < ?",
+                                 (resolution, now - self.retention[resolution]))
+
+    def query(self, server_name: str, start: float, end: float, resolution: int | None = None,
+              parameters: list[str] | None = None) -> dict[str, list[Aggregate]]:
+        """
+            Aggregates of a server's parameters over [start, end), oldest first, read from the rollups only.
+
+            Parameters:
+            -----------
+                - resolution: 60 or 3600 seconds. Default hourly for ranges over two days, else by minute
+                - parameters: parameters to return, all if omitted
+        """
+        if resolution is None:
+            resolution = HOUR if end - start > 2 * 86400 else MINUTE
+        if resolution not in RESOLUTIONS:
+            raise ValueError(f"Unknown history resolution {resolution}, expected one of {RESOLUTIONS}")
+        with self._db_lock:
+            rows = self._db.execute(
+                "SELECT parameter, bucket, min, max, sum, count FROM rollups "
+                "WHERE resolution = ? AND server = ? AND bucket >= ? AND bucket < ? ORDER BY bucket",
+                (resolution, server_name, int(start // resolution * resolution), end)).fetchall()
+        series: dict[str, list[Aggregate]] = {}
+        for name, bucket, low, high, total, count in rows:
+            if parameters is None or name in parameters:
+                series.setdefault(name, []).append(Aggregate(bucket, low, high, total / count, count))
+        return series
+
+    def close(self) -> None:
+        with self._db_lock:
+            self._db.close()
+
+
+class HistoryWriter(threading.Thread):
+    """
+        Background thread writing the readings staged in a HistoryStore when a polling cycle ends,
+        so polling does not wait on disk, and applying retention every EXPIRE_SECONDS.
+    """
+
+    EXPIRE_SECONDS = 3600
+
+    def __init__(self, store: HistoryStore):
+        super().__init__(name="history-writer", daemon=True)
+        self.store = store
+        self._cycle_done = threading.Event()
+        self._stop_event = threading.Event()
+        self._expired = None
+
+    def cycle_done(self) -> None:
+        """ Write the readings staged so far. Call at the end of each polling cycle. """
+        self._cycle_done.set()
+
+    def run(self) -> None:
+        while not self._stop_event.is_set():
+            self._cycle_done.wait()
+            self._cycle_done.clear()
+            self.store.flush()
+            if self._expired is None or monotonic() - self._expired >= self.EXPIRE_SECONDS:
+                self._expired = monotonic()
+                self.store.expire()
+
+    def stop(self) -> None:
+        """ Stop, writing the readings still staged """
+        self._stop_event.set()
+        self._cycle_done.set()
+        self.join(timeout=5)
+        self.store.flush()
@@ -1,8 +1,8 @@
 from typing import final
 from .enums import DeviceClass, RegisterTypes, DataType
 from .server import Server
+from .codec import get_codec
 from pymodbus.client import ModbusSerialClient
-import struct
 import logging
 from enum import Enum
 
@@ -47,6 +47,8 @@ class PanelTrack(Server):
     # Source https://gith ub.com/heinrich321/voyanti-paneltrack/blob/main/paneltrack.py
     ################################################################################################################################################
 
+    availability_register = "TotalImportEnergy"
+
     def __init__(self, *args, **kwargs):
         super().__init__(*args, **kwargs)
         self._parameters = PanelTrack.register_map
@@ -73,33 +75,14 @@ class PanelTrack(Server):
             Requires self.model. Call self.read_model() first."""
         return
 
-    def is_available(self):
-        return super().is_available(register_name="TotalImportEnergy")
-
-    def _decode_f32(registers):
-        raw = struct.pack('>HH', registers[0], registers[1])
-        return struct.unpack('>f', raw)[0]
-
-    def _decode_i32(registers):
-        raw = struct.pack('>HH', registers[0], registers[1])
-        return struct.unpack('>I', raw)[0]
-
     @classmethod
     def _decoded(cls, registers, dtype):
-        if dtype == DataType.F32:
-            return cls._decode_f32(registers)
-        elif dtype == DataType.I32:
-            return cls._decode_i32(registers)
-        else:
-            raise NotImplementedError(
-                f"Data type {dtype} decoding not implemented")
+        return get_codec(dtype, count=len(registers)).decode(registers)
 
     @classmethod
-    def _encoded(cls, value):
-        """ Convert a float or integer to big-endian register.
-            Supports U16 only.
-        """
-        pass
+    def _encoded(cls, value, dtype=DataType.U16):
+        """ Convert a float or integer to big-endian registers. """
+        return get_codec(dtype).encode(value)
 
     def _validate_write_val(self, register_name: str, val):
         """ Model-specific writes might be necessary to support more models """
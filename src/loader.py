@@ -6,6 +6,7 @@ import yaml
 from cattrs import structure, unstructure, Converter
 
 from .helpers import slugify
+from .enums import DeviceClass
 from .options import *
 from .implemented_servers import ServerTypes
 
@@ -45,12 +46,25 @@ def validate_server_implemented(servers: list):
             )
 
 
+def validate_deadbands(deadbands: list[DeadbandOptions]) -> None:
+    """Validate that deadbands are keyed by a Home Assistant device class, and non-negative."""
+    valid_classes = [c.value for c in DeviceClass]
+    for deadband in deadbands:
+        if deadband.device_class not in valid_classes:
+            raise ValueError(
+                f"Deadband device class {deadband.device_class} is not a Home Assistant sensor device class")
+        if deadband.absolute < 0 or deadband.relative < 0:
+            raise ValueError(
+                f"Deadband for {deadband.device_class} must be non-negative")
+
+
 def validate_options(opts: AppOptions) -> None:
     client_names = [c.name for c in opts.clients]
     server_names = [s.name for s in opts.servers]
     validate_names(client_names)
     validate_names(server_names)
     validate_server_implemented(opts.servers)
+    validate_deadbands(opts.deadbands)
 
 
 def read_json(json_rel_path):
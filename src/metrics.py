@@ -0,0 +1,198 @@
+from array import array
+import math
+import threading
+import time
+from typing import Callable
+
+SUB_BUCKET_BITS = 5
+SUB_BUCKETS = 1 << SUB_BUCKET_BITS     # linear buckets per power of two, ~3% relative precision
+MAX_MAGNITUDE = 40                     # values up to 2**40 us (~12 days)
+BUCKETS = SUB_BUCKETS * (MAX_MAGNITUDE - SUB_BUCKET_BITS + 1)
+
+
+def _bucket(us: int) -> int:
+    """ Index of the bucket holding a value in microseconds """
+    if us < SUB_BUCKETS:
+        return us
+    shift = us.bit_length() - SUB_BUCKET_BITS - 1
+    return min(BUCKETS - 1, SUB_BUCKETS * shift + (us >> shift))
+
+
+def _bucket_bounds(i: int) -> tuple[int, int]:
+    """ [lower, upper) bounds of a bucket in microseconds """
+    if i < SUB_BUCKETS:
+        return i, i + 1
+    shift = i // SUB_BUCKETS - 1
+    mantissa = i - SUB_BUCKETS * shift
+    return mantissa << shift, (mantissa + 1) << shift
+
+
+class Histogram:
+    """
+        HDR-style latency histogram: every power of two is split into SUB_BUCKETS linear buckets,
+        so percentiles keep a fixed relative precision from microseconds to days in a fixed-size array.
+        Recording is O(1) and allocation-free.
+    """
+
+    def __init__(self):
+        self.counts = array('Q', bytes(8 * BUCKETS))
+        self.count = 0
+        self.sum = 0.0
+        self.min = math.inf
+        self.max = 0.0
+        self._lock = threading.Lock()
+
+    def record(self, seconds: float) -> None:
+        i = _bucket(max(0, int(seconds * 1e6)))
+        with self._lock:
+            self.counts[i] += 1
+            self.count += 1
+            self.sum += seconds
+            if seconds < self.min:
+                self.min = seconds
+            if seconds > self.max:
+                self.max = seconds
+
+    def percentile(self, q: float) -> float | None:
+        """ Value in seconds below which a fraction q of the recorded values fall, None if empty """
+        if not self.count:
+            return None
+        rank = max(1, math.ceil(q * self.count))
+        seen = 0
+        for i, n in enumerate(self.counts):
+            seen += n
+            if seen >= rank:
+                lower, upper = _bucket_bounds(i)
+                return min(self.max, max(self.min, (lower + upper) / 2e6))
+        return self.max
+
+    def cumulative_counts(self, bounds: list[float]) -> list[int]:
+        """ Number of values up to each bound in seconds, e.g. for Prometheus buckets. Exact to the bucket precision. """
+        result = []
+        seen = 0
+        i = 0
+        for bound in sorted(bounds):
+            limit = bound * 1e6
+            while i < BUCKETS and _bucket_bounds(i)[1] <= limit:
+                seen += self.counts[i]
+                i += 1
+            result.append(seen)
+        return result
+
+    def snapshot(self) -> dict:
+        return {
+            "count": self.count,
+            "mean": self.sum / self.count if self.count else None,
+            "min": self.min if self.count else None,
+            "max": self.max if self.count else None,
+            "p50": self.percentile(0.5),
+            "p90": self.percentile(0.9),
+            "p99": self.percentile(0.99),
+        }
+
+
+Labels = tuple[tuple[str, str], ...]
+
+
+class Metrics:
+    """
+        Registry of latency histograms, counters and gauges, each identified by a name and labels,
+        e.g. observe("modbus_read_seconds", 0.012, client="Client1").
+    """
+
+    def __init__(self, clock: Callable[[], float] = time.monotonic):
+        self.clock = clock
+        self.started = clock()
+        self.histograms: dict[tuple[str, Labels], Histogram] = {}
+        self.counters: dict[tuple[str, Labels], float] = {}
+        self.gauges: dict[tuple[str, Labels], float] = {}
+        self._lock = threading.Lock()
+
+    @staticmethod
+    def _key(name: str, labels: dict) -> tuple[str, Labels]:
+        return name, tuple(sorted((k, str(v)) for k, v in labels.items()))
+
+    def histogram(self, name: str, **labels) -> Histogram:
+        key = self._key(name, labels)
+        histogram = self.histograms.get(key)
+        if histogram is None:
+            with self._lock:
+                histogram = self.histograms.setdefault(key, Histogram())
+        return histogram
+
+    def observe(self, name: str, seconds: float, **labels) -> None:
+        self.histogram(name, **labels).record(seconds)
+
+    def inc(self, name: str, amount: float = 1, **labels) -> None:
+        key = self._key(name, labels)
+        with self._lock:
+            self.counters[key] = self.counters.get(key, 0) + amount
+
+    def counter(self, name: str, **labels) -> float:
+        return self.counters.get(self._key(name, labels), 0)
+
+    def set(self, name: str, value: float, **labels) -> None:
+        self.gauges[self._key(name, labels)] = value
+
+    def gauge(self, name: str, **labels) -> float | None:
+        return self.gauges.get(self._key(name, labels))
+
+    def series(self, kind: dict, name: str) -> dict[Labels, object]:
+        """ Every labelled series of a metric in self.histograms, self.counters or self.gauges """
+        return {labels: value for (n, labels), value in list(kind.items()) if n == name}
+
+    def reset(self) -> None:
+        with self._lock:
+            self.histograms.clear()
+            self.counters.clear()
+            self.gauges.clear()
+            self.started = self.clock()
+
+
+METRICS = Metrics()     # process-wide registry, fed by the clients, servers, MQTT client and polling loop
+
+
+def _ms(seconds: float | None) -> float | None:
+    return None if seconds is None else round(seconds * 1000, 1)
+
+
+def diagnostics(metrics: Metrics = METRICS) -> dict:
+    """
+    Summary of the metrics published as Home Assistant diagnostic sensors:
+    cycle and publish latency, read and error totals, and per client (bus) and per server read latency.
+    """
+    cycle = metrics.histogram("cycle_seconds")
+    publish = metrics.histogram("mqtt_publish_seconds")
+
+    reads = {dict(labels)["client"]: histogram
+             for labels, histogram in metrics.series(metrics.histograms, "modbus_read_seconds").items()}
+    errors: dict[str, float] = {}
+    for labels, n in metrics.series(metrics.counters, "modbus_errors_total").items():
+        client = dict(labels)["client"]
+        errors[client] = errors.get(client, 0) + n
+
+    # a bus that never answered has errors but no reads, and must still be listed
+    clients = {}
+    for client in sorted(reads.keys() | errors.keys()):
+        histogram = reads.get(client)
+        clients[client] = {
+            "read_p99_ms": _ms(histogram.percentile(0.99)) if histogram is not None else None,
+            "utilization": round(100 * (metrics.gauge("bus_utilization", client=client) or 0), 1),
+            "errors": errors.get(client, 0),
+            "reads": histogram.count if histogram is not None else 0,
+        }
+
+    servers = {dict(labels)["server"]: _ms(histogram.percentile(0.99))
+               for labels, histogram in metrics.series(metrics.histograms, "server_read_seconds").items()}
+
+    return {
+        "cycle_p50": cycle.percentile(0.5),
+        "cycle_p99": cycle.percentile(0.99),
+        "reads": sum(c["reads"] for c in clients.values()),
+        "read_errors": sum(c["errors"] for c in clients.values()),
+        "publishes": int(metrics.counter("mqtt_publishes_total")),
+        "publish_p99_ms": _ms(publish.percentile(0.99)),
+        "clients": clients,
+        "servers": servers,
+        "slowest_server": max(servers, key=lambda s: servers[s] or 0) if servers else None,
+    }
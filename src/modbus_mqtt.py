@@ -6,14 +6,51 @@ import json
 import logging
 from .loader import AppOptions
 from .helpers import slugify
+from .enums import DeviceClass
+from .publish_filter import Deadband, PublishFilter
+from .metrics import METRICS
+from .store_forward import BufferedMessage, OutboxBuffer, OutboxDrainer
+from .outbound_queue import OutboundDispatcher, OutboundQueue, QueuedMessage
+from .discovery_cache import DiscoveryCache
 
+from dataclasses import dataclass
+from datetime import datetime, timezone
+from typing import NamedTuple
 from random import getrandbits
-from time import time, sleep
+from time import time, sleep, perf_counter
 from queue import Queue
+import threading
 
 logger = logging.getLogger(__name__)
 RECV_Q: Queue = Queue()
 
+# MqttClient._publish_coalesced rewrites messages paho holds but has not sent, through paho-mqtt internals.
+# Written against paho-mqtt 2.1 (pinned in requirements.txt); without them, state messages are not coalesced by paho.
+PAHO_PENDING_EDITS = all(hasattr(mqtt, name) for name in ("_encode_payload", "mqtt_ms_queued", "mqtt_ms_publish"))
+ORIGIN = {"name": "ha-paneltrack"}     # required by device-based discovery
+
+
+class ParameterTopics(NamedTuple):
+    """ Precomputed publish details of a single server parameter """
+    state_topic: str
+    state_key: str              # key in the aggregated JSON state
+    device_class: DeviceClass
+    state_class: str | None
+    attributes_topic: str       # window aggregates of sampled parameters
+
+
+@dataclass
+class ServerTopics:
+    """ Topics and discovery payloads of a server, computed once per (re)connect and indexed by the publish loop """
+    nickname: str
+    availability_topic: str
+    aggregated_state_topic: str
+    status_topic: str                   # whether the published values are stale, see publish_status
+    parameters: dict[str, ParameterTopics]
+    discovery: list[tuple[str, str]]    # (topic, JSON payload)
+    entity_discovery_topics: list[str]  # one config topic per parameter
+    device_discovery_topic: str         # single config topic of device-based discovery
+
 
 class MqttClient(mqtt.Client):
     """
@@ -42,11 +79,58 @@ class MqttClient(mqtt.Client):
         # exit_handler never runs. Every entity depends on this topic in
         # addition to its per-device topic (availability_mode: all).
         self.bridge_availability_topic = f"{self.base_topic}/bridge/availability"
+        self.diagnostics_topic = f"{self.base_topic}/bridge/diagnostics"
         self.will_set(self.bridge_availability_topic, "offline", qos=1, retain=True)
 
+        # one JSON state message per server per read instead of one message per register
+        self.aggregate_state: bool = options.mqtt_aggregate_state
+        self._aggregated_values: dict[str, dict] = {}   # server name -> latest value per state key
+        self._topics: dict[str, ServerTopics] = {}      # server name -> cached topics, see build_topics
+        self._availability: dict[str, tuple[str, bool]] = {}   # server name -> (topic, last published availability)
+
+        # one discovery message per device with a components map, instead of one per parameter
+        self.device_discovery: bool = options.mqtt_device_discovery
+        self.discovery_cache = DiscoveryCache(options.discovery_cache_path)
+
+        # parameters sampled faster than they are published, with their window aggregates as attributes
+        self.sampled_parameters: set[str] = (
+            set(options.sampled_parameters) if options.polling_mode == "scheduled" else set())
+        # entities carry a stale flag, set while showing values persisted by an earlier run
+        self.warm_start: bool = options.warm_start
+
+        # store-and-forward: messages published while the broker is unreachable are buffered on disk
+        self.outbox: OutboxBuffer | None = None
+        self._outbox_lock = threading.Lock()     # keeps buffered and direct publishes in order
+        self._drainer: OutboxDrainer | None = None
+        if options.store_and_forward:
+            self.outbox = OutboxBuffer(options.buffer_path, options.buffer_capacity)
+            self._drainer = OutboxDrainer(self.outbox, self._send_buffered, self.is_connected,
+                                          self._outbox_lock, options.buffer_drain_rate)
+
+        # bounded queue of state messages, handed to paho while fewer than max_inflight are outstanding
+        self.outbound: OutboundQueue | None = None
+        self._dispatcher: OutboundDispatcher | None = None
+        self._unsent_state: dict[str, int] = {}     # state topic -> mid of its latest message handed to paho
+        self._edit_pending = PAHO_PENDING_EDITS and hasattr(self, "_out_messages") and hasattr(self, "_out_message_mutex")
+        if options.outbound_queue_capacity:
+            self.max_inflight = options.mqtt_max_inflight
+            self.max_inflight_messages_set(self.max_inflight)
+            self.outbound = OutboundQueue(options.outbound_queue_capacity, options.outbound_queue_policy,
+                                          coalesce=True)
+            self._dispatcher = OutboundDispatcher(self.outbound, self._send_queued, self._has_room)
+
+        self.publish_filter: PublishFilter | None = None
+        if options.change_only_publishing:
+            self.publish_filter = PublishFilter(
+                {DeviceClass(d.device_class): Deadband(d.absolute, d.relative) for d in options.deadbands},
+                options.publish_max_age_seconds)
+
         def on_connect(client, userdata, connect_flags, reason_code, properties):
             if reason_code == 0:
+                METRICS.inc("mqtt_connects_total")
                 logger.info(f"Connected to MQTT broker.")
+                # after an unclean drop the broker published the "offline" Last Will
+                self.republish_availability()
             else:
                 logger.info(
                     f"Not connected to MQTT broker.\nReturn code: {reason_code=}")
@@ -57,6 +141,9 @@ class MqttClient(mqtt.Client):
                         reason,
                         properties):
             logger.error(f"Disconnected from MQTT broker, {reason=}\n{disconnect_flags=}\n{properties=}")
+            if self.outbox is not None:
+                logger.info(f"Buffering messages until the broker is back")
+                return
             logger.info(f"Stopping all threads")
             os.kill(os.getpid(), signal.SIGINT)
 
@@ -71,9 +158,14 @@ class MqttClient(mqtt.Client):
 
 
 
+        def on_publish(client, userdata, mid, reason_code, properties):
+            if self._dispatcher is not None:
+                self._dispatcher.acknowledged()
+
         self.on_connect = on_connect
         self.on_disconnect = on_disconnect
         self.on_message = on_message
+        self.on_publish = on_publish
 
     def _availability_topic(self, server) -> str:
         """Per-device availability topic. Single source of truth for both the
@@ -91,12 +183,11 @@ class MqttClient(mqtt.Client):
             "availability_mode": "all",
         }
 
-    def publish_bridge_availability(self, avail: bool) -> None:
-        self.publish(self.bridge_availability_topic,
-                     "online" if avail else "offline", qos=1, retain=True)
+    def _aggregated_state_topic(self, server) -> str:
+        return f"{self.base_topic}/{slugify(server.name)}/state"
 
-    def publish_discovery_topics(self, server):
-        # TODO check if more separation from server is necessary/ possible
+    def build_topics(self, server) -> ServerTopics:
+        """ (Re)build the cached topics and discovery payloads of a server. Call when a server is (re)connected. """
         nickname = slugify(server.name)
         if not server.model or not server.manufacturer or not server.serial or not nickname or not server.parameters:
             logging.info(
@@ -104,7 +195,6 @@ class MqttClient(mqtt.Client):
             raise ValueError(
                 f"Server not properly configured. Cannot publish MQTT info")
 
-        logger.info(f"Publishing discovery topics for {nickname}")
         device = {
             "manufacturer": server.manufacturer,
             "model": server.model,
@@ -112,29 +202,172 @@ class MqttClient(mqtt.Client):
             "name": f"{nickname}"
             # "name": f"{server.manufacturer} {server.serialnum}"
         }
+        availability_block = self._availability_block(server)
+        aggregated_state_topic = self._aggregated_state_topic(server)
+        status_topic = f"{self.base_topic}/{nickname}/status"
 
-        # publish discovery topics for legal registers
         # assume registers in server.registers
-        parameters = server.parameters
+        parameters: dict[str, ParameterTopics] = {}
+        discovery: list[tuple[str, str]] = []
+        components: dict[str, dict] = {}
+        entity_discovery_topics: list[str] = []
+        for register_name, details in server.parameters.items():
+            slug = slugify(register_name)
+            state_topic = f"{self.base_topic}/{nickname}/{slug}/state"
+            attributes_topic = f"{self.base_topic}/{nickname}/{slug}/attributes"
+            parameters[register_name] = ParameterTopics(
+                state_topic, slug, details["device_class"], details.get("state_class"), attributes_topic)
 
-        for register_name, details in parameters.items():
-            state_topic = f"{self.base_topic}/{nickname}/{slugify(register_name)}/state"
             discovery_payload = {
                 "name": register_name,
-                "unique_id": f"{nickname}_{slugify(register_name)}",
+                "unique_id": f"{nickname}_{slug}",
                 "state_topic": state_topic,
-                "device": device,
                 "device_class": details["device_class"].value,
                 "unit_of_measurement": details["unit"],
             }
-            discovery_payload.update(self._availability_block(server))
+            if self.aggregate_state:
+                discovery_payload["state_topic"] = aggregated_state_topic
+                discovery_payload["value_template"] = f"{{{{ value_json['{slug}'] }}}}"
             state_class = details.get("state_class", False)
             if state_class:
                 discovery_payload['state_class'] = state_class
-            discovery_topic = f"{self.ha_discovery_topic}/sensor/{nickname}/{slugify(register_name)}/config"
+            if register_name in self.sampled_parameters:
+                discovery_payload["json_attributes_topic"] = attributes_topic
+            elif self.warm_start:
+                discovery_payload["json_attributes_topic"] = status_topic
+            discovery_topic = f"{self.ha_discovery_topic}/sensor/{nickname}/{slug}/config"
+            entity_discovery_topics.append(discovery_topic)
+            if self.device_discovery:
+                components[slug] = {"platform": "sensor", **discovery_payload}
+            else:
+                discovery_payload["device"] = device
+                discovery_payload.update(availability_block)
+                discovery.append((discovery_topic, json.dumps(discovery_payload)))
+
+        device_discovery_topic = f"{self.ha_discovery_topic}/device/{nickname}/config"
+        if self.device_discovery:
+            # availability is shared by all components
+            discovery.append((device_discovery_topic, json.dumps(
+                {"device": device, "origin": ORIGIN, "components": components, **availability_block})))
+
+        topics = ServerTopics(nickname, self._availability_topic(server), aggregated_state_topic, status_topic,
+                              parameters, discovery, entity_discovery_topics, device_discovery_topic)
+        self._topics[server.name] = topics
+        return topics
+
+    def topics(self, server) -> ServerTopics:
+        topics = self._topics.get(server.name)
+        if topics is None:
+            topics = self.build_topics(server)
+        return topics
+
+    def publish(self, topic, payload=None, qos=0, retain=False, properties=None):
+        if self.outbox is None:
+            return self._publish_now(topic, payload, qos, retain, properties)
+
+        with self._outbox_lock:
+            # once anything is buffered, later messages queue behind it so no topic goes back to an older value
+            if not len(self.outbox) and self.is_connected():
+                msg_info = self._publish_now(topic, payload, qos, retain, properties)
+                if not (msg_info.rc == mqtt.MQTT_ERR_NO_CONN and qos == 0):
+                    return msg_info
+            self.outbox.append(topic, payload, qos, retain)
+        METRICS.inc("mqtt_buffered_total")
+        msg_info = mqtt.MQTTMessageInfo(0)
+        msg_info.rc = mqtt.MQTT_ERR_SUCCESS
+        return msg_info
+
+    def _publish_now(self, topic, payload=None, qos=0, retain=False, properties=None) -> mqtt.MQTTMessageInfo:
+        start = perf_counter()
+        msg_info = super().publish(topic, payload, qos, retain, properties)
+        METRICS.observe("mqtt_publish_seconds", perf_counter() - start)
+        METRICS.inc("mqtt_publishes_total")
+        if msg_info.rc != mqtt.MQTT_ERR_SUCCESS:
+            METRICS.inc("mqtt_publish_errors_total", rc=msg_info.rc)
+        return msg_info
+
+    def _send_buffered(self, message: BufferedMessage) -> bool:
+        """ Forward a buffered message. True once paho holds it: sent, or queued by paho for QoS > 0 """
+        rc = self._publish_now(message.topic, message.payload, message.qos, message.retain).rc
+        return rc == mqtt.MQTT_ERR_SUCCESS or (rc == mqtt.MQTT_ERR_NO_CONN and message.qos > 0)
+
+    def _send_queued(self, message: QueuedMessage) -> None:
+        self._publish_coalesced(message.topic, message.payload, message.qos)
+
+    def _has_room(self) -> bool:
+        return len(self._out_messages) < self.max_inflight
+
+    def publish_queued(self, topic: str, payload, qos: int = 1) -> None:
+        """
+        Publish a state message through the outbound queue, when enabled.
+        Coalesced by topic: while a message of the topic is still waiting to go out, only its payload is updated,
+        so every entity has at most one pending message and catching up after a stall sends only the newest states.
+        """
+        if self.outbound is None:
+            self._publish_coalesced(topic, payload, qos)
+        else:
+            self.outbound.put(topic, payload, qos)
+
+    def _publish_coalesced(self, topic: str, payload, qos: int) -> None:
+        if self.outbox is not None and self._buffer_state(topic, payload, qos):
+            return
+        mid = self._unsent_state.get(topic)
+        if mid is not None and qos > 0 and self._edit_pending:
+            with self._out_message_mutex:
+                message = self._out_messages.get(mid)
+                # only messages paho has not sent yet: queued behind max_inflight, or waiting for a connection
+                if (message is not None and message.topic == topic and not message.dup
+                        and message.state in (mqtt.mqtt_ms_queued, mqtt.mqtt_ms_publish)):
+                    message.payload = mqtt._encode_payload(payload)
+                    METRICS.inc("mqtt_coalesced_total")
+                    return
+        self._unsent_state[topic] = self.publish(topic, payload, qos=qos).mid
+
+    def _buffer_state(self, topic: str, payload, qos: int) -> bool:
+        """ Buffer a state message in the outbox, replacing any buffered for its topic, while publish() would buffer it """
+        with self._outbox_lock:
+            if not len(self.outbox) and self.is_connected():
+                return False
+            self.outbox.append(topic, payload, qos, False, coalesce=True)
+        METRICS.inc("mqtt_buffered_total")
+        return True
 
-            self.publish(discovery_topic, json.dumps(
-                discovery_payload), retain=True)
+    def loop_start(self):
+        rc = super().loop_start()
+        for worker in (self._drainer, self._dispatcher):
+            if worker is not None and not worker.is_alive():
+                worker.start()
+        return rc
+
+    def buffered_messages(self) -> int:
+        return len(self.outbox) if self.outbox is not None else 0
+
+    def queued_messages(self) -> int:
+        return len(self.outbound) if self.outbound is not None else 0
+
+    def outbound_queue_depth(self) -> int:
+        """ Messages handed to paho but not yet acknowledged by the broker """
+        return len(self._out_messages)
+
+    def publish_bridge_availability(self, avail: bool) -> None:
+        self.publish(self.bridge_availability_topic,
+                     "online" if avail else "offline", qos=1, retain=True)
+
+    def publish_discovery_topics(self, server):
+        # TODO check if more separation from server is necessary/ possible
+        topics = self.build_topics(server)
+
+        if self.device_discovery:
+            self._publish_device_discovery(topics)
+        else:
+            if topics.nickname in self.discovery_cache:
+                # previously announced by device-based discovery
+                self.publish(topics.device_discovery_topic, "", retain=True)
+                self.discovery_cache.forget(topics.nickname)
+            logger.info(f"Publishing discovery topics for {topics.nickname}")
+            # publish discovery topics for legal registers
+            for discovery_topic, discovery_payload in topics.discovery:
+                self.publish(discovery_topic, discovery_payload, retain=True)
 
         self.publish_availability(True, server)
 
@@ -151,21 +384,150 @@ class MqttClient(mqtt.Client):
         #     discovery_topic = f"{self.ha_discovery_topic}/number/{nickname}/{slugify(register_name)}/config"
         #     self.publish(discovery_topic, json.dumps(discovery_payload), retain=True)
 
+    def _publish_device_discovery(self, topics: ServerTopics) -> None:
+        """ Publish the single device discovery message of a server, unless the broker retains it unchanged """
+        if not self.discovery_cache.changed(topics.nickname, topics.discovery):
+            logger.info(f"Discovery of {topics.nickname} unchanged, not re-sent")
+            return
+
+        logger.info(f"Publishing device discovery for {topics.nickname}")
+        # remove per-parameter configs of earlier runs first, as the components reuse their unique ids
+        results = [self.publish(discovery_topic, "", qos=1, retain=True)
+                   for discovery_topic in topics.entity_discovery_topics]
+        results += [self.publish(discovery_topic, discovery_payload, qos=1, retain=True)
+                    for discovery_topic, discovery_payload in topics.discovery]
+        # only skip the next announcement once the broker took this one
+        if all(result.rc == mqtt.MQTT_ERR_SUCCESS for result in results):
+            self.discovery_cache.store(topics.nickname, topics.discovery)
+        else:
+            logger.warning(f"Device discovery of {topics.nickname} not delivered, re-sent on the next announcement")
+
+    def publish_diagnostics_discovery(self, client_names: list[str]) -> None:
+        """ Discovery of the bridge's diagnostic sensors, read from the JSON published by publish_diagnostics """
+        device = {"identifiers": ["modbus_bridge"], "name": "Modbus bridge", "manufacturer": "ha-paneltrack"}
+        sensors = {
+            "cycle_p50": ("Cycle time p50", "s", "duration", None),
+            "cycle_p99": ("Cycle time p99", "s", "duration", None),
+            "reads": ("Modbus reads", None, None, "total_increasing"),
+            "read_errors": ("Modbus read errors", None, None, "total_increasing"),
+            "publishes": ("MQTT publishes", None, None, "total_increasing"),
+            "publish_p99_ms": ("MQTT publish p99", "ms", "duration", None),
+        }
+        for client in client_names:
+            key = slugify(client)
+            sensors[f"{key}_read_p99_ms"] = (f"{client} read p99", "ms", "duration", None)
+            sensors[f"{key}_utilization"] = (f"{client} bus utilization", "%", None, "measurement")
+            sensors[f"{key}_errors"] = (f"{client} errors", None, None, "total_increasing")
+
+        for key, (name, unit, device_class, state_class) in sensors.items():
+            payload = {
+                "name": name,
+                "unique_id": f"modbus_bridge_{key}",
+                "state_topic": self.diagnostics_topic,
+                "value_template": f"{{{{ value_json['{key}'] }}}}",
+                "entity_category": "diagnostic",
+                "device": device,
+                "availability_topic": self.bridge_availability_topic,
+            }
+            if unit:
+                payload["unit_of_measurement"] = unit
+            if device_class:
+                payload["device_class"] = device_class
+            if state_class:
+                payload["state_class"] = state_class
+            self.publish(f"{self.ha_discovery_topic}/sensor/modbus_bridge/{key}/config", json.dumps(payload), retain=True)
+
+        # read latency of every server as attributes of a single sensor, so large fleets do not add an entity per server
+        self.publish(f"{self.ha_discovery_topic}/sensor/modbus_bridge/slowest_server/config", json.dumps({
+            "name": "Slowest server",
+            "unique_id": "modbus_bridge_slowest_server",
+            "state_topic": self.diagnostics_topic,
+            "value_template": "{{ value_json['slowest_server'] }}",
+            "json_attributes_topic": self.diagnostics_topic,
+            "json_attributes_template": "{{ value_json['servers'] | tojson }}",
+            "entity_category": "diagnostic",
+            "device": device,
+            "availability_topic": self.bridge_availability_topic,
+        }), retain=True)
+
+    def publish_diagnostics(self, diagnostics: dict) -> None:
+        """ Publish a metrics.diagnostics() summary, flattening the per client figures to match the discovery """
+        state = {k: v for k, v in diagnostics.items() if k != "clients"}
+        for client, figures in diagnostics["clients"].items():
+            key = slugify(client)
+            state[f"{key}_read_p99_ms"] = figures["read_p99_ms"]
+            state[f"{key}_utilization"] = figures["utilization"]
+            state[f"{key}_errors"] = figures["errors"]
+        self.publish(self.diagnostics_topic, json.dumps(state))
+
+    def publish_state(self, server, values: dict) -> None:
+        """ Publish the values read from a server, either per register or as a single JSON object """
+        topics = self.topics(server)
+        if not self.aggregate_state:
+            for register_name, value in values.items():
+                self._publish_parameter(server.name, register_name, value, topics.parameters[register_name])
+            return
+
+        changed = True
+        if self.publish_filter is not None:
+            changed = False
+            for register_name, value in values.items():
+                parameter = topics.parameters[register_name]
+                changed |= self.publish_filter.should_publish(server.name, register_name, value,
+                                                              parameter.device_class, parameter.state_class)
+        
+        # merge with the previous values, so every template finds its key when only some registers were read
+        state = self._aggregated_values.setdefault(server.name, {})
+        for register_name, value in values.items():
+            state[topics.parameters[register_name].state_key] = value
+        if changed:
+            self.publish_queued(topics.aggregated_state_topic, json.dumps(state), qos=1)
+
+    def publish_attributes(self, server, windows: dict[str, dict]) -> None:
+        """ Publish the window aggregates of sampled parameters, e.g. {"PSum": {"min": .., "max": .., ..}} """
+        topics = self.topics(server)
+        for register_name, stats in windows.items():
+            self.publish_queued(topics.parameters[register_name].attributes_topic, json.dumps(stats), qos=1)
+
+    def publish_status(self, server, stale: bool, last_read: float) -> None:
+        """ Attributes of the server's entities: whether the values are left over from an earlier run, and when they were read """
+        self.publish(self.topics(server).status_topic, json.dumps({
+            "stale": stale,
+            "last_read": datetime.fromtimestamp(last_read, timezone.utc).isoformat(timespec="seconds"),
+        }), qos=1, retain=True)
+
     def publish_to_ha(self, register_name, value, server):
-        nickname = slugify(server.name)
-        state_topic = f"{self.base_topic}/{nickname}/{slugify(register_name)}/state"
-        msg_info = self.publish(state_topic, value, qos=1)  # , retain=True)
-            
+        self._publish_parameter(server.name, register_name, value, self.topics(server).parameters[register_name])
+
+    def _publish_parameter(self, server_name: str, register_name: str, value, parameter: ParameterTopics) -> None:
+        if self.publish_filter is not None:
+            if not self.publish_filter.should_publish(server_name, register_name, value,
+                                                      parameter.device_class, parameter.state_class):
+                return
+
+        self.publish_queued(parameter.state_topic, value, qos=1)  # , retain=True)
 
     def publish_availability(self, avail, server):
-        availability_topic = self._availability_topic(server)
+        if avail and self.publish_filter is not None:
+            self.publish_filter.forget(server.name)     # republish every value once back online
+        topics = self._topics.get(server.name)
+        availability_topic = topics.availability_topic if topics else self._availability_topic(server)
+        self._availability[server.name] = (availability_topic, avail)
         msg_info = self.publish(availability_topic,
                      "online" if avail else "offline", qos=1, retain=True)
-        
+
+    def republish_availability(self) -> None:
+        """ Publish bridge availability, and the last availability of each server, again after reconnecting """
+        self.publish_bridge_availability(True)
+        for availability_topic, avail in list(self._availability.values()):
+            self.publish(availability_topic, "online" if avail else "offline", qos=1, retain=True)
 
     def ensure_connected(self, max_attempts: int = 3) -> None:
         """Block while not connected to the broker. Retry every second, for _max_attempts_, before stopping the process.
+        Returns immediately with store-and-forward enabled, as messages are buffered meanwhile.
         """ 
+        if self.outbox is not None:
+            return
         attempt_num = 1
 
         while not self.is_connected():
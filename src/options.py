@@ -1,4 +1,4 @@
-from dataclasses import dataclass
+from dataclasses import dataclass, field
 from typing import Union
 
 
@@ -34,6 +34,21 @@ class ModbusRTUOptions(ClientOptions):
     stopbits: int
 
 
+@dataclass
+class ParameterIntervalOptions:
+    """ Poll interval for a single parameter, used with polling_mode scheduled """
+    parameter: str
+    interval_seconds: float
+
+
+@dataclass
+class DeadbandOptions:
+    """ Publish deadband for all parameters of a Home Assistant device class """
+    device_class: str
+    absolute: float = 0
+    relative: float = 0
+
+
 @dataclass
 class AppOptions:
     """ Concatenated options for reading specific format of all options from config json """
@@ -52,3 +67,49 @@ class AppOptions:
     mwtt_ha_discovery_topic: str
     mqtt_base_topic: str
     mqtt_reconnect_attempts: int
+
+    adaptive_timeouts: bool = False     # learn request timeouts per device from observed round-trip times
+    timeout_rtt_multiplier: float = 3
+    timeout_min_seconds: float = 0.2
+    timeout_max_seconds: float = 3
+
+    reconnect_backoff_initial_seconds: float = 10  # wait before the first reconnect attempt, doubled after every failure
+    reconnect_backoff_max_seconds: float = 600
+
+    read_gap_tolerance: int = 0     # unused registers allowed inside a single block read
+    quarantine_retry_seconds: float = 600   # retry interval of registers a device rejected as Illegal Data Address
+    polling_mode: str = "sequential"    # sequential | parallel (one worker per client) | asyncio | scheduled
+    shards: int = 1                     # worker processes the clients are split across, see sharding.Supervisor
+    shard_partition: str = "cost"       # cost | hash
+    parameter_intervals: list[ParameterIntervalOptions] = field(default_factory=list)
+    sampled_parameters: list[str] = field(default_factory=list)  # read every sample_interval_seconds, see App.sample_group
+    sample_interval_seconds: float = 1
+    sample_buffer_size: int = 600           # samples kept per sampled parameter
+
+    mqtt_aggregate_state: bool = False      # one JSON state message per device per read
+    mqtt_device_discovery: bool = False     # one discovery message per device, re-sent only when it changed
+    discovery_cache_path: str = "/data/discovery_cache.json"
+    warm_start: bool = False                # publish the last values of the previous run at startup, marked stale
+    snapshot_path: str = "/data/last_values.bin"
+    snapshot_interval_seconds: int = 60     # how often the last values are saved, as well as on exit
+    history: bool = False                   # keep every reading, with 1-minute and 1-hour aggregates, in a local database
+    history_path: str = "/data/history.db"
+    history_raw_retention_days: float = 7
+    history_minute_retention_days: float = 90
+    history_hour_retention_days: float = 730
+
+    change_only_publishing: bool = False    # publish only values outside their deadband, or older than publish_max_age_seconds
+    publish_max_age_seconds: int = 300
+    deadbands: list[DeadbandOptions] = field(default_factory=list)
+
+    diagnostics_interval_seconds: int = 0   # publish latency/ error diagnostics of the bridge this often, 0 to disable
+    metrics_port: int = 0                   # serve Prometheus metrics on this port, 0 to disable
+
+    store_and_forward: bool = False         # buffer messages on disk while the broker is unreachable, instead of exiting
+    buffer_path: str = "/data/mqtt_buffer.db"
+    buffer_capacity: int = 100000           # messages; the oldest are dropped beyond this
+    buffer_drain_rate: int = 100            # buffered messages forwarded per second once the broker is back
+
+    outbound_queue_capacity: int = 0        # state messages waiting for the broker, 0 hands them straight to paho
+    outbound_queue_policy: str = "drop_oldest"  # drop_oldest | drop_new | block, once the queue is full
+    mqtt_max_inflight: int = 20             # messages handed to paho and not yet acknowledged
@@ -0,0 +1,144 @@
+import itertools
+import logging
+import threading
+from collections import OrderedDict
+from typing import Callable, NamedTuple
+
+from .metrics import METRICS
+
+logger = logging.getLogger(__name__)
+
+DROP_OLDEST = "drop_oldest"     # replace the pending value of the same topic, else drop the oldest message
+DROP_NEW = "drop_new"           # drop the message being queued
+BLOCK = "block"                 # wait for room, slowing acquisition down to the broker's pace
+POLICIES = (DROP_OLDEST, DROP_NEW, BLOCK)
+
+
+class QueuedMessage(NamedTuple):
+    topic: str
+    payload: object
+    qos: int
+    retain: bool
+
+
+class OutboundQueue:
+    """
+        Bounded FIFO of state messages between acquisition and the MQTT client.
+
+        paho queues every QoS 1 message it is handed, without bound, while the broker is slow.
+        Messages wait here instead, and are only handed over while paho has fewer than max_inflight
+        outstanding, see OutboundDispatcher. Once capacity messages wait, the overflow policy applies.
+        When coalescing, a message replaces the waiting message of its topic, keeping its place in line.
+    """
+
+    def __init__(self, capacity: int, policy: str = DROP_OLDEST, coalesce: bool = False):
+        """
+            Parameters:
+            -----------
+                - capacity: maximum number of waiting messages
+                - policy: drop_oldest | drop_new | block
+                - coalesce: keep at most one waiting message per topic, the newest
+        """
+        if capacity < 1:
+            raise ValueError(f"Outbound queue capacity must be positive, got {capacity}")
+        if policy not in POLICIES:
+            raise ValueError(f"Unknown outbound queue policy {policy}, expected one of {', '.join(POLICIES)}")
+        self.capacity = capacity
+        self.policy = policy
+        self.coalesce = coalesce
+        self.dropped = 0
+        self.coalesced = 0
+        self._messages: OrderedDict[int, QueuedMessage] = OrderedDict()
+        self._newest: dict[str, int] = {}      # topic -> key of its newest waiting message
+        self._keys = itertools.count()
+        self._cond = threading.Condition()
+
+    def __len__(self) -> int:
+        return len(self._messages)
+
+    def put(self, topic: str, payload, qos: int = 0, retain: bool = False) -> bool:
+        """ Queue a message. Returns False if it was dropped by the drop_new policy. """
+        with self._cond:
+            if self.coalesce and topic in self._newest:
+                self._messages[self._newest[topic]] = QueuedMessage(topic, payload, qos, retain)
+                self.coalesced += 1
+                METRICS.inc("mqtt_coalesced_total")
+                return True
+
+            if len(self._messages) >= self.capacity:
+                if self.policy == DROP_NEW:
+                    self._count_drop()
+                    return False
+                if self.policy == BLOCK:
+                    self._cond.wait_for(lambda: len(self._messages) < self.capacity)
+                else:
+                    self._remove(self._newest.get(topic, next(iter(self._messages))))
+                    self._count_drop()
+
+            key = next(self._keys)
+            self._messages[key] = QueuedMessage(topic, payload, qos, retain)
+            self._newest[topic] = key
+            self._cond.notify_all()
+            return True
+
+    def get(self, timeout: float | None = None) -> QueuedMessage | None:
+        """ The oldest waiting message, None if none arrived within timeout """
+        with self._cond:
+            if not self._cond.wait_for(lambda: self._messages, timeout):
+                return None
+            key = next(iter(self._messages))
+            message = self._remove(key)
+            self._cond.notify_all()
+            return message
+
+    def _remove(self, key: int) -> QueuedMessage:
+        message = self._messages.pop(key)
+        if self._newest.get(message.topic) == key:
+            del self._newest[message.topic]
+        return message
+
+    def _count_drop(self) -> None:
+        self.dropped += 1
+        METRICS.inc("mqtt_queue_dropped_total", policy=self.policy)
+
+
+class OutboundDispatcher(threading.Thread):
+    """ Background thread handing queued messages to the MQTT client while it has room for more in flight """
+
+    def __init__(self, queue: OutboundQueue, send: Callable[[QueuedMessage], object],
+                 has_room: Callable[[], bool]):
+        """
+            Parameters:
+            -----------
+                - queue: messages to hand over
+                - send: publishes a message
+                - has_room: whether the MQTT client accepts another message, see acknowledged()
+        """
+        super().__init__(name="outbound-dispatcher", daemon=True)
+        self.queue = queue
+        self.send = send
+        self.has_room = has_room
+        self._acknowledged = threading.Event()
+        self._stop_event = threading.Event()
+
+    def acknowledged(self) -> None:
+        """ Wake the dispatcher, a message left the MQTT client. Call from on_publish. """
+        self._acknowledged.set()
+
+    def run(self) -> None:
+        while not self._stop_event.is_set():
+            if not self.has_room():
+                self._acknowledged.wait(0.1)
+                self._acknowledged.clear()
+                continue
+            message = self.queue.get(timeout=0.1)
+            if message is None:
+                continue
+            try:
+                self.send(message)
+            except Exception as e:
+                logger.error(f"Error publishing {message.topic}: {e}")
+
+    def stop(self) -> None:
+        self._stop_event.set()
+        self._acknowledged.set()
@@ -0,0 +1,117 @@
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+import logging
+import threading
+from typing import Callable
+
+from .metrics import METRICS, Labels, Metrics
+
+logger = logging.getLogger(__name__)
+
+# upper bounds in seconds of the exported histogram buckets
+LATENCY_BUCKETS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60)
+CONTENT_TYPE = "text/plain; version=0.0.4; charset=utf-8"
+
+
+def _escape(value: str) -> str:
+    return value.replace("\\", "\\\\").replace("\"", "\\\"").replace("\n", "\\n")
+
+
+def _labels(labels: Labels, extra: tuple = ()) -> str:
+    pairs = list(labels) + list(extra)
+    if not pairs:
+        return ""
+    return "{" + ",".join(f'{k}="{_escape(str(v))}"' for k, v in pairs) + "}"
+
+
+def render(metrics: Metrics = METRICS, gauges: dict[str, dict[Labels, float]] | None = None) -> str:
+    """
+    Prometheus text exposition of a metrics registry.
+
+    Parameters:
+    -----------
+        - metrics: registry to export
+        - gauges: additional gauges collected at scrape time, name -> labels -> value
+    """
+    lines = []
+
+    def family(kind: dict) -> dict[str, dict[Labels, object]]:
+        grouped: dict[str, dict[Labels, object]] = {}
+        for (name, labels), value in list(kind.items()):
+            grouped.setdefault(name, {})[labels] = value
+        return grouped
+
+    for name, series in sorted(family(metrics.counters).items()):
+        lines.append(f"# TYPE {name} counter")
+        lines.extend(f"{name}{_labels(labels)} {value}" for labels, value in series.items())
+
+    all_gauges = family(metrics.gauges)
+    for name, series in (gauges or {}).items():
+        all_gauges.setdefault(name, {}).update(series)
+    for name, series in sorted(all_gauges.items()):
+        lines.append(f"# TYPE {name} gauge")
+        lines.extend(f"{name}{_labels(labels)} {value}" for labels, value in series.items())
+
+    for name, series in sorted(family(metrics.histograms).items()):
+        lines.append(f"# TYPE {name} histogram")
+        for labels, histogram in series.items():
+            count, total = histogram.count, histogram.sum
+            for bound, cumulative in zip(LATENCY_BUCKETS, histogram.cumulative_counts(list(LATENCY_BUCKETS))):
+                lines.append(f"{name}_bucket{_labels(labels, (('le', f'{bound:g}'),))} {cumulative}")
+            lines.append(f"{name}_bucket{_labels(labels, (('le', '+Inf'),))} {count}")
+            lines.append(f"{name}_sum{_labels(labels)} {total}")
+            lines.append(f"{name}_count{_labels(labels)} {count}")
+
+    return "\n".join(lines) + "\n"
+
+
+class MetricsServer:
+    """
+        HTTP endpoint serving /metrics in the Prometheus text format, from a daemon thread.
+
+        Scrapes only read the metrics registry, so they never wait on the polling loop.
+    """
+
+    def __init__(self, port: int, collect: Callable[[], dict[str, dict[Labels, float]]] = dict,
+                 metrics: Metrics = METRICS, host: str = ""):
+        """
+            Parameters:
+            -----------
+                - port: port to listen on, 0 for any free port (see self.port)
+                - collect: returns gauges computed at scrape time, name -> labels -> value
+                - metrics: registry to export
+                - host: interface to listen on, all if empty
+        """
+        render_metrics = lambda: render(metrics, collect())
+
+        class Handler(BaseHTTPRequestHandler):
+            def do_GET(self):
+                if self.path.split("?")[0] != "/metrics":
+                    self.send_error(404)
+                    return
+                try:
+                    body = render_metrics().encode()
+                except Exception as e:
+                    logger.error(f"Error rendering metrics: {e}")
+                    self.send_error(500)
+                    return
+                self.send_response(200)
+                self.send_header("Content-Type", CONTENT_TYPE)
+                self.send_header("Content-Length", str(len(body)))
+                self.end_headers()
+                self.wfile.write(body)
+
+            def log_message(self, format, *args):
+                logger.debug(f"Metrics request from {self.client_address[0]}: {format % args}")
+
+        self.httpd = ThreadingHTTPServer((host, port), Handler)
+        self.httpd.daemon_threads = True
+        self.port = self.httpd.server_address[1]
+        self._thread = threading.Thread(target=self.httpd.serve_forever, name="metrics", daemon=True)
+
+    def start(self) -> None:
+        self._thread.start()
+        logger.info(f"Serving Prometheus metrics on port {self.port}/metrics")
+
+    def stop(self) -> None:
+        self.httpd.shutdown()
+        self.httpd.server_close()
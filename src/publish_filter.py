@@ -0,0 +1,69 @@
+from dataclasses import dataclass
+import logging
+import threading
+import time
+from typing import Callable
+
+from .enums import DeviceClass
+
+logger = logging.getLogger(__name__)
+
+COUNTER_STATE_CLASSES = ("total", "total_increasing")
+
+
+@dataclass
+class Deadband:
+    """ A value is published once it moves more than absolute, or more than relative * |last published value| """
+    absolute: float = 0
+    relative: float = 0
+
+    def exceeded(self, last, value) -> bool:
+        if not isinstance(value, (int, float)) or not isinstance(last, (int, float)):
+            return value != last
+        return abs(value - last) > max(self.absolute, self.relative * abs(last))
+
+
+class PublishFilter:
+    """
+        Last-published-value cache deciding whether a new reading is worth publishing.
+
+        A reading is published when it is the first for its parameter, when it leaves the
+        deadband of its device class, or when the last publish is older than max_age seconds.
+        Counters (state_class total/ total_increasing) are published on any change.
+    """
+
+    def __init__(self, deadbands: dict[DeviceClass, Deadband], max_age: float,
+                 clock: Callable[[], float] = time.monotonic):
+        self.deadbands = deadbands
+        self.max_age = max_age
+        self.clock = clock
+        self._last: dict[tuple[str, str], tuple[float, object]] = {}  # (server, parameter) -> (time, value)
+        self._lock = threading.Lock()       # servers on different clients are filtered from different threads
+        self.suppressed = 0
+
+    def should_publish(self, server_name: str, parameter_name: str, value,
+                       device_class: DeviceClass | None = None, state_class: str | None = None) -> bool:
+        """ Returns True, and records the value as published, if the value should be published """
+        key = (server_name, parameter_name)
+        now = self.clock()
+        with self._lock:
+            last = self._last.get(key)
+
+            if last is not None and now - last[0] < self.max_age:
+                last_value = last[1]
+                if state_class in COUNTER_STATE_CLASSES:
+                    changed = value != last_value
+                else:
+                    changed = self.deadbands.get(device_class, Deadband()).exceeded(last_value, value)
+                if not changed:
+                    self.suppressed += 1
+                    return False
+
+            self._last[key] = (now, value)
+            return True
+
+    def forget(self, server_name: str) -> None:
+        """ Drop the cached values of a server, so its next readings are all published """
+        with self._lock:
+            for key in [k for k in self._last if k[0] == server_name]:
+                del self._last[key]
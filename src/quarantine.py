@@ -0,0 +1,43 @@
+import logging
+import time
+from typing import Callable
+
+logger = logging.getLogger(__name__)
+
+ILLEGAL_DATA_ADDRESS = 2    # Modbus exception code for registers the device does not implement
+
+
+class Quarantine:
+    """
+        Parameters a server rejected with Illegal Data Address, e.g. registers missing on a firmware variant.
+
+        Quarantined parameters are left out of the block reads, and retried individually
+        once every retry_interval in case the device starts answering them.
+    """
+
+    def __init__(self, retry_interval: float = 600, clock: Callable[[], float] = time.monotonic):
+        self.retry_interval = retry_interval
+        self.clock = clock
+        self.next_retry: dict[str, float] = {}     # parameter name -> time of the next retry
+        self.generation = 0                        # incremented on every change, so read plans can be invalidated
+
+    def __contains__(self, parameter_name: str) -> bool:
+        return parameter_name in self.next_retry
+
+    def __len__(self) -> int:
+        return len(self.next_retry)
+
+    def add(self, parameter_name: str) -> None:
+        if parameter_name not in self.next_retry:
+            self.generation += 1
+        self.next_retry[parameter_name] = self.clock() + self.retry_interval
+
+    def release(self, parameter_name: str) -> None:
+        if self.next_retry.pop(parameter_name, None) is not None:
+            self.generation += 1
+
+    def due(self, parameter_names=None) -> list[str]:
+        """ Quarantined parameters whose retry is due, optionally restricted to parameter_names """
+        now = self.clock()
+        return [name for name, at in self.next_retry.items()
+                if at <= now and (parameter_names is None or name in parameter_names)]
@@ -0,0 +1,94 @@
+from dataclasses import dataclass, field
+import logging
+from typing import Any
+
+from .enums import Parameter, RegisterTypes
+
+logger = logging.getLogger(__name__)
+
+MAX_READ_COUNT = 125    # Modbus PDU limit for read holding/ input registers
+
+
+@dataclass
+class ReadBlock:
+    """
+        A contiguous run of registers fetched with a single read request,
+        and the names of the parameters decoded from it.
+    """
+    register_type: RegisterTypes
+    address: int
+    count: int
+    parameter_names: list[str] = field(default_factory=list)
+    layout: Any = field(default=None, repr=False, compare=False)    # register_table.BlockLayout, set when compiled
+
+    @property
+    def end(self) -> int:
+        """ First register address after the block """
+        return self.address + self.count
+
+
+def plan_blocks(parameters: dict[str, Parameter], max_gap: int = 0, max_count: int = MAX_READ_COUNT) -> list[ReadBlock]:
+    """
+    Group parameters into as few block reads as possible.
+
+    Parameters of the same register type are merged into one block while the
+    unused registers between them do not exceed max_gap and the block stays
+    within max_count registers.
+
+    Parameters:
+    -----------
+        - parameters: register map as defined by the server implementation
+        - max_gap: number of unused registers allowed between two parameters in one block
+        - max_count: maximum number of registers per request
+
+    Returns:
+        list of ReadBlock, ordered by register type and address
+    """
+    if max_gap < 0:
+        raise ValueError(f"Read gap tolerance must be non-negative, got {max_gap}")
+
+    by_type: dict[RegisterTypes, list[tuple[int, int, str]]] = {}
+    for name, param in parameters.items():
+        if param["count"] > max_count:
+            raise ValueError(
+                f"Parameter {name} spans {param['count']} registers, more than the {max_count} allowed per read")
+        by_type.setdefault(param["register_type"], []).append(
+            (param["addr"], param["count"], name))
+
+    blocks: list[ReadBlock] = []
+    for register_type in sorted(by_type, key=lambda t: t.value):
+        block: ReadBlock | None = None
+        for address, count, name in sorted(by_type[register_type]):
+            end = address + count
+            if block is not None and address - block.end <= max_gap and max(end, block.end) - block.address <= max_count:
+                block.count = max(end, block.end) - block.address
+                block.parameter_names.append(name)
+                continue
+
+            block = ReadBlock(register_type, address, count, [name])
+            blocks.append(block)
+
+    logger.debug(f"Planned {len(blocks)} block reads for {len(parameters)} parameters")
+    return blocks
+
+
+def split_block(block: ReadBlock, parameters: dict[str, Parameter]) -> tuple[ReadBlock, ReadBlock]:
+    """
+    Split a block in two at the parameter boundary nearest its middle, to narrow down
+    which parameters a device rejects.
+
+    Raises:
+        ValueError: the block holds a single parameter
+    """
+    if len(block.parameter_names) < 2:
+        raise ValueError(f"Cannot split block at address {block.address} holding a single parameter")
+
+    names = sorted(block.parameter_names, key=lambda name: parameters[name]["addr"])
+    middle = len(names) // 2
+
+    halves = []
+    for half in (names[:middle], names[middle:]):
+        address = min(parameters[name]["addr"] for name in half)
+        end = max(parameters[name]["addr"] + parameters[name]["count"] for name in half)
+        halves.append(ReadBlock(block.register_type, address, end - address, half))
+    return halves[0], halves[1]
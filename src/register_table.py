@@ -0,0 +1,104 @@
+from array import array
+from dataclasses import dataclass
+import logging
+import struct
+
+from .codec import STRUCT_FORMATS, get_codec, registers_to_bytes
+from .enums import DataType, DeviceClass, Parameter, WordOrder
+from .read_planner import ReadBlock
+
+logger = logging.getLogger(__name__)
+
+# decimal places values are rounded to, per device class
+DEVICE_CLASS_ROUNDING: dict[DeviceClass, int] = {
+    DeviceClass.REACTIVE_POWER: 0,
+    DeviceClass.ENERGY: 1,
+    DeviceClass.FREQUENCY: 1,
+    DeviceClass.POWER_FACTOR: 1,
+    DeviceClass.APPARENT_POWER: 0,
+    DeviceClass.CURRENT: 1,
+    DeviceClass.VOLTAGE: 0,
+    DeviceClass.POWER: 0
+}
+DEFAULT_ROUNDING = 2
+
+
+class RegisterTable:
+    """
+        Register map compiled once into parallel arrays, indexed by parameter position.
+
+        The dict-of-dicts register map stays the authoring format; this is the form used while polling.
+    """
+
+    def __init__(self, parameters: dict[str, Parameter], default_word_order: WordOrder = WordOrder.BIG):
+        self.names: list[str] = list(parameters)
+        self.index: dict[str, int] = {name: i for i, name in enumerate(self.names)}
+
+        params = [parameters[name] for name in self.names]
+        self.address = array('L', (p["addr"] for p in params))
+        self.count = array('H', (p["count"] for p in params))
+        self.dtype: list[DataType] = [p["dtype"] for p in params]
+        self.word_order: list[WordOrder] = [p.get("word_order", default_word_order) for p in params]
+        self.multiplier = array('d', (p["multiplier"] for p in params))
+        self.digits = array('b', (DEVICE_CLASS_ROUNDING.get(p["device_class"], DEFAULT_ROUNDING) for p in params))
+
+    def scaled(self, i: int, val):
+        """ Apply the multiplier and rounding of parameter i to a decoded value """
+        if self.dtype[i] == DataType.UTF8:
+            return val
+        multiplier = self.multiplier[i]
+        if multiplier != 1:
+            val *= multiplier
+        return round(val, self.digits[i])
+
+    def compile_block(self, block: ReadBlock) -> "BlockLayout":
+        """
+        Build a single struct covering every parameter of the block, with pad bytes for gaps.
+        Blocks with overlapping parameters or little-endian word order are decoded per parameter instead.
+        """
+        indices = sorted((self.index[name] for name in block.parameter_names), key=lambda i: self.address[i])
+
+        fmt = ">"
+        position = block.address
+        for i in indices:
+            if self.address[i] < position or self.word_order[i] == WordOrder.LITTLE and self.count[i] > 1:
+                return BlockLayout(self, block.address, indices, None)
+            if self.address[i] > position:
+                fmt += f"{2 * (self.address[i] - position)}x"
+            fmt += f"{2 * self.count[i]}s" if self.dtype[i] == DataType.UTF8 else STRUCT_FORMATS[self.dtype[i]]
+            position = self.address[i] + self.count[i]
+
+        return BlockLayout(self, block.address, indices, struct.Struct(fmt))
+
+
+@dataclass
+class BlockLayout:
+    """ Decoding plan of one block read: the table positions of its parameters, and the struct decoding all of them at once """
+    table: RegisterTable
+    address: int
+    indices: list[int]
+    struct: struct.Struct | None     # None: decode per parameter
+
+    def decode(self, registers: list[int]) -> dict[str, float]:
+        """ Decode, scale and round every parameter of a block response in one pass """
+        table = self.table
+        buffer = registers_to_bytes(registers)
+
+        if self.struct is None:
+            raw = [get_codec(table.dtype[i], table.word_order[i], table.count[i]).decode_from(
+                buffer, 2 * (table.address[i] - self.address)) for i in self.indices]
+        else:
+            raw = self.struct.unpack_from(buffer)
+
+        names, multiplier, digits, dtype = table.names, table.multiplier, table.digits, table.dtype
+        values = {}
+        for i, val in zip(self.indices, raw):
+            if dtype[i] == DataType.UTF8:
+                if isinstance(val, bytes):
+                    val = val.decode("utf-8", errors="replace").rstrip("\x00 ")
+            else:
+                if multiplier[i] != 1:
+                    val *= multiplier[i]
+                val = round(val, digits[i])
+            values[names[i]] = val
+        return values
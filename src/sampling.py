@@ -0,0 +1,75 @@
+from array import array
+
+
+class RingBuffer:
+    """
+        Fixed-size window of the latest samples of a parameter. Memory does not grow with the sample rate:
+        once full, each sample overwrites the oldest. stats() aggregates the samples since the last reset().
+    """
+
+    def __init__(self, size: int):
+        if size < 1:
+            raise ValueError(f"Ring buffer size must be positive, got {size}")
+        self.size = size
+        self._samples = array('d', bytes(8 * size))
+        self._head = 0          # index of the next sample
+        self._pending = 0       # samples since the last reset, at most size
+
+    def __len__(self) -> int:
+        return self._pending
+
+    def append(self, value: float) -> None:
+        self._samples[self._head] = value
+        self._head = (self._head + 1) % self.size
+        self._pending = min(self._pending + 1, self.size)
+
+    def window(self) -> list[float]:
+        """ Samples since the last reset, oldest first """
+        start = self._head - self._pending
+        if start >= 0:
+            return self._samples[start:self._head].tolist()
+        return self._samples[start:].tolist() + self._samples[:self._head].tolist()
+
+    def stats(self) -> dict | None:
+        """ min/ max/ mean/ last of the samples since the last reset, None if there were none """
+        samples = self.window()
+        if not samples:
+            return None
+        return {
+            "min": min(samples),
+            "max": max(samples),
+            "mean": sum(samples) / len(samples),
+            "last": samples[-1],
+            "samples": len(samples),
+        }
+
+    def reset(self) -> None:
+        self._pending = 0
+
+
+class SampleWindows:
+    """ Ring buffer of every sampled parameter of every server """
+
+    def __init__(self, size: int):
+        self.size = size
+        self._buffers: dict[tuple[str, str], RingBuffer] = {}
+
+    def record(self, server_name: str, values: dict[str, float]) -> None:
+        for name, value in values.items():
+            buffer = self._buffers.get((server_name, name))
+            if buffer is None:
+                buffer = self._buffers[(server_name, name)] = RingBuffer(self.size)
+            buffer.append(value)
+
+    def collect(self, server_name: str, parameter_names: list[str]) -> dict[str, dict]:
+        """ Aggregates of each parameter's window since the last collect, then start new windows """
+        result = {}
+        for name in parameter_names:
+            buffer = self._buffers.get((server_name, name))
+            if buffer is None:
+                continue
+            stats = buffer.stats()
+            if stats is not None:
+                result[name] = stats
+            buffer.reset()
+        return result
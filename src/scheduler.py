@@ -0,0 +1,99 @@
+from dataclasses import dataclass, field
+import heapq
+import logging
+import math
+import time
+from typing import Callable
+
+from .enums import Parameter
+
+logger = logging.getLogger(__name__)
+
+
+@dataclass(order=True)
+class Job:
+    """ Periodic job, ordered on the scheduler heap by its next deadline """
+    deadline: float
+    seq: int
+    name: str = field(compare=False)
+    interval: float = field(compare=False)
+    callback: Callable[[], None] = field(compare=False)
+
+
+class Scheduler:
+    """
+        Fixed-rate scheduler driven by a deadline heap.
+
+        Every job runs at multiples of its interval, aligned to wall-clock boundaries
+        (e.g. a 60 s job runs on the minute). Deadlines advance by whole intervals rather
+        than from the time a job finished, so the period does not drift. A job that is still
+        running at its next deadline is an overrun: it is logged and counted, and the missed
+        slots are skipped instead of stretching the cycle.
+    """
+
+    def __init__(self, clock: Callable[[], float] = time.time, sleep: Callable[[float], None] = time.sleep):
+        self.clock = clock
+        self.sleep = sleep
+        self._heap: list[Job] = []
+        self._seq = 0
+        self.overruns: dict[str, int] = {}
+
+    def _next_boundary(self, interval: float, after: float) -> float:
+        return math.floor(after / interval) * interval + interval
+
+    def add(self, name: str, interval: float, callback: Callable[[], None]) -> None:
+        """ Schedule callback every interval seconds, starting at the next boundary """
+        if interval <= 0:
+            raise ValueError(f"Interval for job {name} must be positive, got {interval}")
+        self._seq += 1
+        heapq.heappush(self._heap, Job(self._next_boundary(interval, self.clock()),
+                                       self._seq, name, interval, callback))
+        self.overruns.setdefault(name, 0)
+
+    def realign(self) -> None:
+        """ Move all deadlines to their next boundary, e.g. after the process was paused """
+        now = self.clock()
+        for job in self._heap:
+            job.deadline = self._next_boundary(job.interval, now)
+        heapq.heapify(self._heap)
+
+    def run_pending(self) -> int:
+        """ Run all jobs whose deadline has passed. Returns the number of jobs run. """
+        ran = 0
+        while self._heap and self._heap[0].deadline <= self.clock():
+            job = heapq.heappop(self._heap)
+            try:
+                job.callback()
+            except Exception as e:
+                logger.error(f"Scheduled job {job.name} failed: {e}")
+            ran += 1
+
+            finished = self.clock()
+            next_deadline = job.deadline + job.interval
+            if finished > next_deadline:
+                missed = math.floor((finished - job.deadline) / job.interval)
+                self.overruns[job.name] += 1
+                logger.warning(
+                    f"Job {job.name} overran its {job.interval:g}s interval by {finished - next_deadline:.3f}s, skipping {missed} run(s)")
+                next_deadline = job.deadline + (missed + 1) * job.interval
+            job.deadline = next_deadline
+            heapq.heappush(self._heap, job)
+        return ran
+
+    def run(self, until: Callable[[], bool] | None = None) -> None:
+        """ Sleep until the next deadline and run due jobs, until the until() callback returns True """
+        while self._heap:
+            if until is not None and until():
+                break
+            delay = self._heap[0].deadline - self.clock()
+            if delay > 0:
+                self.sleep(delay)
+            self.run_pending()
+
+
+def group_parameters(parameters: dict[str, Parameter], intervals: dict[str, float], default_interval: float) -> dict[float, list[str]]:
+    """ Group parameter names by their poll interval. Parameters without an interval use default_interval. """
+    groups: dict[float, list[str]] = {}
+    for name in parameters:
+        groups.setdefault(intervals.get(name, default_interval), []).append(name)
+    return groups
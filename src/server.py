@@ -1,18 +1,27 @@
 from abc import abstractmethod, ABC
 import logging
+from time import perf_counter
 from typing import Optional, TypedDict
 
 from pymodbus import ModbusException
-from .enums import DataType, RegisterTypes, Parameter, DeviceClass
+from .enums import DataType, Parameter, WordOrder
+from .metrics import METRICS
+from .register_table import RegisterTable
 from .client import Client
 from .options import ServerOptions
 from .parameter_types import ParamInfo, HAParamInfo
+from .quarantine import ILLEGAL_DATA_ADDRESS, Quarantine
+from .read_planner import ReadBlock, plan_blocks, split_block
 
 logger = logging.getLogger(__name__)
 
 class ReadException(Exception):
     """Device-reported error (response received but the response contained an error code.)"""
 
+    def __init__(self, message: str = "", exception_code: int | None = None):
+        super().__init__(message)
+        self.exception_code = exception_code    # Modbus exception code, None for non-standard error responses
+
 
 class Server(ABC):
     """
@@ -22,6 +31,9 @@ class Server(ABC):
         decoding, encoding data read/ write, reading model code, setting up model-specific registers and checking availability.
     """
 
+    availability_register: str = "Device type code"     # register probed by is_available()
+    word_order: WordOrder = WordOrder.BIG               # default for parameters without a 'word_order'
+
     def __init__(self, name, serial, modbus_id, connected_client) -> None:
         self.name: str = name
         self.serial: str = serial
@@ -30,6 +42,12 @@ class Server(ABC):
 
         self._model: str = "unknown"
 
+        self.max_read_gap: int = 0              # unused registers tolerated inside one block read
+        self.read_blocks: list[ReadBlock] = []  # set by plan_reads()
+        self.register_table: RegisterTable | None = None  # compiled from self.parameters by plan_reads()
+        self.quarantine = Quarantine()          # parameters the device rejected, left out of block reads
+        self._planned_generation = 0            # quarantine generation self.read_blocks was planned for
+
         logger.info(f"Server {self.name} set up.")
 
     def __str__(self):
@@ -109,9 +127,11 @@ class Server(ABC):
             raise NotImplementedError(
                 f"Model not supported in implementation of Server, {self}")
 
-    def is_available(self, register_name="Device type code"):
+    def is_available(self, register_name: str | None = None):
         """ Contacts any server register and returns true if the server is available """
         logger.info(f"Verifying availability of server {self.name}")
+        if register_name is None:
+            register_name = self.availability_register
 
         available = True
 
@@ -153,16 +173,6 @@ class Server(ABC):
         Returns:
             _type_: _description_
         """
-        device_class_to_rounding: dict[DeviceClass, int] = {    # TODO define in deviceClass type
-            DeviceClass.REACTIVE_POWER: 0,
-            DeviceClass.ENERGY: 1,
-            DeviceClass.FREQUENCY: 1,
-            DeviceClass.POWER_FACTOR: 1,
-            DeviceClass.APPARENT_POWER: 0, 
-            DeviceClass.CURRENT: 1,
-            DeviceClass.VOLTAGE: 0,
-            DeviceClass.POWER: 0
-        }
         param = self.parameters[parameter_name]  # type: ignore
 
         address = param["addr"]
@@ -170,33 +180,135 @@ class Server(ABC):
         multiplier = param["multiplier"]
         # count = param.get('count', dtype.size // 2) #TODO
         count = param["count"]  # TODO
-        unit = param["unit"]
-        device_class = param['device_class']
-        slave_id = self.modbus_id
         register_type = param['register_type']
 
         # TODO count
         logger.debug(
             f"Reading param {parameter_name} ({register_type}) of {dtype=} from {address=}, {multiplier=}, {count=}, {self.modbus_id=}")
 
+        start = perf_counter()
         result = self.connected_client.read(
             address, count, self.modbus_id, register_type)
+        METRICS.observe("server_read_seconds", perf_counter() - start, server=self.name)
 
         if result.isError(): # config error, not connection
-            self.connected_client._handle_error_response(result)
-            raise ReadException(f"Error reading register {parameter_name}") 
+            raise self._read_error(result, f"Error reading register {parameter_name}")
 
         logger.debug(f"Raw register begin value: {result.registers[0]}")
-        val = self._decoded(result.registers, dtype)
-        if multiplier != 1:
-            val *= multiplier
-        if isinstance(val, int) or isinstance(val, float):
-            val = round(
-                val, device_class_to_rounding.get(device_class, 2))
-        logger.debug(f"Read {parameter_name} = {val} {unit}")
-
+        return self._decode_parameter(parameter_name, result.registers)
+
+    def _decode_parameter(self, parameter_name: str, registers: list[int]):
+        """ Decode, scale and round the registers of a single parameter """
+        return self._scaled(parameter_name, self._decoded(registers, self.parameters[parameter_name]["dtype"]))
+
+    def _scaled(self, parameter_name: str, val):
+        """ Apply the multiplier and device class rounding to a decoded value """
+        if self.register_table is None:
+            self.register_table = RegisterTable(self.parameters, self.word_order)
+        val = self.register_table.scaled(self.register_table.index[parameter_name], val)
+        logger.debug(f"Read {parameter_name} = {val} {self.parameters[parameter_name]['unit']}")
         return val
 
+    def _read_error(self, result, message: str) -> ReadException:
+        """ Log an error response and wrap it, keeping its exception code """
+        self.connected_client._handle_error_response(result)
+        return ReadException(message, getattr(result, "exception_code", None))
+
+    def plan_reads(self) -> None:
+        """ Coalesce self.parameters, except quarantined ones, into block reads. Call again whenever self.parameters changes. """
+        self.register_table = RegisterTable(self.parameters, self.word_order)
+        self.read_blocks = plan_blocks(
+            {name: param for name, param in self.parameters.items() if name not in self.quarantine}, self.max_read_gap)
+        for block in self.read_blocks:
+            block.layout = self.register_table.compile_block(block)
+        self._planned_generation = self.quarantine.generation
+        logger.info(
+            f"Server {self.name}: {len(self.parameters)} parameters in {len(self.read_blocks)} block reads"
+            + (f", {len(self.quarantine)} quarantined" if len(self.quarantine) else ""))
+
+    def read_block(self, block: ReadBlock) -> dict[str, float]:
+        """Read a block of contiguous registers with a single request, and decode every parameter in it.
+
+        A block rejected with Illegal Data Address is bisected to find and quarantine the
+        parameters the device does not implement; the values of the others are still returned.
+
+        Raises:
+            ReadException: device responded with any other error code
+        """
+        logger.debug(
+            f"Reading block ({block.register_type}) from address={block.address}, count={block.count}, {self.modbus_id=}")
+
+        start = perf_counter()
+        result = self.connected_client.read(
+            block.address, block.count, self.modbus_id, block.register_type)
+        METRICS.observe("server_read_seconds", perf_counter() - start, server=self.name)
+
+        if result.isError():
+            error = self._read_error(
+                result, f"Error reading block at address {block.address} ({block.count} registers)")
+            if error.exception_code != ILLEGAL_DATA_ADDRESS:
+                raise error
+            values = {}
+            for half in self.bisect_block(block):
+                values.update(self.read_block(half))
+            return values
+
+        return self.decode_block(block, result.registers)
+
+    def bisect_block(self, block: ReadBlock) -> tuple[ReadBlock, ...]:
+        """
+        Handle an Illegal Data Address response to a block read: quarantine a single-parameter block,
+        otherwise return its two halves to be read instead.
+        """
+        if len(block.parameter_names) == 1:
+            name = block.parameter_names[0]
+            logger.warning(
+                f"Server {self.name} rejected {name} at address {block.address}, "
+                f"retrying every {self.quarantine.retry_interval:.0f}s")
+            self.quarantine.add(name)
+            return ()
+        return split_block(block, self.parameters)
+
+    def retry_quarantined(self, parameter_names=None) -> dict[str, float]:
+        """
+        Read the quarantined parameters whose retry is due, one request each, and release those the device now answers.
+
+        Parameters:
+        -----------
+            - parameter_names: only retry these parameters, all if None
+        """
+        values = {}
+        for name in self.quarantine.due(parameter_names):
+            try:
+                values[name] = self.read_registers(name)
+            except ReadException as e:
+                if e.exception_code != ILLEGAL_DATA_ADDRESS:
+                    raise
+                self.quarantine.add(name)
+                continue
+            logger.info(f"Server {self.name} answered quarantined parameter {name}")
+            self.quarantine.release(name)
+        return values
+
+    def decode_block(self, block: ReadBlock, registers: list[int]) -> dict[str, float]:
+        """ Decode, scale and round every parameter of a block response in a single pass """
+        if block.layout is None:
+            if self.register_table is None:
+                self.register_table = RegisterTable(self.parameters, self.word_order)
+            block.layout = self.register_table.compile_block(block)
+        return block.layout.decode(registers)
+
+    def read_all(self) -> dict[str, float]:
+        """ Read and decode all parameters, using as few requests as possible. Quarantined parameters are only read when their retry is due. """
+        if not self.read_blocks or self._planned_generation != self.quarantine.generation:
+            self.plan_reads()
+
+        values = {}
+        for block in self.read_blocks:
+            values.update(self.read_block(block))
+        values.update(self.retry_quarantined())
+        return values
+
     # def write_registers(self, value: float, parameter_name: str):
     #     """
     #         Write to an individual register using pymodbus.
@@ -227,21 +339,28 @@ class Server(ABC):
     #                                                  value=values,
     #                                                  slave=slave_id)
 
-    def connect(self) -> bool:
+    def connect(self, connect_client: bool = True) -> bool:
+        """ Connect the client unless connect_client is False, e.g. when just connected, then check availability and initialise """
         logger.debug(f"Connecting to server {self}")
-        try:
-            self.connected_client.connect()
-        except ConnectionError as ce:
-            logger.error(f"Could not connect to the modbus client while attempting server connection")
-            return False
+        if connect_client:
+            try:
+                self.connected_client.connect()
+            except ConnectionError as ce:
+                logger.error(f"Could not connect to the modbus client while attempting server connection")
+                return False
 
         if not self.is_available():
             logger.error(f"Server {self.name} not available")
             return False
         
+        self.initialise()
+        return True
+
+    def initialise(self) -> None:
+        """ Set the model and plan reads for the model's registers. Called once the server is known to be available. """
         self.set_model()
         self.setup_valid_registers_for_model()
-        return True
+        self.plan_reads()
 
     @classmethod
     def from_ServerOptions(
@@ -0,0 +1,369 @@
+"""
+    Multi-process sharding of clients (buses), for installations with dozens of gateways.
+
+    The supervisor partitions the configured clients, with their servers, across worker processes.
+    Every worker runs a regular App on its shard and hands each MQTT message to the supervisor over a
+    shared-memory ring buffer. The supervisor owns the single broker connection and publishes the messages,
+    and restarts a worker that died, with backoff, without affecting the other shards.
+"""
+from dataclasses import dataclass
+import atexit
+import json
+import logging
+import multiprocessing
+from multiprocessing.shared_memory import SharedMemory
+import os
+import struct
+import tempfile
+import zlib
+from time import monotonic, sleep
+
+import paho.mqtt.client as mqtt
+from paho.mqtt.enums import MQTTErrorCode
+
+from .circuit_breaker import CircuitBreaker
+from .implemented_servers import ServerTypes
+from .loader import load_validate_options, read_json, read_yaml
+from .metrics import METRICS
+from .modbus_mqtt import MqttClient
+from .options import AppOptions
+from .read_planner import plan_blocks
+
+logger = logging.getLogger(__name__)
+
+CHANNEL_BYTES = 4 * 2**20       # shared memory per shard
+STABLE_SECONDS = 60             # a restarted shard running this long resets its restart backoff
+POLL_INTERVAL = 0.005           # supervisor sleep while no shard has messages
+LOCK_TIMEOUT = 0.1              # supervisor wait for a channel lock, which a killed worker may never release
+
+
+class ShmChannel:
+    """
+        Single-producer single-consumer ring buffer of byte records in shared memory.
+
+        The header holds the total bytes written and read. Each record is length-prefixed.
+        The lock guards the header, so records are only read once fully written on any CPU.
+    """
+
+    HEADER = struct.Struct("QQ")
+    LENGTH = struct.Struct("I")
+
+    def __init__(self, size: int = CHANNEL_BYTES):
+        self.capacity = size
+        self.shm = SharedMemory(create=True, size=self.HEADER.size + size)
+        self.HEADER.pack_into(self.shm.buf, 0, 0, 0)
+        self.lock = multiprocessing.get_context("spawn").Lock()
+
+    def __getstate__(self):
+        return {"capacity": self.capacity, "name": self.shm.name, "lock": self.lock}
+
+    def __setstate__(self, state):
+        self.capacity = state["capacity"]
+        self.lock = state["lock"]
+        # spawned workers share the supervisor's resource tracker, so the block is unlinked once, by close()
+        self.shm = SharedMemory(name=state["name"])
+
+    def _write(self, offset: int, data: bytes) -> None:
+        start = self.HEADER.size + offset % self.capacity
+        first = min(len(data), self.HEADER.size + self.capacity - start)
+        self.shm.buf[start:start + first] = data[:first]
+        if first < len(data):
+            self.shm.buf[self.HEADER.size:self.HEADER.size + len(data) - first] = data[first:]
+
+    def _read(self, offset: int, n: int) -> bytes:
+        start = self.HEADER.size + offset % self.capacity
+        first = min(n, self.HEADER.size + self.capacity - start)
+        data = bytes(self.shm.buf[start:start + first])
+        if first < n:
+            data += bytes(self.shm.buf[self.HEADER.size:self.HEADER.size + n - first])
+        return data
+
+    def send(self, record: bytes, timeout: float | None = None) -> bool:
+        """ Append a record, waiting for room while the ring is full. False if there was none within timeout. """
+        frame = self.LENGTH.pack(len(record)) + record
+        if len(frame) > self.capacity:
+            raise ValueError(f"Record of {len(record)} bytes does not fit a {self.capacity} byte channel")
+        deadline = None if timeout is None else monotonic() + timeout
+        while True:
+            with self.lock:
+                written, read = self.HEADER.unpack_from(self.shm.buf, 0)
+                if self.capacity - (written - read) >= len(frame):
+                    self._write(written, frame)
+                    self.HEADER.pack_into(self.shm.buf, 0, written + len(frame), read)
+                    return True
+            if deadline is not None and monotonic() >= deadline:
+                return False
+            sleep(0.001)
+
+    def receive(self, timeout: float | None = None) -> list[bytes] | None:
+        """ All records written since the last call. None if the lock was not acquired within timeout. """
+        if not self.lock.acquire(timeout=-1 if timeout is None else timeout):
+            return None
+        try:
+            written, read = self.HEADER.unpack_from(self.shm.buf, 0)
+            records = []
+            while read < written:
+                n, = self.LENGTH.unpack(self._read(read, self.LENGTH.size))
+                records.append(self._read(read + self.LENGTH.size, n))
+                read += self.LENGTH.size + n
+            self.HEADER.pack_into(self.shm.buf, 0, written, read)
+        finally:
+            self.lock.release()
+        return records
+
+    def close(self, unlink: bool = False) -> None:
+        self.shm.close()
+        if unlink:
+            self.shm.unlink()
+
+
+MESSAGE = struct.Struct("!BBBHI")   # qos, retain, queued, topic length, payload length
+
+
+def encode_message(topic: str, payload, qos: int, retain: bool, queued: bool) -> bytes:
+    topic_bytes = topic.encode()
+    if payload is None:
+        payload_bytes = b""
+    elif isinstance(payload, (bytes, bytearray)):
+        payload_bytes = bytes(payload)
+    else:
+        payload_bytes = str(payload).encode()     # as paho encodes str, int and float payloads
+    return MESSAGE.pack(qos, retain, queued, len(topic_bytes), len(payload_bytes)) + topic_bytes + payload_bytes
+
+
+def decode_message(record: bytes) -> tuple[str, bytes, int, bool, bool]:
+    """ (topic, payload, qos, retain, queued) """
+    qos, retain, queued, topic_length, payload_length = MESSAGE.unpack_from(record)
+    start = MESSAGE.size
+    topic = record[start:start + topic_length].decode()
+    payload = record[start + topic_length:start + topic_length + payload_length]
+    return topic, payload, qos, bool(retain), bool(queued)
+
+
+class ShardMqttClient(MqttClient):
+    """ MqttClient of a shard worker: messages go to the supervisor over channel instead of to a broker """
+
+    channel: ShmChannel     # set in the worker process, see run_shard
+
+    def connect(self, *args, **kwargs) -> MQTTErrorCode:
+        return MQTTErrorCode.MQTT_ERR_SUCCESS
+
+    def loop_start(self) -> MQTTErrorCode:
+        return MQTTErrorCode.MQTT_ERR_SUCCESS
+
+    def loop_stop(self) -> MQTTErrorCode:
+        return MQTTErrorCode.MQTT_ERR_SUCCESS
+
+    def is_connected(self) -> bool:
+        return True
+
+    def publish_bridge_availability(self, avail: bool) -> None:
+        pass    # owned by the supervisor, whose broker connection carries the Last Will
+
+    def publish(self, topic, payload=None, qos=0, retain=False, properties=None):
+        return self._forward(topic, payload, qos, retain, queued=False)
+
+    def publish_queued(self, topic: str, payload, qos: int = 1) -> None:
+        self._forward(topic, payload, qos, False, queued=True)
+
+    def _forward(self, topic, payload, qos, retain, queued) -> mqtt.MQTTMessageInfo:
+        record = encode_message(topic, payload, qos, retain, queued)
+        while not self.channel.send(record, timeout=1):
+            parent = multiprocessing.parent_process()
+            if parent is not None and not parent.is_alive():
+                logger.error("Supervisor exited, stopping shard")
+                os._exit(1)
+        msg_info = mqtt.MQTTMessageInfo(0)
+        msg_info.rc = MQTTErrorCode.MQTT_ERR_SUCCESS
+        return msg_info
+
+
+def run_shard(options_path: str, channel: ShmChannel) -> None:
+    """ Worker process: poll the clients and servers of one shard, forwarding MQTT messages to the supervisor """
+    from .app import App, instantiate_clients, instantiate_servers
+
+    ShardMqttClient.channel = channel
+    app = App(instantiate_clients, instantiate_servers, options_path)
+    if app.polling_mode == "asyncio":
+        from .async_app import AsyncApp, instantiate_async_clients
+        import asyncio
+        async_app = AsyncApp(instantiate_async_clients, instantiate_servers, options_path)
+        async_app.mqtt_client_class = ShardMqttClient
+        asyncio.run(async_app.run())
+    else:
+        app.mqtt_client_class = ShardMqttClient
+        app.setup()
+        app.connect()
+        app.loop()
+
+
+def client_costs(options: AppOptions) -> dict[str, float]:
+    """ Estimated polling cost of each client: block reads per cycle of its servers, plus one for the bus itself """
+    costs = {client.name: 1.0 for client in options.clients}
+    for server_options in options.servers:
+        server = ServerTypes[server_options.server_type].value(
+            server_options.name, server_options.serialnum, server_options.modbus_id, None)
+        costs[server_options.connected_client] += len(plan_blocks(server.parameters, options.read_gap_tolerance))
+    return costs
+
+
+def partition_clients(options: AppOptions, shards: int, method: str = "cost") -> list[list[str]]:
+    """
+    Split the client names into shards.
+
+    Parameters:
+    -----------
+        - method: `hash` assigns each client by a hash of its name, so adding a client does not move the others.
+          `cost` balances the estimated cost of the shards, see client_costs.
+    """
+    partition: list[list[str]] = [[] for _ in range(shards)]
+    if method == "hash":
+        for client in options.clients:
+            partition[zlib.crc32(client.name.encode()) % shards].append(client.name)
+    elif method == "cost":
+        loads = [0.0] * shards
+        costs = client_costs(options)
+        # longest processing time first: the costliest client goes to the least loaded shard
+        for name in sorted(costs, key=lambda n: (-costs[n], n)):
+            i = loads.index(min(loads))
+            partition[i].append(name)
+            loads[i] += costs[name]
+    else:
+        raise ValueError(f"Unknown shard partition {method}, expected hash or cost")
+    return [names for names in partition if names]
+
+
+def read_raw_options(options_path: str) -> dict:
+    return read_yaml(options_path) if options_path.endswith("yaml") else read_json(options_path)
+
+
+def shard_options(raw: dict, client_names: list[str], index: int) -> dict:
+    """ Options of one shard: its clients and their servers. Broker-side features stay with the supervisor. """
+    options = dict(raw)
+    options["clients"] = [c for c in raw["clients"] if c["name"] in client_names]
+    options["servers"] = [s for s in raw["servers"] if s["connected_client"] in client_names]
+    options.update(shards=1, store_and_forward=False, outbound_queue_capacity=0,
+                   metrics_port=0, diagnostics_interval_seconds=0)
+    for key in ("discovery_cache_path", "snapshot_path", "history_path"):
+        root, ext = os.path.splitext(raw.get(key, getattr(AppOptions, key)))
+        options[key] = f"{root}.shard{index}{ext}"
+    return options
+
+
+@dataclass
+class Shard:
+    index: int
+    client_names: list[str]
+    options_path: str
+    breaker: CircuitBreaker
+    process: multiprocessing.process.BaseProcess | None = None
+    channel: ShmChannel | None = None
+    started: float = 0
+    restarts: int = 0
+
+
+class Supervisor:
+    """ Runs the shards in worker processes and publishes their messages over a single broker connection """
+
+    def __init__(self, options_path: str, options: AppOptions | None = None):
+        self.options_path = options_path
+        self.OPTIONS = options or load_validate_options(options_path)
+        self.context = multiprocessing.get_context("spawn")   # no inherited MQTT or Modbus threads
+        self.workdir = tempfile.mkdtemp(prefix="modbus-shards-")
+        self.shards: list[Shard] = []
+        self.mqtt_client: MqttClient
+
+    def setup(self) -> None:
+        raw = read_raw_options(self.options_path)
+        partition = partition_clients(self.OPTIONS, self.OPTIONS.shards, self.OPTIONS.shard_partition)
+        for index, client_names in enumerate(partition):
+            path = os.path.join(self.workdir, f"shard{index}.json")
+            with open(path, "w") as f:
+                json.dump(shard_options(raw, client_names, index), f)
+            self.shards.append(Shard(index, client_names, path, CircuitBreaker(
+                self.OPTIONS.reconnect_backoff_initial_seconds, self.OPTIONS.reconnect_backoff_max_seconds)))
+            logger.info(f"Shard {index}: clients {', '.join(client_names)}")
+
+    def connect_mqtt(self) -> None:
+        self.mqtt_client = MqttClient(self.OPTIONS)
+        if self.mqtt_client.outbox is not None:
+            self.mqtt_client.connect_async(host=self.OPTIONS.mqtt_host, port=self.OPTIONS.mqtt_port)
+        else:
+            succeed = self.mqtt_client.connect(host=self.OPTIONS.mqtt_host, port=self.OPTIONS.mqtt_port)
+            if succeed.value != 0:
+                logger.info(f"MQTT Connection error: {succeed.name}, code {succeed.value}")
+        atexit.register(self.stop)
+        self.mqtt_client.loop_start()
+        self.mqtt_client.ensure_connected(self.OPTIONS.mqtt_reconnect_attempts)
+        self.mqtt_client.publish_bridge_availability(True)
+
+    def start_shard(self, shard: Shard) -> None:
+        shard.channel = ShmChannel()
+        shard.process = self.context.Process(target=run_shard, args=(shard.options_path, shard.channel),
+                                             name=f"shard{shard.index}", daemon=True)
+        shard.process.start()
+        shard.started = monotonic()
+        logger.info(f"Started shard {shard.index}, pid {shard.process.pid}")
+
+    def forward(self, shard: Shard) -> int:
+        """ Publish the messages a shard sent since the last call. Returns their number. """
+        records = shard.channel.receive(timeout=LOCK_TIMEOUT)
+        if records is None:
+            return 0    # held by the worker; if it died holding the lock, check_shard discards the channel
+        for record in records:
+            topic, payload, qos, retain, queued = decode_message(record)
+            if queued:
+                self.mqtt_client.publish_queued(topic, payload, qos)
+            else:
+                self.mqtt_client.publish(topic, payload, qos, retain)
+        return len(records)
+
+    def check_shard(self, shard: Shard) -> None:
+        """ Restart a shard whose worker exited, once its backoff expired """
+        if shard.process is not None and shard.process.is_alive():
+            if shard.breaker.failures and monotonic() - shard.started > STABLE_SECONDS:
+                shard.breaker.record_success()
+            return
+
+        if shard.process is not None:
+            logger.error(f"Shard {shard.index} exited with code {shard.process.exitcode}")
+            METRICS.inc("shard_exits_total", shard=shard.index)
+            # not drained: the worker may have died holding the channel lock. The restarted worker reads and publishes again
+            shard.channel.close(unlink=True)
+            shard.process = None
+            shard.breaker.record_failure()
+
+        if shard.breaker.probe_due():
+            shard.restarts += 1
+            METRICS.inc("shard_restarts_total", shard=shard.index)
+            self.start_shard(shard)
+
+    def run(self) -> None:
+        self.setup()
+        self.connect_mqtt()
+        for shard in self.shards:
+            self.start_shard(shard)
+
+        checked = monotonic()
+        while True:
+            forwarded = sum(self.forward(shard) for shard in self.shards if shard.process is not None)
+            if monotonic() - checked >= 1:
+                checked = monotonic()
+                for shard in self.shards:
+                    self.check_shard(shard)
+            if not forwarded:
+                sleep(POLL_INTERVAL)
+
+    def stop(self) -> None:
+        logger.info("Stopping shards")
+        for shard in self.shards:
+            if shard.process is not None and shard.process.is_alive():
+                shard.process.terminate()
+        for shard in self.shards:
+            if shard.process is not None:
+                shard.process.join(5)
+                self.forward(shard)
+                shard.channel.close(unlink=True)
+                shard.process = None
+        self.mqtt_client.publish_bridge_availability(False)
+        self.mqtt_client.loop_stop()
@@ -0,0 +1,337 @@
+"""
+    Modbus TCP simulator of PanelTrack fleets, built on pymodbus' server classes.
+
+    Serves realistic, slowly varying meter readings for any number of slave ids across one or more
+    TCP ports, with configurable latency, jitter, exception responses, dropouts and missing registers.
+
+    python3 -m src.simulator --ports 15020 --slaves 1-7 --latency 0.02
+    python3 -m src.simulator --app config.yaml      # simulate the configured fleet, and run the app against it
+"""
+import argparse
+import asyncio
+from dataclasses import dataclass, field
+import logging
+import math
+import random
+import sys
+import threading
+import time
+
+from pymodbus.datastore import ModbusServerContext, ModbusSlaveContext
+from pymodbus.exceptions import NoSuchSlaveException
+from pymodbus.pdu import ExceptionResponse
+from pymodbus.pdu.register_message import ReadHoldingRegistersRequest, ReadInputRegistersRequest
+from pymodbus.server import ModbusTcpServer
+
+from .codec import get_codec
+from .enums import Parameter, RegisterTypes
+from .implemented_servers import PanelTrack
+from .options import AppOptions, ModbusTCPOptions
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_PORT = 15020
+
+
+@dataclass
+class FaultProfile:
+    """ Timing and failure behaviour of every simulated slave """
+    latency: float = 0.0            # seconds before each response
+    jitter: float = 0.0             # uniformly distributed extra seconds, added to the latency
+    exception_rate: float = 0.0     # fraction of requests answered with exception_code
+    exception_code: int = ExceptionResponse.SLAVE_BUSY
+    dropout_rate: float = 0.0       # fraction of requests never answered
+    missing: list[str] = field(default_factory=list)   # parameters answered with Illegal Data Address, as on older firmware
+
+
+class PanelTrackMeter:
+    """ Plausible three-phase readings of one PanelTrack meter, varying slowly over time """
+
+    def __init__(self, rng: random.Random, clock=time.time):
+        self.rng = rng
+        self.clock = clock
+
+        self.load = rng.uniform(5, 80)          # average phase current, A
+        self.pf = rng.uniform(0.85, 0.99)
+        self.phase_offset = rng.uniform(0, 2 * math.pi)
+        self.import_kwh = rng.uniform(1e3, 5e5)
+        self.export_kwh = rng.uniform(0, 1e3)
+        self.day_kwh = rng.uniform(0, 100)
+        self.month_kwh = self.day_kwh + rng.uniform(0, 2000)
+        self._last = clock()
+
+    def values(self) -> dict[str, float]:
+        now = self.clock()
+        noise = self.rng.gauss
+
+        voltage = [230 + noise(0, 1.5) for _ in range(3)]
+        # load follows a slow cycle, so consecutive polls differ by realistic amounts
+        swing = 1 + 0.3 * math.sin(now / 600 + self.phase_offset)
+        current = [max(0.0, self.load * swing * (1 + noise(0, 0.05))) for _ in range(3)]
+        pf = [min(1.0, self.pf + noise(0, 0.01)) for _ in range(3)]
+        apparent = [v * i for v, i in zip(voltage, current)]
+        power = [s * p for s, p in zip(apparent, pf)]
+        reactive = [s * math.sqrt(max(0.0, 1 - p * p)) for s, p in zip(apparent, pf)]
+
+        kwh = sum(power) / 1000 * (now - self._last) / 3600
+        self._last = now
+        self.import_kwh += kwh
+        self.day_kwh += kwh
+        self.month_kwh += kwh
+
+        values = {
+            'Vab': math.sqrt(3) * (voltage[0] + voltage[1]) / 2,
+            'Vbc': math.sqrt(3) * (voltage[1] + voltage[2]) / 2,
+            'Vca': math.sqrt(3) * (voltage[2] + voltage[0]) / 2,
+            'PSum': sum(power),
+            'QSum': sum(reactive),
+            'SSum': sum(apparent),
+            'pfSum': sum(power) / sum(apparent) if sum(apparent) else 1.0,
+            'Freq': 50 + noise(0, 0.02),
+            'MonthkWhTotal': self.month_kwh,
+            'DaykWhTotal': self.day_kwh,
+            'TotalImportEnergy': int(self.import_kwh),
+            'TotalExportEnergy': int(self.export_kwh),
+        }
+        for phase, i in zip("abc", range(3)):
+            values[f'V{phase}'] = voltage[i]
+            values[f'I{phase}'] = current[i]
+            values[f'P{phase}'] = power[i]
+            values[f'Q{phase}'] = reactive[i]
+            values[f'S{phase}'] = apparent[i]
+            values[f'Pf{phase}'] = pf[i]
+        return values
+
+
+class SimulatedSlave(ModbusSlaveContext):
+    """
+        Datastore of one simulated slave. Registers are encoded from the meter readings on every read,
+        at the addresses of the register map.
+    """
+
+    def __init__(self, register_map: dict[str, Parameter], meter: PanelTrackMeter,
+                 profile: FaultProfile, rng: random.Random):
+        super().__init__()
+        self.register_map = register_map
+        self.meter = meter
+        self.profile = profile
+        self.rng = rng
+
+        self.addresses: dict[RegisterTypes, set[int]] = {}
+        for name, param in register_map.items():
+            if name not in profile.missing:
+                self.addresses.setdefault(param["register_type"], set()).update(
+                    range(param["addr"], param["addr"] + param["count"]))
+
+    @staticmethod
+    def _register_type(fc_as_hex: int) -> RegisterTypes:
+        return RegisterTypes.INPUT_REGISTER if fc_as_hex == 4 else RegisterTypes.HOLDING_REGISTER
+
+    def validate(self, fc_as_hex, address, count=1):
+        # register map addresses are one-based, the wire address zero-based
+        valid = self.addresses.get(self._register_type(fc_as_hex), set())
+        return all(a in valid for a in range(address + 1, address + 1 + count))
+
+    def getValues(self, fc_as_hex, address, count=1):
+        register_type = self._register_type(fc_as_hex)
+        registers = {}
+        for name, val in self.meter.values().items():
+            param = self.register_map.get(name)
+            if param is None or param["register_type"] != register_type:
+                continue
+            codec = get_codec(param["dtype"], count=param["count"])
+            for offset, register in enumerate(codec.encode(val)):
+                registers[param["addr"] + offset] = register
+        return [registers.get(a, 0) for a in range(address + 1, address + 1 + count)]
+
+    async def respond(self, request, respond):
+        """ Apply the fault profile to a request, answering it with respond(self) unless it fails """
+        profile = self.profile
+        delay = profile.latency + profile.jitter * self.rng.random()
+        if delay:
+            await asyncio.sleep(delay)
+        if self.rng.random() < profile.dropout_rate:
+            raise NoSuchSlaveException("dropped")    # the server is set up to ignore these, so the client times out
+        if self.rng.random() < profile.exception_rate:
+            return ExceptionResponse(request.function_code, profile.exception_code)
+        return await respond(self)
+
+
+class _SimulatedRequest:
+    """ Hands register read requests to the simulated slave's fault profile """
+
+    async def update_datastore(self, context):
+        if isinstance(context, SimulatedSlave):
+            return await context.respond(self, super().update_datastore)
+        return await super().update_datastore(context)
+
+
+class SimulatedReadHoldingRegistersRequest(_SimulatedRequest, ReadHoldingRegistersRequest):
+    pass
+
+
+class SimulatedReadInputRegistersRequest(_SimulatedRequest, ReadInputRegistersRequest):
+    pass
+
+
+class Simulator:
+    """
+        One pymodbus TCP server per port, each serving a PanelTrack meter per slave id.
+
+        Use start()/ stop() from a running event loop, or start_in_thread() to serve from a background thread.
+    """
+
+    def __init__(self, fleet: dict[int, list[int]], profile: FaultProfile | None = None,
+                 host: str = "127.0.0.1", seed: int | None = None, register_map: dict[str, Parameter] = PanelTrack.register_map):
+        """
+            Parameters:
+            -----------
+                - fleet: slave ids served on each TCP port
+                - profile: latency and fault behaviour of all slaves. Fault free if None
+                - host: interface to listen on
+                - seed: seed of the meter readings and faults, for reproducible runs
+                - register_map: register map to serve
+        """
+        self.fleet = fleet
+        self.profile = profile or FaultProfile()
+        self.host = host
+        self.rng = random.Random(seed)
+        self.register_map = register_map
+
+        self.servers: list[ModbusTcpServer] = []
+        self._loop: asyncio.AbstractEventLoop | None = None
+        self._thread: threading.Thread | None = None
+
+    def _context(self, slave_ids: list[int]) -> ModbusServerContext:
+        slaves = {}
+        for slave_id in slave_ids:
+            rng = random.Random(self.rng.random())
+            slaves[slave_id] = SimulatedSlave(self.register_map, PanelTrackMeter(rng), self.profile, rng)
+        return ModbusServerContext(slaves=slaves, single=False)
+
+    async def start(self) -> None:
+        for port, slave_ids in self.fleet.items():
+            server = ModbusTcpServer(
+                self._context(slave_ids), address=(self.host, port), ignore_missing_slaves=True,
+                custom_pdu=[SimulatedReadHoldingRegistersRequest, SimulatedReadInputRegistersRequest])
+            await server.serve_forever(background=True)
+            self.servers.append(server)
+            logger.info(f"Simulating slaves {slave_ids} on {self.host}:{port}")
+
+    async def stop(self) -> None:
+        for server in self.servers:
+            await server.shutdown()
+        self.servers = []
+
+    def start_in_thread(self, timeout: float = 5) -> None:
+        """ Serve from an event loop in a daemon thread. Returns once every port is listening. """
+        ready = threading.Event()
+
+        def serve():
+            self._loop = asyncio.new_event_loop()
+            self._loop.run_until_complete(self.start())
+            ready.set()
+            self._loop.run_forever()
+
+        self._thread = threading.Thread(target=serve, name="simulator", daemon=True)
+        self._thread.start()
+        if not ready.wait(timeout):
+            raise TimeoutError("Simulator did not start")
+
+    def stop_thread(self) -> None:
+        if self._loop is None:
+            return
+        asyncio.run_coroutine_threadsafe(self.stop(), self._loop).result()
+        self._loop.call_soon_threadsafe(self._loop.stop)
+        self._thread.join()
+        self._loop = None
+
+
+def simulate_clients(opts: AppOptions, base_port: int = DEFAULT_PORT) -> dict[int, list[int]]:
+    """
+    Point every client of the options at its own local simulator port, serial clients included,
+    and return the fleet serving the configured servers.
+    """
+    ports = {}
+    for i, cl_options in enumerate(opts.clients):
+        ports[cl_options.name] = base_port + i
+        opts.clients[i] = ModbusTCPOptions(cl_options.name, "TCP", "127.0.0.1", base_port + i)
+
+    fleet = {port: [] for port in ports.values()}
+    for sr_options in opts.servers:
+        fleet[ports[sr_options.connected_client]].append(sr_options.modbus_id)
+    return fleet
+
+
+def parse_slave_ids(spec: str) -> list[int]:
+    """ "1-3,7" -> [1, 2, 3, 7] """
+    slave_ids = []
+    for part in spec.split(","):
+        first, _, last = part.partition("-")
+        slave_ids.extend(range(int(first), int(last or first) + 1))
+    return slave_ids
+
+
+def run_app(config_path: str, profile: FaultProfile, seed: int | None, loop_count: int | None) -> None:
+    """ Simulate the fleet of a config file, and run the app against it with the broker of run_locally.sh """
+    from .app import App, instantiate_clients, instantiate_servers
+    from .async_app import AsyncApp, instantiate_async_clients
+
+    app = App(instantiate_clients, instantiate_servers, config_path)
+    if app.polling_mode == "asyncio":
+        app = AsyncApp(instantiate_async_clients, instantiate_servers, config_path)
+
+    app.OPTIONS.mqtt_host = "localhost"
+    app.OPTIONS.mqtt_port = 1884
+    simulator = Simulator(simulate_clients(app.OPTIONS), profile, seed=seed)
+    simulator.start_in_thread()
+
+    if isinstance(app, AsyncApp):
+        asyncio.run(app.run(loop_count))
+    else:
+        app.setup()
+        app.connect()
+        app.loop(loop_count)
+
+
+def main(argv=None) -> None:
+    parser = argparse.ArgumentParser(prog="python3 -m src.simulator", description="Simulated PanelTrack Modbus TCP fleet")
+    parser.add_argument("--app", metavar="CONFIG", help="simulate the servers of this config, and run the app against them")
+    parser.add_argument("--loops", type=int, help="with --app: number of polling cycles, forever if omitted")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--ports", type=int, nargs="+", default=[DEFAULT_PORT])
+    parser.add_argument("--slaves", default="1", help="slave ids served on every port, e.g. 1-7 or 1,3,5")
+    parser.add_argument("--latency", type=float, default=0.0)
+    parser.add_argument("--jitter", type=float, default=0.0)
+    parser.add_argument("--exception-rate", type=float, default=0.0)
+    parser.add_argument("--exception-code", type=int, default=ExceptionResponse.SLAVE_BUSY)
+    parser.add_argument("--dropout-rate", type=float, default=0.0)
+    parser.add_argument("--missing", nargs="*", default=[], help="parameters answered with Illegal Data Address")
+    parser.add_argument("--seed", type=int)
+    args = parser.parse_args(argv)
+
+    logging.basicConfig(level=logging.INFO, format="%(asctime)s - %(levelname)s - %(message)s")
+    profile = FaultProfile(args.latency, args.jitter, args.exception_rate, args.exception_code,
+                           args.dropout_rate, args.missing)
+
+    if args.app:
+        run_app(args.app, profile, args.seed, args.loops)
+        return
+
+    simulator = Simulator({port: parse_slave_ids(args.slaves) for port in args.ports}, profile, args.host, args.seed)
+
+    async def serve():
+        await simulator.start()
+        try:
+            await asyncio.Event().wait()
+        finally:
+            await simulator.stop()
+
+    try:
+        asyncio.run(serve())
+    except KeyboardInterrupt:
+        pass
+
+
+if __name__ == "__main__":
+    main(sys.argv[1:])
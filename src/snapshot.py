@@ -0,0 +1,99 @@
+import logging
+import os
+import struct
+import threading
+from time import time
+
+logger = logging.getLogger(__name__)
+
+MAGIC = b"LVS1"
+COUNT = struct.Struct("<I")
+NAME = struct.Struct("<H")
+VALUE = struct.Struct("<dd")    # value, unix timestamp of the read
+
+
+def _pack_name(name: str) -> bytes:
+    encoded = name.encode()
+    return NAME.pack(len(encoded)) + encoded
+
+
+class LastValueSnapshot:
+    """
+        Last decoded value and read time of every parameter of every server, persisted as a compact binary file,
+        so a restart can publish the last known values at once instead of leaving entities unknown.
+
+        Layout: MAGIC, server count, then per server its name, value count and (name, value, timestamp) entries.
+        Names are length-prefixed UTF-8, values and timestamps little-endian doubles.
+    """
+
+    def __init__(self, path: str):
+        self.path = path
+        self.values: dict[str, dict[str, tuple[float, float]]] = {}    # server -> parameter -> (value, timestamp)
+        self._lock = threading.Lock()
+        self._save_lock = threading.Lock()
+        if os.path.exists(path):
+            try:
+                with open(path, "rb") as f:
+                    self.values = self.decode(f.read())
+                logger.info(f"Loaded last values of {len(self.values)} servers from {path}")
+            except (OSError, ValueError, struct.error, UnicodeDecodeError) as e:
+                logger.warning(f"Ignoring unreadable snapshot {path}: {e}")
+
+    def update(self, server_name: str, values: dict[str, float], timestamp: float | None = None) -> None:
+        timestamp = time() if timestamp is None else timestamp
+        with self._lock:
+            server_values = self.values.setdefault(server_name, {})
+            for name, value in values.items():
+                if isinstance(value, (int, float)):
+                    server_values[name] = (float(value), timestamp)
+
+    def encode(self) -> bytes:
+        with self._lock:
+            parts = [MAGIC, COUNT.pack(len(self.values))]
+            for server_name, server_values in self.values.items():
+                parts.append(_pack_name(server_name))
+                parts.append(COUNT.pack(len(server_values)))
+                for name, (value, timestamp) in server_values.items():
+                    parts.append(_pack_name(name))
+                    parts.append(VALUE.pack(value, timestamp))
+        return b"".join(parts)
+
+    @staticmethod
+    def decode(data: bytes) -> dict[str, dict[str, tuple[float, float]]]:
+        if data[:len(MAGIC)] != MAGIC:
+            raise ValueError("not a last value snapshot")
+        offset = len(MAGIC)
+
+        def read(fmt: struct.Struct) -> tuple:
+            nonlocal offset
+            fields = fmt.unpack_from(data, offset)
+            offset += fmt.size
+            return fields
+
+        def read_name() -> str:
+            nonlocal offset
+            length, = read(NAME)
+            name = data[offset:offset + length].decode()
+            offset += length
+            return name
+
+        values = {}
+        servers, = read(COUNT)
+        for _ in range(servers):
+            server_name = read_name()
+            count, = read(COUNT)
+            values[server_name] = {read_name(): read(VALUE) for _ in range(count)}
+        return values
+
+    def save(self) -> None:
+        """ Write the snapshot, replacing the previous file only once complete """
+        try:
+            if os.path.dirname(self.path):
+                os.makedirs(os.path.dirname(self.path), exist_ok=True)
+            tmp = f"{self.path}.tmp"
+            with self._save_lock:
+                with open(tmp, "wb") as f:
+                    f.write(self.encode())
+                os.replace(tmp, self.path)
+        except OSError as e:
+            logger.warning(f"Could not write snapshot {self.path}: {e}")
@@ -0,0 +1,145 @@
+import logging
+import os
+import sqlite3
+import threading
+from typing import Callable, NamedTuple
+
+from .metrics import METRICS
+
+logger = logging.getLogger(__name__)
+
+
+class BufferedMessage(NamedTuple):
+    id: int
+    topic: str
+    payload: object
+    qos: int
+    retain: bool
+
+
+class OutboxBuffer:
+    """
+        Disk-backed FIFO of MQTT messages published while the broker is unreachable, stored in SQLite (WAL).
+
+        Bounded as a ring: once capacity messages are buffered, the oldest are dropped.
+        Only the message count is kept in memory, so memory use stays flat during long outages.
+        State messages are appended with coalesce=True: one row per topic, holding the newest payload.
+    """
+
+    def __init__(self, path: str, capacity: int):
+        """
+            Parameters:
+            -----------
+                - path: database file, created if missing. ':memory:' for tests
+                - capacity: maximum number of buffered messages
+        """
+        if path != ":memory:" and os.path.dirname(path):
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+        self.capacity = capacity
+        self._db = sqlite3.connect(path, check_same_thread=False, isolation_level=None)
+        self._db.execute("PRAGMA journal_mode=WAL")
+        self._db.execute("PRAGMA synchronous=NORMAL")
+        self._db.execute(
+            "CREATE TABLE IF NOT EXISTS outbox ("
+            "id INTEGER PRIMARY KEY AUTOINCREMENT, topic TEXT NOT NULL, payload, qos INTEGER, retain INTEGER)")
+        self._db.execute("CREATE INDEX IF NOT EXISTS outbox_topic ON outbox (topic)")
+        self._lock = threading.Lock()
+        self._count = self._db.execute("SELECT COUNT(*) FROM outbox").fetchone()[0]
+        self.dropped = 0
+        if self._count:
+            logger.info(f"{self._count} MQTT messages buffered from an earlier run")
+
+    def __len__(self) -> int:
+        return self._count
+
+    def append(self, topic: str, payload, qos: int, retain: bool, coalesce: bool = False) -> None:
+        """ Buffer a message. With coalesce, a non-retained message replaces the payload of one already buffered for its topic. """
+        if payload is not None and not isinstance(payload, (str, bytes, bytearray, int, float)):
+            payload = str(payload)
+        with self._lock:
+            if coalesce and not retain and self._db.execute(
+                    "UPDATE outbox SET payload = ?, qos = ? WHERE topic = ? AND retain = 0",
+                    (payload, qos, topic)).rowcount:
+                METRICS.inc("mqtt_coalesced_total")
+                return
+            self._db.execute("INSERT INTO outbox (topic, payload, qos, retain) VALUES (?, ?, ?, ?)",
+                             (topic, payload, qos, int(retain)))
+            self._count += 1
+            overflow = self._count - self.capacity
+            if overflow > 0:
+                self._db.execute(
+                    "DELETE FROM outbox WHERE id IN (SELECT id FROM outbox ORDER BY id LIMIT ?)", (overflow,))
+                self._count -= overflow
+                self.dropped += overflow
+                METRICS.inc("mqtt_buffer_dropped_total", overflow)
+
+    def peek(self, limit: int) -> list[BufferedMessage]:
+        """ The oldest buffered messages, at most limit """
+        with self._lock:
+            rows = self._db.execute(
+                "SELECT id, topic, payload, qos, retain FROM outbox ORDER BY id LIMIT ?", (limit,)).fetchall()
+        return [BufferedMessage(id, topic, payload, qos, bool(retain)) for id, topic, payload, qos, retain in rows]
+
+    def remove(self, last_id: int) -> None:
+        """ Remove the messages up to and including last_id, once they were handed to the broker connection """
+        with self._lock:
+            removed = self._db.execute("DELETE FROM outbox WHERE id <= ?", (last_id,)).rowcount
+            self._count -= removed
+
+    def close(self) -> None:
+        with self._lock:
+            self._db.close()
+
+
+class OutboxDrainer(threading.Thread):
+    """
+        Background thread forwarding buffered messages once the broker is back, in batches
+        at no more than rate messages per second, so the backlog does not swamp the broker.
+    """
+
+    BATCHES_PER_SECOND = 10
+
+    def __init__(self, buffer: OutboxBuffer, send: Callable[[BufferedMessage], bool],
+                 is_connected: Callable[[], bool], lock: threading.Lock, rate: float):
+        """
+            Parameters:
+            -----------
+                - buffer: messages to forward
+                - send: publishes a message, returns False if it could not be handed to the connection
+                - is_connected: whether the broker connection is up
+                - lock: held while forwarding a batch, shared with the publisher to keep messages in order
+                - rate: maximum messages per second
+        """
+        super().__init__(name="outbox-drainer", daemon=True)
+        self.buffer = buffer
+        self.send = send
+        self.is_connected = is_connected
+        self.lock = lock
+        self.batch_size = max(1, int(rate / self.BATCHES_PER_SECOND))
+        self._stop_event = threading.Event()
+
+    def run(self) -> None:
+        while not self._stop_event.wait(1 / self.BATCHES_PER_SECOND):
+            if len(self.buffer) and self.is_connected():
+                self.drain_batch()
+
+    def drain_batch(self) -> int:
+        """ Forward up to batch_size buffered messages, in order. Returns the number forwarded. """
+        with self.lock:
+            forwarded = 0
+            last_id = None
+            for message in self.buffer.peek(self.batch_size):
+                if not self.send(message):
+                    break
+                last_id = message.id
+                forwarded += 1
+            if last_id is not None:
+                self.buffer.remove(last_id)
+        if forwarded:
+            METRICS.inc("mqtt_buffer_drained_total", forwarded)
+            if not len(self.buffer):
+                logger.info("Forwarded all buffered MQTT messages")
+        return forwarded
+
+    def stop(self) -> None:
+        self._stop_event.set()
@@ -0,0 +1,48 @@
+import json
+import tempfile
+import paho.mqtt.client as mqtt
+from paho.mqtt.enums import MQTTErrorCode
+from src.app import App, instantiate_clients, instantiate_servers
+from src.loader import read_yaml
+from src.modbus_mqtt import MqttClient
+
+
+class RecordingMqttClient(MqttClient):
+    """ MqttClient recording published (topic, payload) instead of connecting to a broker """
+    def __init__(self, options, rc=mqtt.MQTT_ERR_SUCCESS):
+        super().__init__(options)
+        self.messages: list[tuple[str, object]] = []
+        self.rc = rc    # result of every publish
+
+    @property
+    def published(self) -> list[str]:
+        return [topic for topic, _ in self.messages]
+
+    def connect(self, *args, **kwargs):
+        return MQTTErrorCode.MQTT_ERR_SUCCESS
+
+    def loop_start(self):
+        pass
+
+    def is_connected(self):
+        return True
+
+    def publish(self, topic, payload=None, qos=0, retain=False, properties=None):
+        # not handed to paho, where unsent messages would be coalesced
+        self.messages.append((topic, payload))
+        info = mqtt.MQTTMessageInfo(0)
+        info.rc = self.rc
+        return info
+
+
+def make_app(clients: list[dict], servers: list[dict], app_class=App, client_instantiator=instantiate_clients,
+             **options) -> App:
+    """ App for the given clients and servers, other options as in config.yaml, publishing to RecordingMqttClient """
+    raw = read_yaml("config.yaml")
+    raw.update(clients=clients, servers=servers, midnight_sleep_enabled=False, **options)
+    with tempfile.NamedTemporaryFile("w", suffix=".json") as f:
+        json.dump(raw, f)
+        f.flush()
+        app = app_class(client_instantiator, instantiate_servers, f.name)
+    app.mqtt_client_class = RecordingMqttClient
+    return app
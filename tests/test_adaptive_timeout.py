@@ -0,0 +1,41 @@
+import unittest
+from src.adaptive_timeout import RttTracker, TimeoutPolicy
+
+
+class TestRttTracker(unittest.TestCase):
+    def setUp(self):
+        self.tracker = RttTracker(TimeoutPolicy(multiplier=3, floor=0.2, ceiling=3, retries=3, min_samples=10))
+
+    def test_ceiling_until_enough_samples(self):
+        for _ in range(9):
+            self.tracker.record(0.1)
+        self.assertEqual(self.tracker.timeout(), 3)
+        self.tracker.record(0.1)
+        self.assertAlmostEqual(self.tracker.timeout(), 0.3)
+
+    def test_timeout_clamped(self):
+        for _ in range(20):
+            self.tracker.record(0.01)
+        self.assertEqual(self.tracker.timeout(), 0.2)
+        for _ in range(20):
+            self.tracker.record(2)
+        self.assertEqual(self.tracker.timeout(), 3)
+
+    def test_p99_ignores_single_outlier_in_large_window(self):
+        for _ in range(199):
+            self.tracker.record(0.1)
+        self.tracker.record(5)
+        self.assertAlmostEqual(self.tracker.timeout(), 0.3)
+
+    def test_retries_drop_with_consecutive_timeouts(self):
+        self.assertEqual(self.tracker.retries(), 3)
+        for expected in (2, 1, 0, 0):
+            self.tracker.record_timeout()
+            self.assertEqual(self.tracker.retries(), expected)
+        self.tracker.record(0.1)
+        self.assertEqual(self.tracker.retries(), 3)
+        self.assertEqual(self.tracker.stats()["timeouts"], 4)
+
+
+if __name__ == "__main__":
+    unittest.main()
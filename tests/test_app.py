@@ -1,6 +1,9 @@
 import unittest
+from time import perf_counter, sleep
+from pymodbus.exceptions import ModbusIOException
 import src.app as app
 from src.client import SpoofClient
+from tests.helpers import RecordingMqttClient
 import logging
 logging.disable(logging.CRITICAL)
 
@@ -19,7 +22,7 @@ class TestApp(unittest.TestCase):
 
         self.app.setup()
         for s in self.app.servers:
-            s.connect = lambda: None
+            s.connect = lambda connect_client=True: None
         self.app.connect()
 
     def test_setup(self):
@@ -29,5 +32,62 @@ class TestApp(unittest.TestCase):
         self.app.loop(loop_once=True)
 
 
+class SlowClient(SpoofClient):
+    """ Spoofed bus taking `delay` seconds per read. Reads from the slaves in `failing` raise. """
+    def __init__(self, name: str, delay: float, failing: tuple[int, ...] = ()):
+        super().__init__(name)
+        self.delay, self.failing, self.reads = delay, failing, 0
+
+    def read(self, address, count, slave_id, register_type):
+        sleep(self.delay)
+        self.reads += 1
+        if slave_id in self.failing:
+            raise ModbusIOException(f"No response from slave {slave_id}")
+        return super().read(address, count, slave_id, register_type)
+
+
+class TestParallelPolling(unittest.TestCase):
+    DELAY = 0.05
+
+    def setUp(self):
+        self.buses = [SlowClient("Client1", self.DELAY), SlowClient("Client2", self.DELAY, failing=(3,))]
+        self.app = app.App(
+            client_instantiator_callback=lambda options: self.buses,
+            server_instantiator_callback=app.instantiate_servers,
+            options_rel_path="config.yaml"
+        )
+        self.app.OPTIONS.midnight_sleep_enabled = self.app.midnight_sleep_enabled = False
+        self.app.setup()
+        self.app.mqtt_client = RecordingMqttClient(self.app.OPTIONS)
+        self.app.disconnected_servers = []
+
+    def tearDown(self):
+        if self.app.poll_executor is not None:
+            self.app.poll_executor.shutdown()
+
+    def poll_timed(self, poll) -> float:
+        for bus in self.buses:
+            bus.reads = 0
+        self.app.disconnect_stack = []
+        start = perf_counter()
+        poll()
+        return perf_counter() - start
+
+    def test_cycle_follows_slowest_bus(self):
+        sequential = self.poll_timed(lambda: self.app.poll_servers(self.app.servers))
+        parallel = self.poll_timed(self.app.poll_parallel)
+
+        slowest = max(bus.reads for bus in self.buses) * self.DELAY
+        total = sum(bus.reads for bus in self.buses) * self.DELAY
+        self.assertGreaterEqual(parallel, slowest)
+        self.assertLess(parallel, (slowest + total) / 2)
+        self.assertLess(parallel, sequential)
+
+    def test_failing_server_goes_to_disconnect_stack(self):
+        self.app.poll_parallel()
+        self.assertEqual([s.name for s in self.app.disconnect_stack], ["PT 3"])
+        self.assertIn("modbus/pt_4/va/state", self.app.mqtt_client.published)
+
+
 if __name__ == "__main__":
     unittest.main()
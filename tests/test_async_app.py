@@ -0,0 +1,114 @@
+import asyncio
+import unittest
+import unittest.mock
+from pymodbus.exceptions import ModbusIOException
+from src.adaptive_timeout import TimeoutPolicy
+from src.async_app import AsyncApp, instantiate_async_clients
+from src.async_client import AsyncClient
+from src.enums import RegisterTypes
+from src.options import ModbusTCPOptions
+from src.simulator import Simulator
+from tests.helpers import make_app
+
+PORT = 15092
+
+
+class TestAsyncClient(unittest.TestCase):
+    def setUp(self):
+        self.simulator = Simulator({PORT: [1]}, seed=1)
+        self.simulator.start_in_thread()
+
+    def tearDown(self):
+        self.simulator.stop_thread()
+
+    def make_client(self, timeout: float, policy: TimeoutPolicy | None = None) -> AsyncClient:
+        # pymodbus binds to the running event loop, so call from a coroutine
+        return AsyncClient(ModbusTCPOptions("Client1", "TCP", "127.0.0.1", PORT), policy, timeout=timeout, retries=1)
+
+    def test_adaptive_timeout_beyond_constructor_timeout(self):
+        self.simulator.profile.latency = 0.3
+
+        async def read():
+            client = self.make_client(0.2, TimeoutPolicy(ceiling=0.6))
+            await client.connect()
+            try:
+                return await client.read(7, 2, 1, RegisterTypes.HOLDING_REGISTER)
+            finally:
+                client.close()
+        self.assertFalse(asyncio.run(read()).isError())
+
+    def test_timeout_retried_then_counted_as_timeout(self):
+        self.simulator.profile.latency = 0.3
+
+        async def read():
+            client = self.make_client(0.1)
+            await client.connect()
+            try:
+                with unittest.mock.patch.object(client, "_record_failure") as record_failure:
+                    with self.assertRaises(Exception):
+                        await client.read(7, 2, 1, RegisterTypes.HOLDING_REGISTER)
+                    record_failure.assert_called_once()
+                    self.assertEqual(record_failure.call_args.args[1], "timeout")
+            finally:
+                client.close()
+        asyncio.run(read())
+
+
+class TestAsyncApp(unittest.TestCase):
+    def test_polls_against_simulator(self):
+        app = make_app(
+            [{"name": "Bus1", "type": "TCP", "host": "127.0.0.1", "port": PORT + 1},
+             {"name": "Dead", "type": "TCP", "host": "127.0.0.1", "port": 1}],
+            [{"name": "A", "serialnum": "S", "server_type": "PANELTRACK", "connected_client": "Bus1", "modbus_id": 1},
+             {"name": "B", "serialnum": "S", "server_type": "PANELTRACK", "connected_client": "Bus1", "modbus_id": 2},
+             {"name": "D", "serialnum": "S", "server_type": "PANELTRACK", "connected_client": "Dead", "modbus_id": 1}],
+            app_class=AsyncApp, client_instantiator=instantiate_async_clients,
+            polling_mode="asyncio", pause_interval_seconds=0)
+
+        simulator = Simulator({PORT + 1: [1, 2]}, seed=1)
+        simulator.start_in_thread()
+        try:
+            with unittest.mock.patch.object(AsyncClient.connect, "__defaults__", (2, 0)):
+                asyncio.run(app.run(loop_count=2))
+        finally:
+            simulator.stop_thread()
+            app.mqtt_client.loop_stop()
+
+        self.assertEqual([s.name for s in app.servers], ["A", "B"])
+        self.assertEqual([s.name for s in app.disconnected_servers], ["D"])
+        published = app.mqtt_client.published
+        # read once at startup, then once per loop
+        self.assertEqual(published.count("modbus/a/va/state"), 3)
+        self.assertEqual(published.count("modbus/b/va/state"), 3)
+        self.assertIn("modbus/d/availability", published)
+
+    def test_failed_first_poll_disconnects_server(self):
+        app = make_app(
+            [{"name": "Bus1", "type": "TCP", "host": "127.0.0.1", "port": PORT + 2}],
+            [{"name": "A", "serialnum": "S", "server_type": "PANELTRACK", "connected_client": "Bus1", "modbus_id": 1},
+             {"name": "B", "serialnum": "S", "server_type": "PANELTRACK", "connected_client": "Bus1", "modbus_id": 2}],
+            app_class=AsyncApp, client_instantiator=instantiate_async_clients,
+            polling_mode="asyncio", pause_interval_seconds=0)
+        read_block_async = AsyncApp.read_block_async
+
+        async def fail_for_b(app, server, block):
+            if server.name == "B":
+                raise ModbusIOException("no response")
+            return await read_block_async(app, server, block)
+
+        simulator = Simulator({PORT + 2: [1, 2]}, seed=1)
+        simulator.start_in_thread()
+        try:
+            with unittest.mock.patch.object(AsyncApp, "read_block_async", fail_for_b):
+                asyncio.run(app.run(loop_count=2))
+        finally:
+            simulator.stop_thread()
+            app.mqtt_client.loop_stop()
+
+        self.assertEqual([s.name for s in app.servers], ["A"])
+        self.assertEqual([s.name for s in app.disconnected_servers], ["B"])
+        self.assertEqual(app.mqtt_client.published.count("modbus/a/va/state"), 3)
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,42 @@
+import unittest
+from src.circuit_breaker import BreakerState, CircuitBreaker
+
+
+class TestCircuitBreaker(unittest.TestCase):
+    def setUp(self):
+        self.now = 0.0
+        self.breaker = CircuitBreaker(10, 60, jitter=0, clock=lambda: self.now)
+
+    def test_exponential_backoff(self):
+        backoffs = []
+        for _ in range(5):
+            self.breaker.record_failure()
+            backoffs.append(self.breaker.next_probe - self.now)
+        self.assertEqual(backoffs, [10, 20, 40, 60, 60])
+
+    def test_probe_due_after_backoff(self):
+        self.assertFalse(self.breaker.probe_due())
+        self.breaker.record_failure()
+        self.now = 9.9
+        self.assertFalse(self.breaker.probe_due())
+        self.now = 10
+        self.assertTrue(self.breaker.probe_due())
+        self.breaker.start_probe()
+        self.assertFalse(self.breaker.probe_due())
+
+    def test_success_resets(self):
+        self.breaker.record_failure()
+        self.breaker.record_failure()
+        self.breaker.record_success()
+        self.assertEqual(self.breaker.state, BreakerState.CLOSED)
+        self.breaker.record_failure()
+        self.assertEqual(self.breaker.next_probe - self.now, 10)
+
+    def test_jitter_bounds(self):
+        breaker = CircuitBreaker(10, 60, jitter=0.2, clock=lambda: 0.0, rng=lambda: 1.0)
+        breaker.record_failure()
+        self.assertAlmostEqual(breaker.next_probe, 12)
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,38 @@
+import unittest
+from src.codec import get_codec, registers_to_bytes
+from src.enums import DataType, WordOrder
+
+
+class TestCodec(unittest.TestCase):
+    def test_round_trip_all_types(self):
+        values = {DataType.U16: 65535, DataType.I16: -2, DataType.U32: 4294967295, DataType.I32: -5,
+                  DataType.U64: 2**64 - 1, DataType.I64: -2**63, DataType.F32: 1.5, DataType.F64: -1e100}
+        for dtype, value in values.items():
+            for word_order in WordOrder:
+                codec = get_codec(dtype, word_order)
+                registers = codec.encode(value)
+                self.assertEqual(len(registers), dtype.size // 2)
+                self.assertEqual(codec.decode(registers), value, (dtype, word_order))
+
+    def test_i32_is_signed(self):
+        self.assertEqual(get_codec(DataType.I32).decode([0xFFFF, 0xFFFE]), -2)
+        self.assertEqual(get_codec(DataType.U32).decode([0xFFFF, 0xFFFE]), 0xFFFFFFFE)
+
+    def test_word_order(self):
+        self.assertEqual(get_codec(DataType.U32, WordOrder.BIG).decode([1, 2]), 0x00010002)
+        self.assertEqual(get_codec(DataType.U32, WordOrder.LITTLE).decode([1, 2]), 0x00020001)
+
+    def test_decode_from_block(self):
+        registers = [0] + get_codec(DataType.F32).encode(230.5) + get_codec(DataType.I16).encode(-7)
+        buffer = registers_to_bytes(registers)
+        self.assertEqual(get_codec(DataType.F32).decode_from(buffer, 2), 230.5)
+        self.assertEqual(get_codec(DataType.I16).decode_from(buffer, 6), -7)
+
+    def test_utf8(self):
+        codec = get_codec(DataType.UTF8, count=4)
+        self.assertEqual(codec.decode(codec.encode("PT5")), "PT5")
+        self.assertEqual(len(codec.encode("PT5")), 4)
+
+
+if __name__ == "__main__":
+    unittest.main()
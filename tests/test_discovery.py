@@ -0,0 +1,59 @@
+import json
+import os
+import tempfile
+import unittest
+import paho.mqtt.client as mqtt
+from src.discovery_cache import DiscoveryCache
+from src.implemented_servers import PanelTrack
+from src.loader import load_options
+from tests.helpers import RecordingMqttClient
+
+
+class TestDeviceDiscovery(unittest.TestCase):
+    def setUp(self):
+        self.tmp = tempfile.TemporaryDirectory()
+        self.options = load_options("config.yaml")
+        self.options.mqtt_device_discovery = True
+        self.options.discovery_cache_path = os.path.join(self.tmp.name, "discovery.json")
+        self.server = PanelTrack("Meter 1", "SN1", 1, None)
+
+    def tearDown(self):
+        self.tmp.cleanup()
+
+    def test_single_message_with_components(self):
+        client = RecordingMqttClient(self.options)
+        client.publish_discovery_topics(self.server)
+        configs = [(t, p) for t, p in client.messages if t.endswith("/config") and p]
+        self.assertEqual(len(configs), 1)
+        topic, payload = configs[0]
+        self.assertTrue(topic.endswith("/device/meter_1/config"))
+        components = json.loads(payload)["components"]
+        self.assertEqual(len(components), len(self.server.parameters))
+        self.assertTrue(all(c["platform"] == "sensor" for c in components.values()))
+
+    def test_unchanged_discovery_not_resent(self):
+        RecordingMqttClient(self.options).publish_discovery_topics(self.server)
+        client = RecordingMqttClient(self.options)     # as after a restart
+        client.publish_discovery_topics(self.server)
+        self.assertFalse([t for t, _ in client.messages if t.endswith("/config")])
+
+        self.options.mqtt_aggregate_state = True
+        client = RecordingMqttClient(self.options)
+        client.publish_discovery_topics(self.server)
+        self.assertTrue([t for t, _ in client.messages if t.endswith("/device/meter_1/config")])
+
+    def test_undelivered_discovery_resent(self):
+        RecordingMqttClient(self.options, rc=mqtt.MQTT_ERR_NO_CONN).publish_discovery_topics(self.server)
+        client = RecordingMqttClient(self.options)
+        client.publish_discovery_topics(self.server)
+        self.assertTrue([t for t, _ in client.messages if t.endswith("/device/meter_1/config")])
+
+    def test_cache_survives_unreadable_file(self):
+        with open(self.options.discovery_cache_path, "w") as f:
+            f.write("{")
+        cache = DiscoveryCache(self.options.discovery_cache_path)
+        self.assertTrue(cache.changed("meter_1", [("t", "p")]))
+
+
+if __name__ == "__main__":
+    unittest.main()
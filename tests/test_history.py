@@ -0,0 +1,50 @@
+import unittest
+from src.history import HOUR, MINUTE, Aggregate, HistoryStore
+
+
+class TestHistoryStore(unittest.TestCase):
+    def setUp(self):
+        self.store = HistoryStore(":memory:", raw_retention_days=1, minute_retention_days=2, hour_retention_days=30)
+
+    def tearDown(self):
+        self.store.close()
+
+    def test_flush_writes_staged_readings(self):
+        self.store.record("Meter 1", {"voltage": 230.0, "model": "PT-300"}, timestamp=120.0)
+        self.assertEqual(len(self.store), 1)
+        self.assertEqual(self.store.flush(), 1)
+        self.assertEqual(len(self.store), 0)
+        self.assertEqual(self.store.flush(), 0)
+
+    def test_rollups_merge_across_flushes(self):
+        self.store.record("Meter 1", {"voltage": 230.0}, timestamp=120.0)
+        self.store.record("Meter 1", {"voltage": 232.0}, timestamp=150.0)
+        self.store.flush()
+        self.store.record("Meter 1", {"voltage": 228.0}, timestamp=170.0)
+        self.store.record("Meter 1", {"voltage": 240.0}, timestamp=190.0)
+        self.store.record("Meter 2", {"voltage": 100.0}, timestamp=130.0)
+        self.store.flush()
+
+        minutes = self.store.query("Meter 1", 0, 300, resolution=MINUTE)
+        self.assertEqual(minutes, {"voltage": [Aggregate(120, 228.0, 232.0, 230.0, 3),
+                                               Aggregate(180, 240.0, 240.0, 240.0, 1)]})
+        hours = self.store.query("Meter 1", 0, HOUR, resolution=HOUR)
+        self.assertEqual(hours, {"voltage": [Aggregate(0, 228.0, 240.0, 232.5, 4)]})
+
+    def test_query_range_and_parameters(self):
+        self.store.record("Meter 1", {"voltage": 230.0, "current": 5.0}, timestamp=60.0)
+        self.store.record("Meter 1", {"voltage": 231.0, "current": 6.0}, timestamp=600.0)
+        self.store.flush()
+        series = self.store.query("Meter 1", 300, 900, resolution=MINUTE, parameters=["voltage"])
+        self.assertEqual(series, {"voltage": [Aggregate(600, 231.0, 231.0, 231.0, 1)]})
+        with self.assertRaises(ValueError):
+            self.store.query("Meter 1", 0, 900, resolution=10)
+
+    def test_expire(self):
+        day = 86400
+        self.store.record("Meter 1", {"voltage": 230.0}, timestamp=0.0)
+        self.store.record("Meter 1", {"voltage": 231.0}, timestamp=3 * day)
+        self.store.flush()
+        self.store.expire(now=3 * day + 1)
+        self.assertEqual(len(self.store.query("Meter 1", 0, 4 * day, resolution=MINUTE)["voltage"]), 1)
+        self.assertEqual(len(self.store.query("Meter 1", 0, 4 * day, resolution=HOUR)["voltage"]), 2)
@@ -0,0 +1,61 @@
+import unittest
+from src.metrics import Histogram, Metrics, diagnostics, _bucket, _bucket_bounds, BUCKETS
+
+
+class TestHistogram(unittest.TestCase):
+    def test_buckets_contiguous(self):
+        for i in range(1, BUCKETS):
+            self.assertEqual(_bucket_bounds(i - 1)[1], _bucket_bounds(i)[0])
+        for us in (0, 31, 32, 63, 64, 1000, 123456, 2**39):
+            lower, upper = _bucket_bounds(_bucket(us))
+            self.assertTrue(lower <= us < upper)
+
+    def test_percentiles_within_precision(self):
+        histogram = Histogram()
+        for ms in range(1, 1001):
+            histogram.record(ms / 1000)
+        self.assertEqual(histogram.count, 1000)
+        self.assertAlmostEqual(histogram.percentile(0.5), 0.5, delta=0.5 * 0.04)
+        self.assertAlmostEqual(histogram.percentile(0.99), 0.99, delta=0.99 * 0.04)
+        self.assertEqual(histogram.percentile(1), 1)
+        self.assertIsNone(Histogram().percentile(0.5))
+
+    def test_cumulative_counts(self):
+        histogram = Histogram()
+        for seconds in (0.001, 0.002, 0.05, 2):
+            histogram.record(seconds)
+        self.assertEqual(histogram.cumulative_counts([0.01, 0.1, 1, 10]), [2, 3, 3, 4])
+
+
+class TestMetrics(unittest.TestCase):
+    def test_diagnostics(self):
+        metrics = Metrics()
+        for _ in range(10):
+            metrics.observe("modbus_read_seconds", 0.01, client="Client1")
+            metrics.observe("server_read_seconds", 0.01, server="fast")
+            metrics.observe("server_read_seconds", 0.2, server="slow")
+        metrics.inc("modbus_errors_total", client="Client1", code=2)
+        metrics.inc("modbus_errors_total", client="Client1", code="timeout")
+        metrics.set("bus_utilization", 0.5, client="Client1")
+        metrics.observe("cycle_seconds", 1.5)
+
+        summary = diagnostics(metrics)
+        self.assertEqual(summary["reads"], 10)
+        self.assertEqual(summary["read_errors"], 2)
+        self.assertEqual(summary["clients"]["Client1"]["utilization"], 50)
+        self.assertEqual(summary["slowest_server"], "slow")
+        self.assertAlmostEqual(summary["cycle_p50"], 1.5)
+
+    def test_diagnostics_lists_bus_without_reads(self):
+        metrics = Metrics()
+        metrics.observe("modbus_read_seconds", 0.01, client="Client1")
+        metrics.inc("modbus_errors_total", 3, client="Dead", code="timeout")
+
+        summary = diagnostics(metrics)
+        self.assertEqual(summary["clients"]["Dead"], {"read_p99_ms": None, "utilization": 0, "errors": 3, "reads": 0})
+        self.assertEqual(summary["read_errors"], 3)
+        self.assertEqual(summary["reads"], 1)
+
+
+if __name__ == "__main__":
+    unittest.main()
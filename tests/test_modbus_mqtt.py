@@ -0,0 +1,109 @@
+import json
+import re
+import unittest
+import src.app as app
+from src.client import SpoofClient
+from src.helpers import slugify
+from src.implemented_servers import PanelTrack
+from src.loader import load_options
+from tests.helpers import RecordingMqttClient
+
+
+def uncached_discovery(client, server) -> list[tuple[str, dict]]:
+    """ Discovery payloads as built on every call before topics were cached """
+    nickname = slugify(server.name)
+    device = {"manufacturer": server.manufacturer, "model": server.model,
+              "identifiers": [f"{server.name}"], "name": f"{nickname}"}
+    discovery = []
+    for register_name, details in server.parameters.items():
+        payload = {
+            "name": register_name,
+            "unique_id": f"{nickname}_{slugify(register_name)}",
+            "state_topic": f"{client.base_topic}/{nickname}/{slugify(register_name)}/state",
+            "device": device,
+            "device_class": details["device_class"].value,
+            "unit_of_measurement": details["unit"],
+        }
+        if client.aggregate_state:
+            payload["state_topic"] = f"{client.base_topic}/{nickname}/state"
+            payload["value_template"] = f"{{{{ value_json['{slugify(register_name)}'] }}}}"
+        payload.update(client._availability_block(server))
+        if details.get("state_class", False):
+            payload["state_class"] = details["state_class"]
+        discovery.append((f"{client.ha_discovery_topic}/sensor/{nickname}/{slugify(register_name)}/config", payload))
+    return discovery
+
+
+class TestAggregatedState(unittest.TestCase):
+    def setUp(self):
+        self.options = load_options("config.yaml")
+        self.options.mqtt_aggregate_state = True
+        self.client = RecordingMqttClient(self.options)
+        self.server = PanelTrack("Meter 1", "SN1", 1, None)
+        self.values = {name: float(i) for i, name in enumerate(self.server.parameters)}
+
+    def test_single_json_message_per_read(self):
+        self.client.publish_state(self.server, self.values)
+        self.client.publish_state(self.server, self.values)
+        self.assertEqual([t for t, _ in self.client.messages], ["modbus/meter_1/state"] * 2)
+        state = json.loads(self.client.messages[0][1])
+        self.assertEqual(len(state), len(self.server.parameters))
+
+    def test_partial_read_keeps_other_keys(self):
+        self.client.publish_state(self.server, self.values)
+        self.client.publish_state(self.server, {"Va": 231.5})
+        state = json.loads(self.client.messages[-1][1])
+        self.assertEqual(state["va"], 231.5)
+        self.assertEqual(len(state), len(self.server.parameters))
+
+    def test_discovery_value_templates_match_state_keys(self):
+        self.client.publish_discovery_topics(self.server)
+        self.client.publish_state(self.server, self.values)
+        state = json.loads(self.client.messages[-1][1])
+
+        configs = [json.loads(p) for t, p in self.client.messages if t.endswith("/config")]
+        self.assertEqual(len(configs), len(self.server.parameters))
+        for config in configs:
+            self.assertEqual(config["state_topic"], "modbus/meter_1/state")
+            key, = re.fullmatch(r"\{\{ value_json\['(\w+)'\] \}\}", config["value_template"]).groups()
+            self.assertEqual(state[key], self.values[config["name"]])
+
+
+class TestTopicCache(unittest.TestCase):
+    def setUp(self):
+        self.options = load_options("config.yaml")
+        self.server = PanelTrack("Meter 1", "SN1", 1, None)
+
+    def test_cached_topics_match_uncached(self):
+        for aggregate_state in (False, True):
+            self.options.mqtt_aggregate_state = aggregate_state
+            client = RecordingMqttClient(self.options)
+            topics = client.topics(self.server)
+            self.assertIs(client.topics(self.server), topics)
+            self.assertEqual([(t, json.loads(p)) for t, p in topics.discovery], uncached_discovery(client, self.server))
+            self.assertEqual(topics.availability_topic, "modbus/meter_1/availability")
+            for name, parameter in topics.parameters.items():
+                self.assertEqual(parameter.state_topic, f"modbus/meter_1/{slugify(name)}/state")
+
+    def test_mark_reconnected_rebuilds(self):
+        modbus_app = app.App(
+            client_instantiator_callback=lambda options: [SpoofClient("Client1"), SpoofClient("Client2")],
+            server_instantiator_callback=app.instantiate_servers,
+            options_rel_path="config.yaml"
+        )
+        modbus_app.midnight_sleep_enabled = False
+        modbus_app.setup()
+        modbus_app.mqtt_client = RecordingMqttClient(modbus_app.OPTIONS)
+        server = modbus_app.servers[0]
+        self.assertIn("Va", modbus_app.mqtt_client.topics(server).parameters)
+
+        modbus_app.servers, modbus_app.disconnected_servers = [], [server]
+        # as for a different model behind the same address. The class-level dict is shared, so copy it
+        server._parameters = {name: p for name, p in server.parameters.items() if name != "Va"}
+        modbus_app.mark_reconnected(server)
+        self.assertNotIn("Va", modbus_app.mqtt_client.topics(server).parameters)
+        self.assertEqual(modbus_app.servers, [server])
+
+
+if __name__ == "__main__":
+    unittest.main()
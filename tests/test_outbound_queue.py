@@ -0,0 +1,89 @@
+import threading
+import time
+import unittest
+import paho.mqtt.client as mqtt
+from src.loader import load_options
+from src.modbus_mqtt import MqttClient
+from src.outbound_queue import OutboundDispatcher, OutboundQueue
+
+
+class TestOutboundQueue(unittest.TestCase):
+    def test_drop_oldest_keeps_latest_per_topic(self):
+        queue = OutboundQueue(3)
+        for topic, value in [("a", 1), ("b", 1), ("c", 1), ("b", 2), ("d", 1)]:
+            queue.put(topic, value)
+        self.assertEqual(queue.dropped, 2)
+        # b's older value made room for its newer one, then the oldest message (a) for d
+        self.assertEqual([queue.get(0) for _ in range(3)],
+                         [("c", 1, 0, False), ("b", 2, 0, False), ("d", 1, 0, False)])
+        self.assertIsNone(queue.get(0))
+
+    def test_coalesce_keeps_place_in_line(self):
+        queue = OutboundQueue(10, coalesce=True)
+        for topic, value in [("a", 1), ("b", 1), ("a", 2), ("a", 3)]:
+            queue.put(topic, value)
+        self.assertEqual(queue.coalesced, 2)
+        self.assertEqual([queue.get(0)[:2] for _ in range(len(queue))], [("a", 3), ("b", 1)])
+
+    def test_drop_new(self):
+        queue = OutboundQueue(2, "drop_new")
+        self.assertTrue(queue.put("a", 1))
+        self.assertTrue(queue.put("b", 1))
+        self.assertFalse(queue.put("a", 2))
+        self.assertEqual([queue.get(0).payload for _ in range(2)], [1, 1])
+
+    def test_block_waits_for_room(self):
+        queue = OutboundQueue(1, "block")
+        queue.put("a", 1)
+        writer = threading.Thread(target=queue.put, args=("a", 2))
+        writer.start()
+        writer.join(0.05)
+        self.assertTrue(writer.is_alive())
+        self.assertEqual(queue.get(0).payload, 1)
+        writer.join(1)
+        self.assertEqual(queue.get(0).payload, 2)
+
+    def test_unknown_policy(self):
+        with self.assertRaises(ValueError):
+            OutboundQueue(1, "drop_all")
+
+    def test_dispatcher_respects_inflight(self):
+        queue = OutboundQueue(10)
+        inflight = []
+        dispatcher = OutboundDispatcher(queue, inflight.append, lambda: len(inflight) < 2)
+        for i in range(4):
+            queue.put(f"t{i}", i)
+        dispatcher.start()
+        time.sleep(0.1)
+        self.assertEqual(len(inflight), 2)
+        self.assertEqual(len(queue), 2)
+        inflight.clear()
+        dispatcher.acknowledged()
+        time.sleep(0.1)
+        dispatcher.stop()
+        self.assertEqual([m.topic for m in inflight], ["t2", "t3"])
+
+
+class TestPahoCoalescing(unittest.TestCase):
+    def setUp(self):
+        # never connected, so paho keeps every QoS 1 message unsent
+        self.client = MqttClient(load_options("config.yaml"))
+
+    def pending(self):
+        return [(m.topic, m.payload) for m in self.client._out_messages.values()]
+
+    def test_unsent_message_takes_newest_payload(self):
+        self.client.publish_queued("modbus/meter_1/va/state", 230.1)
+        self.client.publish_queued("modbus/meter_1/vb/state", 231.0)
+        self.client.publish_queued("modbus/meter_1/va/state", 230.4)
+        self.assertEqual(self.pending(), [("modbus/meter_1/va/state", b"230.4"), ("modbus/meter_1/vb/state", b"231.0")])
+
+    def test_sent_message_not_rewritten(self):
+        self.client.publish_queued("modbus/meter_1/va/state", 230.1)
+        next(iter(self.client._out_messages.values())).state = mqtt.mqtt_ms_wait_for_puback
+        self.client.publish_queued("modbus/meter_1/va/state", 230.4)
+        self.assertEqual(self.pending(), [("modbus/meter_1/va/state", b"230.1"), ("modbus/meter_1/va/state", b"230.4")])
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,42 @@
+import unittest
+import urllib.error
+import urllib.request
+from src.metrics import Metrics
+from src.prometheus import MetricsServer, render
+
+
+class TestPrometheus(unittest.TestCase):
+    def setUp(self):
+        self.metrics = Metrics()
+        self.metrics.observe("modbus_read_seconds", 0.003, client="Client1")
+        self.metrics.observe("modbus_read_seconds", 0.2, client="Client1")
+        self.metrics.inc("modbus_errors_total", client="Client1", code=2)
+        self.metrics.set("bus_utilization", 0.25, client="Client1")
+
+    def test_render(self):
+        text = render(self.metrics, {"server_up": {(("server", 'PT "5"'),): 1}})
+        self.assertIn("# TYPE modbus_errors_total counter", text)
+        self.assertIn('modbus_errors_total{client="Client1",code="2"} 1', text)
+        self.assertIn('bus_utilization{client="Client1"} 0.25', text)
+        self.assertIn('server_up{server="PT \\"5\\""} 1', text)
+        self.assertIn('modbus_read_seconds_bucket{client="Client1",le="0.005"} 1', text)
+        self.assertIn('modbus_read_seconds_bucket{client="Client1",le="0.25"} 2', text)
+        self.assertIn('modbus_read_seconds_bucket{client="Client1",le="+Inf"} 2', text)
+        self.assertIn('modbus_read_seconds_count{client="Client1"} 2', text)
+
+    def test_http_get(self):
+        server = MetricsServer(0, lambda: {"mqtt_outbound_queue_depth": {(): 3}}, self.metrics, host="127.0.0.1")
+        server.start()
+        try:
+            with urllib.request.urlopen(f"http://127.0.0.1:{server.port}/metrics", timeout=5) as response:
+                self.assertEqual(response.status, 200)
+                body = response.read().decode()
+            self.assertIn("mqtt_outbound_queue_depth 3", body)
+            with self.assertRaises(urllib.error.HTTPError):
+                urllib.request.urlopen(f"http://127.0.0.1:{server.port}/other", timeout=5)
+        finally:
+            server.stop()
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,51 @@
+import unittest
+from src.enums import DeviceClass
+from src.publish_filter import Deadband, PublishFilter
+
+
+class TestPublishFilter(unittest.TestCase):
+    def setUp(self):
+        self.now = 0.0
+        self.filter = PublishFilter({DeviceClass.VOLTAGE: Deadband(absolute=1),
+                                     DeviceClass.POWER: Deadband(relative=0.05)},
+                                    max_age=60, clock=lambda: self.now)
+
+    def publish(self, value, device_class=DeviceClass.VOLTAGE, state_class=None):
+        return self.filter.should_publish("pt", "param", value, device_class, state_class)
+
+    def test_absolute_deadband(self):
+        self.assertTrue(self.publish(230))
+        self.assertFalse(self.publish(230.5))
+        self.assertFalse(self.publish(229))
+        self.assertTrue(self.publish(231.5))
+
+    def test_relative_deadband(self):
+        self.assertTrue(self.publish(1000, DeviceClass.POWER))
+        self.assertFalse(self.publish(1040, DeviceClass.POWER))
+        self.assertTrue(self.publish(1060, DeviceClass.POWER))
+
+    def test_max_age_heartbeat(self):
+        self.assertTrue(self.publish(230))
+        self.now = 59
+        self.assertFalse(self.publish(230))
+        self.now = 60
+        self.assertTrue(self.publish(230))
+
+    def test_counters_publish_on_any_change(self):
+        self.assertTrue(self.publish(100.0, DeviceClass.ENERGY, "total_increasing"))
+        self.assertFalse(self.publish(100.0, DeviceClass.ENERGY, "total_increasing"))
+        self.assertTrue(self.publish(100.1, DeviceClass.ENERGY, "total_increasing"))
+
+    def test_no_deadband_publishes_changes(self):
+        self.assertTrue(self.publish(50.0, DeviceClass.FREQUENCY))
+        self.assertFalse(self.publish(50.0, DeviceClass.FREQUENCY))
+        self.assertTrue(self.publish(50.1, DeviceClass.FREQUENCY))
+
+    def test_forget(self):
+        self.assertTrue(self.publish(230))
+        self.filter.forget("pt")
+        self.assertTrue(self.publish(230))
+
+
+if __name__ == "__main__":
+    unittest.main()
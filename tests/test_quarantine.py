@@ -0,0 +1,55 @@
+import unittest
+from pymodbus.pdu import ExceptionResponse
+from src.client import SpoofClient
+from src.implemented_servers import PanelTrack
+from src.quarantine import Quarantine
+
+
+class MissingRegistersClient(SpoofClient):
+    """ Rejects any read touching one of the missing addresses with Illegal Data Address """
+    def __init__(self, name, missing):
+        super().__init__(name)
+        self.missing = set(missing)
+        self.reads = 0
+
+    def read(self, address, count, slave_id, register_type):
+        self.reads += 1
+        if self.missing & set(range(address, address + count)):
+            return ExceptionResponse(3, 2)
+        return super().read(address, count, slave_id, register_type)
+
+    def _handle_error_response(self, result):
+        pass
+
+
+class TestQuarantine(unittest.TestCase):
+    def setUp(self):
+        self.missing = PanelTrack.register_map['Ib']['addr']
+        self.client = MissingRegistersClient("Client1", [self.missing])
+        self.server = PanelTrack("pt", "serial", 1, self.client)
+        self.now = 0
+        self.server.quarantine = Quarantine(600, clock=lambda: self.now)
+
+    def test_bad_register_quarantined_rest_read(self):
+        values = self.server.read_all()
+        self.assertNotIn('Ib', values)
+        self.assertEqual(len(values), len(PanelTrack.register_map) - 1)
+        self.assertIn('Ib', self.server.quarantine)
+
+        # next cycle reads around the quarantined register without bisecting again
+        self.client.reads = 0
+        self.assertEqual(len(self.server.read_all()), len(PanelTrack.register_map) - 1)
+        self.assertEqual(self.client.reads, len(self.server.read_blocks))
+
+    def test_quarantined_register_retried_and_released(self):
+        self.server.read_all()
+        self.now = 601
+        self.client.missing.clear()
+        values = self.server.read_all()
+        self.assertIn('Ib', values)
+        self.assertNotIn('Ib', self.server.quarantine)
+        self.assertEqual(len(self.server.read_all()), len(PanelTrack.register_map))
+
+
+if __name__ == "__main__":
+    unittest.main()
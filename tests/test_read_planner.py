@@ -0,0 +1,85 @@
+import unittest
+from src.enums import RegisterTypes, DataType, DeviceClass
+from src.read_planner import plan_blocks
+from src.implemented_servers import PanelTrack
+from src.client import SpoofClient
+from src.codec import get_codec
+from src.enums import WordOrder
+from src.register_table import RegisterTable
+from src.read_planner import split_block
+
+
+def param(addr, count=2, register_type=RegisterTypes.HOLDING_REGISTER):
+    return {'addr': addr, 'count': count, 'dtype': DataType.F32, 'multiplier': 1, 'unit': 'V',
+            'device_class': DeviceClass.VOLTAGE, 'register_type': register_type}
+
+
+class TestReadPlanner(unittest.TestCase):
+    def test_paneltrack_single_block(self):
+        blocks = plan_blocks(PanelTrack.register_map)
+        self.assertEqual(len(blocks), 1)
+        self.assertEqual((blocks[0].address, blocks[0].count), (1, 60))
+        self.assertEqual(len(blocks[0].parameter_names), 30)
+
+    def test_gap_tolerance(self):
+        params = {'a': param(1), 'b': param(5)}
+        self.assertEqual(len(plan_blocks(params)), 2)
+
+        blocks = plan_blocks(params, max_gap=2)
+        self.assertEqual(len(blocks), 1)
+        self.assertEqual((blocks[0].address, blocks[0].count), (1, 6))
+
+    def test_register_types_not_mixed(self):
+        params = {'a': param(1), 'b': param(3, register_type=RegisterTypes.INPUT_REGISTER)}
+        blocks = plan_blocks(params)
+        self.assertEqual(len(blocks), 2)
+        self.assertEqual({b.register_type for b in blocks},
+                         {RegisterTypes.HOLDING_REGISTER, RegisterTypes.INPUT_REGISTER})
+
+    def test_pdu_limit(self):
+        params = {f'p{i}': param(1 + 2 * i) for i in range(100)}
+        blocks = plan_blocks(params)
+        self.assertEqual([b.count for b in blocks], [124, 76])
+        self.assertTrue(all(b.count <= 125 for b in blocks))
+
+    def test_oversized_parameter_raises(self):
+        with self.assertRaises(ValueError):
+            plan_blocks({'a': param(1, count=126)})
+
+    def test_read_all_matches_read_registers(self):
+        server = PanelTrack("pt", "serial", 1, SpoofClient("Client1"))
+        values = server.read_all()
+        self.assertEqual(list(values), list(PanelTrack.register_map))
+        for name, value in values.items():
+            self.assertEqual(value, server.read_registers(name))
+
+    def test_compiled_block_with_gap(self):
+        params = {'a': param(1), 'b': dict(param(5), dtype=DataType.I32, multiplier=10),
+                  'c': dict(param(7, count=1), dtype=DataType.U16, device_class=DeviceClass.POWER)}
+        table = RegisterTable(params)
+        block = plan_blocks(params, max_gap=2)[0]
+        layout = table.compile_block(block)
+        self.assertEqual(layout.struct.format, '>f4xiH')
+
+        registers = get_codec(DataType.F32).encode(1.5) + [0, 0] + get_codec(DataType.I32).encode(-3) + [7]
+        self.assertEqual(layout.decode(registers), {'a': 2, 'b': -30, 'c': 7})
+
+    def test_little_word_order_falls_back_per_parameter(self):
+        params = {'a': dict(param(1), word_order=WordOrder.LITTLE), 'b': param(3)}
+        layout = RegisterTable(params).compile_block(plan_blocks(params)[0])
+        self.assertIsNone(layout.struct)
+
+        registers = get_codec(DataType.F32, WordOrder.LITTLE).encode(231.0) + get_codec(DataType.F32).encode(229.0)
+        self.assertEqual(layout.decode(registers), {'a': 231, 'b': 229})
+
+    def test_split_block_at_parameter_boundary(self):
+        params = {'a': param(1), 'b': param(3), 'c': param(7, count=1)}
+        first, second = split_block(plan_blocks(params, max_gap=2)[0], params)
+        self.assertEqual((first.address, first.count, first.parameter_names), (1, 2, ['a']))
+        self.assertEqual((second.address, second.count, second.parameter_names), (3, 5, ['b', 'c']))
+        with self.assertRaises(ValueError):
+            split_block(first, params)
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,36 @@
+import unittest
+from src.sampling import RingBuffer, SampleWindows
+
+
+class TestRingBuffer(unittest.TestCase):
+    def test_stats_of_window(self):
+        ring = RingBuffer(4)
+        self.assertIsNone(ring.stats())
+        for value in [5, 1, 3]:
+            ring.append(value)
+        self.assertEqual(ring.stats(), {"min": 1, "max": 5, "mean": 3, "last": 3, "samples": 3})
+
+    def test_overwrites_oldest(self):
+        ring = RingBuffer(3)
+        for value in range(7):
+            ring.append(value)
+        self.assertEqual(ring.window(), [4, 5, 6])
+        ring.reset()
+        ring.append(10)
+        self.assertEqual(ring.window(), [10])
+
+
+class TestSampleWindows(unittest.TestCase):
+    def test_collect_starts_new_windows(self):
+        windows = SampleWindows(10)
+        windows.record("pt", {"PSum": 100, "Ia": 1})
+        windows.record("pt", {"PSum": 300, "Ia": 2})
+        stats = windows.collect("pt", ["PSum", "Ia", "Ib"])
+        self.assertEqual(stats["PSum"]["max"], 300)
+        self.assertEqual(stats["Ia"]["mean"], 1.5)
+        self.assertNotIn("Ib", stats)
+        self.assertEqual(windows.collect("pt", ["PSum"]), {})
+
+
+if __name__ == "__main__":
+    unittest.main()
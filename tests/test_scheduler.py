@@ -0,0 +1,61 @@
+import unittest
+from src.scheduler import Scheduler, group_parameters
+from src.implemented_servers import PanelTrack
+
+
+class FakeClock:
+    def __init__(self, now=0.0):
+        self.now = now
+
+    def __call__(self):
+        return self.now
+
+    def sleep(self, seconds):
+        self.now += seconds
+
+
+class TestScheduler(unittest.TestCase):
+    def setUp(self):
+        self.clock = FakeClock(100.4)
+        self.scheduler = Scheduler(clock=self.clock, sleep=self.clock.sleep)
+
+    def test_aligned_without_drift(self):
+        runs = []
+
+        def job():
+            runs.append(self.clock.now)
+            self.clock.now += 0.3   # time spent reading
+
+        self.scheduler.add("fast", 1, job)
+        self.scheduler.run(until=lambda: len(runs) >= 5)
+        self.assertEqual(runs, [101, 102, 103, 104, 105])
+
+    def test_multiple_rates(self):
+        runs = []
+        self.scheduler.add("fast", 1, lambda: runs.append(("fast", self.clock.now)))
+        self.scheduler.add("slow", 5, lambda: runs.append(("slow", self.clock.now)))
+        self.scheduler.run(until=lambda: self.clock.now >= 110)
+        self.assertEqual([t for name, t in runs if name == "slow"], [105, 110])
+        self.assertEqual(len([t for name, t in runs if name == "fast"]), 10)
+
+    def test_overrun_reported_and_skipped(self):
+        runs = []
+
+        def slow_job():
+            runs.append(self.clock.now)
+            self.clock.now += 2.5
+
+        self.scheduler.add("slow_job", 1, slow_job)
+        self.scheduler.run(until=lambda: len(runs) >= 3)
+        self.assertEqual(runs, [101, 104, 107])
+        self.assertEqual(self.scheduler.overruns["slow_job"], 3)
+
+    def test_group_parameters(self):
+        groups = group_parameters(PanelTrack.register_map, {"TotalImportEnergy": 60, "PSum": 1}, 10)
+        self.assertEqual(groups[60], ["TotalImportEnergy"])
+        self.assertEqual(groups[1], ["PSum"])
+        self.assertEqual(len(groups[10]), 28)
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,139 @@
+import json
+import os
+import signal
+import tempfile
+import time
+import unittest
+from src.loader import load_options, read_yaml
+from src.options import ModbusTCPOptions, ServerOptions
+from src.sharding import ShmChannel, Supervisor, decode_message, encode_message, partition_clients
+from src.simulator import Simulator
+from tests.helpers import RecordingMqttClient
+
+PORT = 15096
+
+
+class TestPartition(unittest.TestCase):
+    def setUp(self):
+        self.options = load_options("config.yaml")
+        self.options.clients = [ModbusTCPOptions(f"Bus{i}", "TCP", "127.0.0.1", 502) for i in range(4)]
+        self.options.servers = [ServerOptions(f"M{i}_{j}", f"S{i}{j}", "PANELTRACK", f"Bus{i}", j + 1)
+                                for i in range(4) for j in range(i + 1)]
+
+    def test_cost_balances_servers(self):
+        partition = partition_clients(self.options, 2, "cost")
+        self.assertEqual(sorted(map(sorted, partition)), [["Bus0", "Bus3"], ["Bus1", "Bus2"]])
+
+    def test_hash_keeps_clients_in_place(self):
+        partition = partition_clients(self.options, 3, "hash")
+        self.options.clients.append(ModbusTCPOptions("Bus4", "TCP", "127.0.0.1", 502))
+        grown = partition_clients(self.options, 3, "hash")
+        for names in partition:
+            self.assertTrue(any(set(names) <= set(other) for other in grown))
+        self.assertEqual(sorted(n for names in grown for n in names), [f"Bus{i}" for i in range(5)])
+
+    def test_unknown_method(self):
+        with self.assertRaises(ValueError):
+            partition_clients(self.options, 2, "random")
+
+
+class TestShmChannel(unittest.TestCase):
+    def test_records_wrap_around(self):
+        channel = ShmChannel(64)
+        try:
+            received = []
+            for i in range(20):
+                self.assertTrue(channel.send(f"record {i}".encode(), timeout=0))
+                if i % 3 == 2:
+                    received.extend(channel.receive())
+            received.extend(channel.receive())
+            self.assertEqual(received, [f"record {i}".encode() for i in range(20)])
+        finally:
+            channel.close(unlink=True)
+
+    def test_full_channel_times_out(self):
+        channel = ShmChannel(32)
+        try:
+            self.assertTrue(channel.send(b"x" * 20, timeout=0))
+            self.assertFalse(channel.send(b"y" * 20, timeout=0.01))
+        finally:
+            channel.close(unlink=True)
+
+    def test_receive_gives_up_on_held_lock(self):
+        channel = ShmChannel(64)
+        try:
+            channel.send(b"record", timeout=0)
+            channel.lock.acquire()
+            self.assertIsNone(channel.receive(timeout=0.01))
+            channel.lock.release()
+            self.assertEqual(channel.receive(timeout=0.01), [b"record"])
+        finally:
+            channel.close(unlink=True)
+
+    def test_message_encoding(self):
+        record = encode_message("modbus/pt/psum/state", 1234.5, 1, True, False)
+        self.assertEqual(decode_message(record), ("modbus/pt/psum/state", b"1234.5", 1, True, False))
+        self.assertEqual(decode_message(encode_message("t", None, 0, False, True))[1:], (b"", 0, False, True))
+
+
+class TestSupervisor(unittest.TestCase):
+    def setUp(self):
+        self.tmp = tempfile.TemporaryDirectory()
+        raw = read_yaml("config.yaml")
+        raw.update(
+            clients=[{"name": f"Bus{i}", "type": "TCP", "host": "127.0.0.1", "port": PORT + i} for i in range(2)],
+            servers=[{"name": f"M{i}", "serialnum": "S", "server_type": "PANELTRACK", "connected_client": f"Bus{i}",
+                      "modbus_id": 1} for i in range(2)],
+            shards=2, pause_interval_seconds=1, midnight_sleep_enabled=False, reconnect_backoff_initial_seconds=0,
+            discovery_cache_path=os.path.join(self.tmp.name, "discovery.json"))
+        self.options_path = os.path.join(self.tmp.name, "options.json")
+        with open(self.options_path, "w") as f:
+            json.dump(raw, f)
+        self.simulator = Simulator({PORT: [1], PORT + 1: [1]}, seed=1)
+        self.simulator.start_in_thread()
+
+        self.supervisor = Supervisor(self.options_path)
+        self.supervisor.setup()
+        self.supervisor.mqtt_client = RecordingMqttClient(self.supervisor.OPTIONS)
+
+    def tearDown(self):
+        for shard in self.supervisor.shards:
+            if shard.process is not None:
+                shard.process.kill()
+                shard.process.join()
+                shard.channel.close(unlink=True)
+        self.simulator.stop_thread()
+        self.tmp.cleanup()
+
+    def forward_until(self, topics: set[str], timeout: float = 30) -> None:
+        deadline = time.monotonic() + timeout
+        while not topics <= set(self.supervisor.mqtt_client.published):
+            self.assertLess(time.monotonic(), deadline, f"not published: {topics - set(self.supervisor.mqtt_client.published)}")
+            for shard in self.supervisor.shards:
+                if shard.process is not None:
+                    self.supervisor.forward(shard)
+                self.supervisor.check_shard(shard)
+            time.sleep(0.01)
+
+    def test_shards_publish_and_restart_after_kill(self):
+        for shard in self.supervisor.shards:
+            self.supervisor.start_shard(shard)
+        self.forward_until({"modbus/m0/va/state", "modbus/m1/va/state"})
+
+        # killed holding its channel lock, the worker never releases it
+        shard = self.supervisor.shards[0]
+        survivor = self.supervisor.shards[1]
+        shard.channel.lock.acquire()
+        os.kill(shard.process.pid, signal.SIGKILL)
+        shard.process.join()
+        self.assertEqual(self.supervisor.forward(shard), 0)
+
+        self.supervisor.mqtt_client.messages.clear()
+        self.supervisor.check_shard(shard)
+        self.assertEqual(shard.restarts, 1)
+        self.forward_until({f"modbus/m{i}/va/state" for i in range(2)})
+        self.assertEqual(survivor.restarts, 0)
+
+
+if __name__ == "__main__":
+    unittest.main()
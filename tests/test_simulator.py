@@ -0,0 +1,107 @@
+import unittest
+import unittest.mock
+from src.simulator import FaultProfile, Simulator, parse_slave_ids, simulate_clients
+from src.implemented_servers import PanelTrack
+from src.client import Client
+from src.options import ModbusTCPOptions, ModbusRTUOptions, ServerOptions
+from src.server import ReadException
+from tests.helpers import make_app
+
+PORT = 15090
+
+
+class TestSimulator(unittest.TestCase):
+    def setUp(self):
+        self.simulator = Simulator({PORT: [1, 2]}, FaultProfile(missing=['Ib']), seed=1)
+        self.simulator.start_in_thread()
+        self.client = Client(ModbusTCPOptions("Client1", "TCP", "127.0.0.1", PORT))
+        self.client.connect()
+
+    def tearDown(self):
+        self.client.close()
+        self.simulator.stop_thread()
+
+    def test_realistic_values_and_missing_register(self):
+        server = PanelTrack("pt", "serial", 2, self.client)
+        values = server.read_all()
+        self.assertNotIn('Ib', values)
+        self.assertIn('Ib', server.quarantine)
+        self.assertTrue(220 < values['Va'] < 240)
+        self.assertTrue(380 < values['Vab'] < 420)
+        self.assertAlmostEqual(values['Freq'], 50, delta=0.5)
+        self.assertGreater(values['TotalImportEnergy'], 0)
+
+    def test_exception_code(self):
+        self.simulator.profile.exception_rate = 1
+        with self.assertRaises(ReadException) as cm:
+            PanelTrack("pt", "serial", 1, self.client).read_registers('Va')
+        self.assertEqual(cm.exception.exception_code, 6)
+
+
+class TestSimulateClients(unittest.TestCase):
+    def test_clients_pointed_at_local_ports(self):
+        opts = unittest.mock.Mock()
+        opts.clients = [ModbusTCPOptions("A", "TCP", "192.168.1.1", 502), ModbusRTUOptions("B", "RTU", "/dev/ttyUSB0", 9600, 8, False, 1)]
+        opts.servers = [ServerOptions("s1", "x", "PANELTRACK", "A", 1), ServerOptions("s2", "x", "PANELTRACK", "B", 4),
+                        ServerOptions("s3", "x", "PANELTRACK", "B", 5)]
+        self.assertEqual(simulate_clients(opts, 16000), {16000: [1], 16001: [4, 5]})
+        self.assertEqual([(c.host, c.port) for c in opts.clients], [("127.0.0.1", 16000), ("127.0.0.1", 16001)])
+
+    def test_parse_slave_ids(self):
+        self.assertEqual(parse_slave_ids("1-3,7"), [1, 2, 3, 7])
+
+
+class TestStartup(unittest.TestCase):
+    def test_unreachable_gateway_does_not_delay_other_buses(self):
+        app = make_app(
+            [{"name": "Good", "type": "TCP", "host": "127.0.0.1", "port": PORT + 1},
+             {"name": "Dead", "type": "TCP", "host": "127.0.0.1", "port": 1}],
+            [{"name": "G", "serialnum": "S", "server_type": "PANELTRACK", "connected_client": "Good", "modbus_id": 1},
+             {"name": "D", "serialnum": "S", "server_type": "PANELTRACK", "connected_client": "Dead", "modbus_id": 1}])
+
+        simulator = Simulator({PORT + 1: [1]}, seed=1)
+        simulator.start_in_thread()
+        try:
+            app.setup()
+            with unittest.mock.patch("src.client.sleep"):
+                app.connect()
+        finally:
+            for client in app.clients:
+                client.close()
+            simulator.stop_thread()
+            app.mqtt_client.loop_stop()
+
+        self.assertEqual([s.name for s in app.servers], ["G"])
+        self.assertEqual([s.name for s in app.disconnected_servers], ["D"])
+        self.assertIn("modbus/g/psum/state", app.mqtt_client.published)
+        self.assertIn("modbus/d/availability", app.mqtt_client.published)
+
+    def test_failed_first_poll_disconnects_server(self):
+        app = make_app(
+            [{"name": "Bus1", "type": "TCP", "host": "127.0.0.1", "port": PORT + 5}],
+            [{"name": "A", "serialnum": "S", "server_type": "PANELTRACK", "connected_client": "Bus1", "modbus_id": 1},
+             {"name": "B", "serialnum": "S", "server_type": "PANELTRACK", "connected_client": "Bus1", "modbus_id": 2}])
+
+        simulator = Simulator({PORT + 5: [1, 2]}, seed=1)
+        simulator.start_in_thread()
+        try:
+            app.setup()
+            app.servers[1].read_all = unittest.mock.Mock(side_effect=ReadException("no response"))
+            app.connect()
+            self.assertEqual(app.disconnect_stack, [])
+            # a further sweep must not fail on a server already moved
+            app.disconnect_stack = [app.servers[0], app.disconnected_servers[0]]
+            app.flush_disconnect_stack()
+        finally:
+            for client in app.clients:
+                client.close()
+            simulator.stop_thread()
+            app.mqtt_client.loop_stop()
+
+        self.assertEqual([s.name for s in app.servers], [])
+        self.assertEqual([s.name for s in app.disconnected_servers], ["B", "A"])
+        self.assertIn("modbus/b/availability", app.mqtt_client.published)
+
+
+if __name__ == "__main__":
+    unittest.main()
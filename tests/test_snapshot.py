@@ -0,0 +1,34 @@
+import os
+import tempfile
+import unittest
+from src.snapshot import LastValueSnapshot
+
+
+class TestLastValueSnapshot(unittest.TestCase):
+    def setUp(self):
+        self.tmp = tempfile.TemporaryDirectory()
+        self.path = os.path.join(self.tmp.name, "last_values.bin")
+
+    def tearDown(self):
+        self.tmp.cleanup()
+
+    def test_roundtrip(self):
+        snapshot = LastValueSnapshot(self.path)
+        snapshot.update("Meter 1", {"voltage_l1": 230.5, "frequency": 50, "model": "PT-300"}, timestamp=1000.0)
+        snapshot.update("Mètre 2", {"power": -12.25}, timestamp=2000.0)
+        snapshot.save()
+
+        loaded = LastValueSnapshot(self.path)
+        self.assertEqual(loaded.values, {
+            "Meter 1": {"voltage_l1": (230.5, 1000.0), "frequency": (50.0, 1000.0)},
+            "Mètre 2": {"power": (-12.25, 2000.0)},
+        })
+
+    def test_unreadable_file_ignored(self):
+        with open(self.path, "wb") as f:
+            f.write(b"LVS1\x05\x00")
+        self.assertEqual(LastValueSnapshot(self.path).values, {})
+
+    def test_decode_rejects_other_files(self):
+        with self.assertRaises(ValueError):
+            LastValueSnapshot.decode(b"{}")
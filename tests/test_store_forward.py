@@ -0,0 +1,127 @@
+import threading
+import unittest
+from types import SimpleNamespace
+import paho.mqtt.client as mqtt
+from src.loader import load_options
+from src.modbus_mqtt import MqttClient
+from src.store_forward import OutboxBuffer, OutboxDrainer
+
+
+class TestOutboxBuffer(unittest.TestCase):
+    def test_drops_oldest_beyond_capacity(self):
+        buffer = OutboxBuffer(":memory:", capacity=3)
+        for i in range(5):
+            buffer.append(f"topic/{i}", i, 0, False)
+        self.assertEqual(len(buffer), 3)
+        self.assertEqual(buffer.dropped, 2)
+        self.assertEqual([m.topic for m in buffer.peek(10)], ["topic/2", "topic/3", "topic/4"])
+
+    def test_coalesce_replaces_buffered_state(self):
+        buffer = OutboxBuffer(":memory:", capacity=10)
+        buffer.append("a/state", "1", 1, False, coalesce=True)
+        buffer.append("a/availability", "offline", 1, True, coalesce=True)
+        buffer.append("a/state", "2", 1, False, coalesce=True)
+        buffer.append("a/availability", "online", 1, True, coalesce=True)
+        buffer.append("a/state", "3", 1, False)
+        self.assertEqual(len(buffer), 4)
+        self.assertEqual([(m.topic, m.payload) for m in buffer.peek(10)], [
+            ("a/state", "2"), ("a/availability", "offline"), ("a/availability", "online"), ("a/state", "3")])
+
+    def test_drain_in_order_and_stop_on_failure(self):
+        buffer = OutboxBuffer(":memory:", capacity=100)
+        for i in range(5):
+            buffer.append("topic", str(i), 1, True)
+        sent = []
+
+        def send(message):
+            if len(sent) == 3:
+                return False
+            sent.append(message.payload)
+            return True
+
+        drainer = OutboxDrainer(buffer, send, lambda: True, threading.Lock(), rate=100)
+        self.assertEqual(drainer.drain_batch(), 3)
+        self.assertEqual(sent, ["0", "1", "2"])
+        self.assertEqual([m.payload for m in buffer.peek(10)], ["3", "4"])
+        self.assertTrue(buffer.peek(1)[0].retain)
+
+    def test_persists(self):
+        import os
+        import tempfile
+        with tempfile.TemporaryDirectory() as tmp:
+            path = os.path.join(tmp, "buffer.db")
+            buffer = OutboxBuffer(path, capacity=10)
+            buffer.append("topic", b"\x01", 0, False)
+            buffer.close()
+            self.assertEqual(len(OutboxBuffer(path, capacity=10)), 1)
+
+
+class TestStoreAndForward(unittest.TestCase):
+    def setUp(self):
+        options = load_options("config.yaml")
+        options.store_and_forward = True
+        options.buffer_path = ":memory:"
+        self.client = MqttClient(options)
+        self.connected = True
+        self.sent = []
+        self.client.is_connected = lambda: self.connected
+
+        def publish_now(topic, payload=None, qos=0, retain=False, properties=None):
+            self.sent.append((topic, payload))
+            return mqtt.MQTTMessageInfo(0)
+        self.client._publish_now = publish_now
+
+    def reconnect(self):
+        self.connected = True
+        self.client.on_connect(self.client, None, None, 0, None)
+        while self.client._drainer.drain_batch():
+            pass
+
+    def test_buffers_while_disconnected_and_forwards_in_order(self):
+        client = self.client
+        client.publish("modbus/meter_1/state", "1")
+        client.publish_availability(True, SimpleNamespace(name="Meter 1"))
+
+        self.connected = False
+        client.publish("modbus/meter_1/state", "2")
+        client.publish("modbus/meter_1/state", "3", qos=1)
+        self.assertEqual(client.buffered_messages(), 2)
+        self.assertEqual(len(self.sent), 2)
+
+        self.reconnect()
+        client.publish("modbus/meter_1/state", "4")
+        self.assertEqual(client.buffered_messages(), 0)
+        self.assertEqual(self.sent[2:], [
+            ("modbus/meter_1/state", "2"),
+            ("modbus/meter_1/state", "3"),
+            ("modbus/bridge/availability", "online"),
+            ("modbus/meter_1/availability", "online"),
+            ("modbus/meter_1/state", "4"),
+        ])
+
+    def test_state_coalesced_while_disconnected(self):
+        client = self.client
+        self.connected = False
+        for value in range(5):
+            client.publish_queued("modbus/meter_1/va/state", value)
+            client.publish_queued("modbus/meter_1/vb/state", value)
+        self.assertEqual(client.buffered_messages(), 2)
+
+        self.reconnect()
+        self.assertEqual(self.sent[:2], [("modbus/meter_1/va/state", 4), ("modbus/meter_1/vb/state", 4)])
+
+    def test_reconnect_republishes_availability(self):
+        self.client.publish_availability(True, SimpleNamespace(name="Meter 1"))
+        self.client.publish_availability(False, SimpleNamespace(name="Meter 2"))
+        self.sent.clear()
+
+        self.reconnect()
+        self.assertEqual(self.sent, [
+            ("modbus/bridge/availability", "online"),
+            ("modbus/meter_1/availability", "online"),
+            ("modbus/meter_2/availability", "offline"),
+        ])
+
+
+if __name__ == "__main__":
+    unittest.main()